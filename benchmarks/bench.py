@@ -0,0 +1,259 @@
+""" bench.py -> Benchmarks of the simulation hot paths and scaling curves, with baselines for regression comparison
+
+Run from the repository root:
+    python benchmarks/bench.py --save benchmarks/baselines/<machine>.json
+    python benchmarks/bench.py --baseline benchmarks/baselines/<machine>.json
+
+--init-data takes the directory of the init_data csv tables, an init_data bundle (see init_data_store) or 'synthetic'
+(default) for the synthetic tables of the tests (tests/synthetic.py). benchmarks/baselines/synthetic.json was recorded with
+--init-data synthetic, compare with the same inputs (timings depend on the machine).
+"""
+
+# Import packages
+import argparse
+import datetime
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT / 'src'))
+import tools as om_tools
+import occupancy_engine as om_occupancy
+import routine_engine as om_routine
+import habitual_engine as om_habitual
+import init_data_store as om_init_data_store
+from model import OccupantModel
+
+START = datetime.datetime(2019, 1, 1, 0, 0, 0)
+SAMPLING_TIME = 5 # minutes
+STEPS_PER_DAY = 288
+
+def load_init_data(source):
+    """ init_data from a directory of csv tables, an init_data bundle or 'synthetic' """
+    if source == 'synthetic':
+        sys.path.append(str(ROOT / 'tests'))
+        import synthetic
+        return synthetic.make_init_data()
+    path = pathlib.Path(source)
+    if path.is_file():
+        return om_init_data_store.load_init_data(path)
+    init_data = {file.stem: pd.read_csv(file) for file in sorted(path.glob('*.csv'))}
+    missing = [name for name in ['occ_tm_wd', 'occ_tm_we'] if name not in init_data]
+    if missing:
+        raise SystemExit(f"No init_data tables {missing} in {source}: pass --init-data with the directory of the csv tables, "
+                         "an init_data bundle or 'synthetic'")
+    return init_data
+
+def load_inputs(init_data_source, env_path):
+    """ Read the init_data and the DyD sample used by every benchmark """
+    init_data = load_init_data(init_data_source)
+    env = pd.read_hdf(env_path)
+    return init_data, env
+
+def tile_env(env, periods):
+    """ Repeat the DyD sample to cover periods timesteps """
+    rows = np.resize(np.arange(len(env)), periods)
+    return env.iloc[rows].reset_index(drop=True)
+
+def make_model(init_data, N_homes=1, N_occupants_in_home=1, backend='population', theory='tft'):
+    return OccupantModel(units='F', N_homes=N_homes, N_occupants_in_home=N_occupants_in_home, sampling_frequency=SAMPLING_TIME,
+                         models={'model_classification':None, 'model_regressor':None}, init_data=init_data,
+                         comfort_temperature=70, discomfort_theory_name=theory, threshold={'UL':3, 'LL':-3},
+                         TFT_alpha=1, TFT_beta=1, start_datetime=START, tstat_db=0, backend=backend, rng=np.random.default_rng(0))
+
+def timed(function, repeat=5, number=1):
+    """ Best time (seconds) of a call of function over repeat rounds of number calls """
+    times = []
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - tic)/number)
+    return min(times)
+
+def habitual_tm_2nd_order(TM):
+    """ 2nd order transition matrices for every label, built from the 1st order TM_habitual.csv (same for both previous states) """
+    TM_2 = pd.concat([TM.assign(prev_state=prev_state) for prev_state in [0, 1]]).rename(columns={'time':'timestep'})
+    TM_2 = TM_2[['timestep', 'prev_state', 'cur_state', 'p_2_0', 'p_2_1']]
+    return {label: TM_2 for label in ['cool_wd', 'cool_we', 'heat_wd', 'heat_we']}
+
+def bench_hot_paths(init_data, env, repeat):
+    """ Time of the individual model functions (seconds per call)
+    - tools functions (Markov_occupancy_model, realize_routine_msc, Markov_habitual_model, Markov_2nd_order_habitual_model):
+      the public API, the routine and habitual ones compile their models on the first (untimed) call
+    - compiled samplers the model uses (OccupancyEngine.sample, realize_tables_msc, HabitualEngine.sample), compiled once
+      with the uniforms of a day drawn outside of the timed calls, as in the model
+    """
+    rng = np.random.default_rng(0)
+    TM = pd.read_csv(ROOT / 'input_data' / 'TM_habitual.csv')
+    TM_2 = habitual_tm_2nd_order(TM)
+    occupancy_engine = om_occupancy.OccupancyEngine(init_data=init_data, sampling_time=SAMPLING_TIME)
+    routine_tables = om_routine.RoutineTables(init_data, om_tools.get_season(START) + '_wd')
+    habitual_engine = om_habitual.HabitualEngine(TM, SAMPLING_TIME, order=1)
+    habitual_engine_2 = om_habitual.HabitualEngine(TM_2, SAMPLING_TIME, order=2)
+    # Uniforms of a day, drawn outside of the timed calls
+    occupancy_uniforms = occupancy_engine.draw_uniforms(rng=rng)
+    habitual_uniforms = habitual_engine.draw_uniforms(rng=rng)
+    habitual_uniforms_2 = habitual_engine_2.draw_uniforms(rng=rng)
+    occupancy = occupancy_engine.sample(False, occupancy_uniforms)
+    occupancy_schedule = om_occupancy.occupancy_frame(occupancy, START, SAMPLING_TIME)
+
+    # A single Occupant.step (agents backend), after the day's schedules were generated
+    model = make_model(init_data, backend='agents')
+    ip_data_env = {'DateTime':START, 'T_in':float(env['T_ctrl'][0]), 'T_stp_cool':float(env['T_stp_cool'][0]),
+                   'T_stp_heat':float(env['T_stp_heat'][0])}
+    model.step(dict(ip_data_env))
+    occupant = model.schedule.agents[0]
+    occupant.current_env_features = om_tools.convert_env_to_F(ip_data_env, model.units)
+
+    def occupant_day():
+        # Steps of the rest of the day (occupied and unoccupied timesteps)
+        for timestep in range(1, STEPS_PER_DAY):
+            model.clock.move(timestep)
+            occupant.step()
+
+    benchmarks = {
+        'Markov_occupancy_model':lambda: om_tools.Markov_occupancy_model(init_data, SAMPLING_TIME, START, rng=rng),
+        'realize_routine_msc':lambda: om_tools.realize_routine_msc(init_data, occupancy_schedule, START, rng=rng),
+        'Markov_habitual_model':lambda: om_tools.Markov_habitual_model(TM, SAMPLING_TIME, rng=rng),
+        'Markov_2nd_order_habitual_model':lambda: om_tools.Markov_2nd_order_habitual_model(TM_2, SAMPLING_TIME, START, rng=rng),
+        'OccupancyEngine.sample':lambda: occupancy_engine.sample(False, occupancy_uniforms),
+        'realize_tables_msc':lambda: om_routine.realize_tables_msc(routine_tables, occupancy, SAMPLING_TIME, rng=rng),
+        'HabitualEngine.sample':lambda: habitual_engine.sample(0, habitual_uniforms),
+        'HabitualEngine.sample/order_2':lambda: habitual_engine_2.sample(0, habitual_uniforms_2),
+        'frustration_theory':lambda: om_tools.frustration_theory(2.5, thermal_frustration=[0], tf_threshold={'UL':3, 'LL':-3}),
+        'comfort_zone_theory':lambda: om_tools.comfort_zone_theory(2.5, cz_threshold={'UL':3, 'LL':-3}),
+        'Occupant.step':occupant_day,
+    }
+    results = {}
+    for name, function in benchmarks.items():
+        # Untimed call, compiles the models cached by the tools functions
+        function()
+        # Fast functions are called many times per round to get a measurable duration
+        number = 10000 if name.endswith('_theory') else 100 if name in ['realize_tables_msc', 'realize_routine_msc'] else 1
+        results[name] = timed(function, repeat=repeat, number=number)
+        if name == 'Occupant.step':
+            results[name] /= STEPS_PER_DAY - 1
+        print(f"{name:<36}{results[name]*1e3:>12.4f} ms")
+    return results
+
+def bench_horizons(init_data, env, backends, horizons):
+    """ Time of a full OccupantModel run of a day, week and year (1 home, 1 occupant) """
+    results = {}
+    for backend in backends:
+        for horizon, days in horizons.items():
+            periods = days*STEPS_PER_DAY
+            env_horizon = tile_env(env, periods)
+            model = make_model(init_data, backend=backend)
+            tic = time.perf_counter()
+            model.run(env_horizon, start=START, periods=periods)
+            results[f"{backend}/{horizon}"] = time.perf_counter() - tic
+            print(f"{backend + '/' + horizon:<36}{results[backend + '/' + horizon]:>12.4f} s")
+    return results
+
+def bench_scaling(init_data, env, backends, N_homes_list, N_occupants_list, days):
+    """ Throughput (occupant timesteps per second) and traced memory of runs over a grid of N_homes x N_occupants_in_home
+    model_MB: memory held by the model after its creation, peak_MB: peak memory during the run
+    """
+    periods = days*STEPS_PER_DAY
+    env_horizon = tile_env(env, periods)
+    results = []
+    for backend in backends:
+        for N_homes in N_homes_list:
+            for N_occupants in N_occupants_list:
+                model = make_model(init_data, N_homes=N_homes, N_occupants_in_home=N_occupants, backend=backend)
+                tic = time.perf_counter()
+                model.run(env_horizon, start=START, periods=periods)
+                seconds = time.perf_counter() - tic
+
+                # Memory is measured on a second run, tracing the allocations slows the run down
+                tracemalloc.start()
+                model = make_model(init_data, N_homes=N_homes, N_occupants_in_home=N_occupants, backend=backend)
+                model_memory, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                model.run(env_horizon, start=START, periods=periods)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                result = {'backend':backend, 'N_homes':N_homes, 'N_occupants_in_home':N_occupants, 'seconds':seconds,
+                          'occupant_steps_per_s':N_homes*N_occupants*periods/seconds, 'model_MB':model_memory/2**20, 'peak_MB':peak/2**20}
+                results.append(result)
+                print(f"{backend:<12}{N_homes:>8}{N_occupants:>4}{seconds:>12.3f} s{result['occupant_steps_per_s']:>14.0f} steps/s"
+                      f"{result['model_MB']:>10.1f} MB{result['peak_MB']:>10.1f} MB")
+    return results
+
+def metadata():
+    """ Environment of the benchmark run """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'date':datetime.datetime.now().isoformat(timespec='seconds'), 'commit':commit, 'python':platform.python_version(),
+            'numpy':np.__version__, 'pandas':pd.__version__, 'machine':platform.machine(), 'processor':platform.processor()}
+
+def compare(results, baseline, tolerance):
+    """ Compare timings with a baseline, returns the list of regressions (slower than tolerance x baseline) """
+    regressions = []
+    timings = {**{'hot_paths/' + name: value for name, value in results['hot_paths'].items()},
+               **{'horizons/' + name: value for name, value in results['horizons'].items()},
+               **{f"scaling/{item['backend']}/{item['N_homes']}x{item['N_occupants_in_home']}": item['seconds'] for item in results['scaling']}}
+    reference = {**{'hot_paths/' + name: value for name, value in baseline.get('hot_paths', {}).items()},
+                 **{'horizons/' + name: value for name, value in baseline.get('horizons', {}).items()},
+                 **{f"scaling/{item['backend']}/{item['N_homes']}x{item['N_occupants_in_home']}": item['seconds'] for item in baseline.get('scaling', [])}}
+    print(f"\n{'Benchmark':<44}{'Baseline':>12}{'Current':>12}{'Ratio':>8}")
+    for name, value in timings.items():
+        if name not in reference:
+            continue
+        ratio = value/reference[name]
+        flag = ' <- regression' if ratio > tolerance else ''
+        print(f"{name:<44}{reference[name]:>12.5f}{value:>12.5f}{ratio:>8.2f}{flag}")
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the occupant behavior model')
+    parser.add_argument('--init-data', default='synthetic',
+                        help="directory of the init_data csv files, init_data bundle or 'synthetic' (default)")
+    parser.add_argument('--env', default=str(ROOT / 'input_data' / 'sample_data1_stp_processed.h5'), help='DyD sample (HDF5)')
+    parser.add_argument('--backends', nargs='+', default=['population', 'agents'])
+    parser.add_argument('--N-homes', nargs='+', type=int, default=[1, 10, 100, 1000])
+    parser.add_argument('--N-occupants', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--scaling-days', type=int, default=1, help='simulated days per scaling run')
+    parser.add_argument('--no-year', action='store_true', help='skip the year long runs')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help='write the results (json) to this file, e.g. as a new baseline')
+    parser.add_argument('--baseline', help='baseline results (json) to compare with')
+    parser.add_argument('--tolerance', type=float, default=1.2, help='slowdown ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    init_data, env = load_inputs(args.init_data, args.env)
+    horizons = {'day':1, 'week':7} if args.no_year else {'day':1, 'week':7, 'year':365}
+    results = {'meta':metadata()}
+    print('Hot paths')
+    results['hot_paths'] = bench_hot_paths(init_data, env, args.repeat)
+    print('\nHorizons')
+    results['horizons'] = bench_horizons(init_data, env, args.backends, horizons)
+    print('\nScaling')
+    results['scaling'] = bench_scaling(init_data, env, args.backends, args.N_homes, args.N_occupants, args.scaling_days)
+
+    if args.save:
+        pathlib.Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.tolerance}x the baseline")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,54 +1,19 @@
-def extract_TM_DyD(TM, weekday_df, df_read):
-    print("here")
-    hours_list = list(range(0,24))*12
-    hours_list.sort()
-    minutes_list = list(range(0,56,5))*24
-    
-    for timestep in range(1,289):
-        print(f"timestep: {timestep}")
-        
-        if timestep == 1:
-            cur_min = minutes_list[-1]
-            cur_hour = hours_list[-1]
-            next_min = minutes_list[0]
-            next_hour = hours_list[0]
-        else:
-            cur_min = next_min
-            cur_hour = next_hour
-            next_min = minutes_list[timestep-1]
-            next_hour = hours_list[timestep-1]
-
-        idx_curr_non_override = [index for index,value in weekday_df.loc[(weekday_df.DateTime.dt.minute == cur_min) & (weekday_df.DateTime.dt.hour==cur_hour),'mdsp'].items() if value ==False]
-        idx_curr_override = [index for index,value in weekday_df.loc[(weekday_df.DateTime.dt.minute == cur_min) & (weekday_df.DateTime.dt.hour==cur_hour),'mdsp'].items() if value == True]
-
-        for idx in idx_curr_non_override:
-            if idx == len(df_read):
-                continue
-            if df_read.loc[idx+1].mdsp == True:
-                TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 0), 'p_2_1'] += 1
-            else: 
-                TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 0), 'p_2_0'] += 1
+import pathlib
+import sys
+import numpy as np
 
-        for idx in idx_curr_override:
-            if idx == len(df_read):
-                continue
-            if df_read.loc[idx+1].mdsp == True:
-                TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 1),'p_2_1'] += 1
-            else: 
-                TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 1), 'p_2_0'] += 1
+# Estimation modules of the package
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / 'src'))
+import tm_estimator as om_tm_estimator
 
-        total_override_events = TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 1),'p_2_1'].values + TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 1),'p_2_0'].values
-        total_non_override_events = TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 0),'p_2_1'].values + TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 0),'p_2_0'].values
-        if total_override_events == 0:
-            TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 1),'p_2_0'] = 1
-        else:
-            TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 1),'p_2_1'] =  TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 1),'p_2_1'].values/total_override_events
-            TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 1),'p_2_0'] = TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 1),'p_2_0'].values/total_override_events
-
-        if total_non_override_events == 0:
-            TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 0),'p_2_0'] = 1    
-        else:
-            TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 0),'p_2_1'] = TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 0),'p_2_1'].values/total_non_override_events
-            TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 0),'p_2_0'] = TM.loc[(TM['time']== timestep ) & (TM['cur_state'] == 0),'p_2_0'].values/total_non_override_events
-    
-    return TM
\ No newline at end of file
+def extract_TM_DyD(TM, weekday_df, df_read):
+    """ Habitual transition matrix of the transitions from the rows of weekday_df to the following rows of df_read
+    Counted with tm_estimator.transition_counts, TM (time, cur_state, p_2_0, p_2_1) is filled with the probabilities """
+    counts = om_tm_estimator.transition_counts(df_read['DateTime'], df_read['mdsp'].values,
+                                                select=df_read.index.isin(weekday_df.index), check_gaps=False)
+    probs = om_tm_estimator.TransitionCounter(counts=counts).probabilities()
+    timesteps = TM['time'].values.astype(int) - 1
+    states = TM['cur_state'].values.astype(int)
+    TM['p_2_0'] = probs[timesteps, states, 0]
+    TM['p_2_1'] = probs[timesteps, states, 1]
+    return TM
@@ -1,6 +1,7 @@
 
 # Import packages
 import src.tools as om_tools
+import src.init_data_store as om_init_data_store
 import sys
 import os
 # sys.path.append(os.path.dirname(__file__)) # Does not work with jupyter notebooks
@@ -18,6 +19,8 @@ model_files = list(models_dir.iterdir())
 init_data = {}
 for file in data_files:
     init_data[file.stem] = om_tools.pd.read_csv(file)
+# The tables can also be converted once into a single file, loaded memory mapped by passing its path as init_data:
+# init_data = om_init_data_store.convert_csv_dir(init_data_dir, 'input_data/init_data.npz')
 models = {}
 for model_file in model_files:
     models[model_file.stem] = om_tools.pickle.load(open(model_file,'rb'))
@@ -30,38 +33,18 @@ sim_sampling_frequency = 5 # minutes -> cannot exceed this interval as the TM's
 Occup_model = OccupantModel(units='F', N_homes= 1, N_occupants_in_home=1,
                             sampling_frequency=sim_sampling_frequency, models = models,
                             init_data = init_data, comfort_temperature=68,
-                             discomfort_theory_name='tft', threshold={'UL': 50, 'LL': -50},TFT_alpha=1,TFT_beta=1,start_datetime=start_datetime)
+                             discomfort_theory_name='tft', threshold={'UL': 50, 'LL': -50},TFT_alpha=1,TFT_beta=1,start_datetime=start_datetime, tstat_db=0)
 
-## Simulate the model for a day
-t = []
-T_stp_heat = []
-T_stp_cool = []
-mo = []
-del_t = []
-tf =[]
-current_datetime = start_datetime
+## Simulate the model for 20 days
 total_timesteps = int((1440*20)/sim_sampling_frequency)
-# Simulate the occupant model for specific timesteps
-for timeStepN in range(0,total_timesteps):
-    t.append(timeStepN)  # For plotting
-    if timeStepN > 0:
-        current_datetime = current_datetime + om_tools.datetime.timedelta(minutes=sim_sampling_frequency)
-
-    Occup_model.step(ip_data_env= {'DateTime':current_datetime, 'T_in':df.loc[timeStepN,'T_ctrl'],
-                            'T_stp_cool':df.loc[timeStepN,'T_stp_cool'],
-                            'T_stp_heat':df.loc[timeStepN,'T_stp_heat'],
-                            'hum':df.loc[timeStepN,'hum'],
-                            'T_out':df.loc[timeStepN,'T_out'],
-                            'mo':None,
-                            'equip_run_heat':df.loc[timeStepN,'equip_run_heat'],
-                            'equip_run_cool':df.loc[timeStepN,'equip_run_cool']
-                            })
-    for agents in Occup_model.schedule.agents:
-        T_stp_heat.append(agents.output['T_stp_heat'])
-        T_stp_cool.append(agents.output['T_stp_cool'])
-        mo.append(agents.output['Motion'])
-        del_t.append(agents.output['Comfort delta'])
-        tf.append(agents.output['Thermal Frustration'])
+# The environment time series is passed at once, results are returned as (timestep x occupant) arrays
+results = Occup_model.run(env_frame=df, start=start_datetime, periods=total_timesteps)
+t = list(range(0,total_timesteps))  # For plotting
+T_stp_heat = results['T_stp_heat'][:,0]
+T_stp_cool = results['T_stp_cool'][:,0]
+mo = results['Motion'][:,0]
+del_t = results['Comfort Delta'][:,0]
+tf = results['Thermal Frustration'][:,0]
 
 om_tools.sns.set()
 ## Visualize the overrides
@@ -0,0 +1,218 @@
+""" checkpoint.py -> Snapshots of the simulation state of an OccupantModel: save, restore and fork a run """
+
+# Import packages
+import copy
+import json
+import numpy as np
+import mesa
+import instrumentation as om_instrumentation
+import schedule_store as om_schedule_store
+
+FORMAT_VERSION = 2
+
+# Daily schedules of the occupants, arrays of shape (N_occupants, steps_per_day)
+SCHEDULES = ['occupancy', 'routine_msc', 'routine_delT_cool', 'routine_delT_heat']
+
+def _rng_state(rng):
+    """ State of a random generator: np.random.Generator, np.random.RandomState or the global np.random state """
+    if isinstance(rng, np.random.Generator):
+        return 'generator', rng.bit_generator.state
+    return 'random_state', rng.get_state(legacy=False)
+
+def _set_rng_state(rng, kind, state):
+    if kind == 'generator':
+        rng.bit_generator.state = state
+    else:
+        rng.set_state(state)
+
+def _copy_rng(rng):
+    """ New generator of the same kind as rng (a RandomState for the global np.random state), its state is set by restore """
+    if isinstance(rng, np.random.Generator):
+        return np.random.Generator(type(rng.bit_generator)())
+    return np.random.RandomState()
+
+def _split_arrays(value, prefix, arrays):
+    """ Replace the arrays nested in value (dicts of a generator state) by references to entries of arrays """
+    if isinstance(value, dict):
+        return {key: _split_arrays(item, f"{prefix}.{key}", arrays) for key, item in value.items()}
+    if isinstance(value, np.ndarray):
+        arrays[prefix] = value
+        return {'__array__':prefix}
+    return value.item() if isinstance(value, np.generic) else value
+
+def _join_arrays(value, arrays):
+    if isinstance(value, dict):
+        if '__array__' in value:
+            return arrays[value['__array__']]
+        return {key: _join_arrays(item, arrays) for key, item in value.items()}
+    return value
+
+def snapshot(model):
+    """ Complete simulation state of an OccupantModel, as a dict of arrays and a 'meta' dict:
+    - clock: schedule steps and time, tick of the simulation clock
+    - per occupant: the day's occupancy and routine msc schedules, thermal frustration, last override time
+      (clock tick) and the pending time to override of the ML theory
+    - state of the model's random generator and the refresh state of its schedule bank
+    The compiled engines, models and parameters are not part of the state, they are rebuilt with the model.
+    """
+    population = model.population
+    if population is not None:
+        occupants = [population]
+        has_schedules = population.occupancy is not None
+        thermal_frustration = population.thermal_frustration
+        last_override = population.last_override
+        ml_discomfort = [population.ml_discomfort] if population.ml_discomfort is not None else []
+    else:
+        occupants = model.schedule.agents
+        has_schedules = all(agent.occupancy is not None for agent in occupants)
+        thermal_frustration = [agent.frustration.value for agent in occupants]
+        last_override = [agent.last_override_step for agent in occupants]
+        ml_discomfort = [agent.ml_discomfort for agent in occupants if hasattr(agent, 'ml_discomfort')]
+
+    state = {'thermal_frustration':np.array(thermal_frustration, dtype=float),
+             'last_override':np.array(last_override, dtype=np.int64)}
+    if has_schedules:
+        for name in SCHEDULES:
+            state[name] = np.vstack([getattr(occupant, name) for occupant in occupants])
+    if ml_discomfort:
+        state['TTO'] = np.concatenate([ml.TTO for ml in ml_discomfort])
+
+    rng_kind, rng_state = _rng_state(model.rng)
+    state['meta'] = {'format_version':FORMAT_VERSION, 'backend':model.backend, 'N_homes':model.N_homes,
+                     'N_occupants_in_home':model.N_occupants_in_home, 'n_variants':model.n_variants,
+                     'sampling_frequency':model.sampling_frequency, 'start_datetime':model.start_datetime.isoformat(), 'steps':model.schedule.steps, 'time':model.schedule.time,
+                     'tick':model.clock.tick, 'run_seed':None if model.streams is None else model.streams.run_seed,
+                     'has_schedules':has_schedules, 'rng_kind':rng_kind, 'rng_state':copy.deepcopy(rng_state)}
+    if model.schedule_bank is not None:
+        # The content of a schedule bank is determined by its number of refreshes
+        state['meta']['schedule_bank'] = {'days':model.schedule_bank.days, 'refreshes':model.schedule_bank.refreshes}
+    return state
+
+def save_checkpoint(model, path):
+    """ Save the snapshot of a model to path (compressed npz, no pickled objects) """
+    state = snapshot(model)
+    meta = state.pop('meta')
+    arrays = {}
+    meta['rng_state'] = _split_arrays(meta['rng_state'], 'rng', arrays)
+    np.savez_compressed(path, meta=np.array(json.dumps(meta)), **state, **arrays)
+
+def load_checkpoint(path):
+    """ Read a snapshot saved by save_checkpoint """
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files if key != 'meta'}
+        meta = json.loads(data['meta'].item())
+    if meta['format_version'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint format version {meta['format_version']}")
+    meta['rng_state'] = _join_arrays(meta['rng_state'], arrays)
+    state = {key: values for key, values in arrays.items() if not key.startswith('rng.')}
+    state['meta'] = meta
+    return state
+
+def restore(model, state, restore_rng=True, copy_schedules=True):
+    """ Set the simulation state of a model to a snapshot
+    The model must be created with the same configuration (backend, homes, occupants, variants, sampling frequency, start
+    datetime and run_seed). model.run then continues from the timestep following the snapshot.
+    restore_rng: also set the state of the model's random generator
+    copy_schedules: copy the daily schedules, otherwise the model uses the (read-only) arrays of the snapshot
+    """
+    meta = state['meta']
+    run_seed = None if model.streams is None else model.streams.run_seed
+    config = {'backend':model.backend, 'N_homes':model.N_homes, 'N_occupants_in_home':model.N_occupants_in_home,
+              'n_variants':model.n_variants, 'sampling_frequency':model.sampling_frequency, 'start_datetime':model.start_datetime.isoformat(), 'run_seed':run_seed}
+    for key, value in config.items():
+        if meta[key] != value:
+            raise ValueError(f"Checkpoint {key} is {meta[key]}, the model's is {value}")
+
+    model.schedule.steps = meta['steps']
+    model.schedule.time = meta['time']
+    model.clock.move(meta['tick'])
+    if restore_rng:
+        _set_rng_state(model.rng, meta['rng_kind'], meta['rng_state'])
+    if 'schedule_bank' in meta:
+        bank = model.schedule_bank
+        if bank is None or bank.refreshes > meta['schedule_bank']['refreshes']:
+            raise ValueError('The schedule bank of the model does not match the checkpoint')
+        # Redo the refreshes of the checkpointed bank
+        while bank.refreshes < meta['schedule_bank']['refreshes']:
+            bank.refresh(model.occupancy_engine, model.routine_data)
+        bank.days = meta['schedule_bank']['days']
+
+    schedules = {}
+    if meta['has_schedules']:
+        for name in SCHEDULES:
+            schedules[name] = state[name].copy() if copy_schedules else state[name]
+            schedules[name].flags.writeable = copy_schedules
+    TTO = state.get('TTO')
+
+    population = model.population
+    if population is not None:
+        population.thermal_frustration = state['thermal_frustration'].copy()
+        population.last_override = state['last_override'].copy()
+        for name in SCHEDULES:
+            setattr(population, name, schedules.get(name))
+        if population.ml_discomfort is not None:
+            population.ml_discomfort.TTO = TTO.copy()
+        return model
+
+    ml_row = 0
+    for row, agent in enumerate(model.schedule.agents):
+        agent.frustration.value = float(state['thermal_frustration'][row])
+        agent.last_override_step = int(state['last_override'][row])
+        for name in SCHEDULES:
+            setattr(agent, name, schedules[name][row] if schedules else None)
+        if hasattr(agent, 'ml_discomfort'):
+            agent.ml_discomfort.TTO = TTO[ml_row:ml_row + 1].copy()
+            ml_row += 1
+    return model
+
+def _clone(model, rng):
+    """ Copy of a model sharing its compiled engines, models and parameters, with its own mutable state """
+    clone = copy.copy(model)
+    clone.rng = rng
+    instrumentation = model.instrumentation
+    clone.instrumentation = om_instrumentation.Instrumentation(level=instrumentation.level, timers=instrumentation.timers,
+                                                                logger=instrumentation.logger)
+    clone.schedule = mesa.time.BaseScheduler(clone)
+    clone.clock = copy.copy(model.clock)
+    if model.schedule_bank is not None:
+        clone.schedule_bank = model.schedule_bank.copy()
+    if model.schedule_store is not None:
+        # A copy records the schedules from the fork on, the ones before it are in the model's store
+        store = model.schedule_store
+        clone.schedule_store = om_schedule_store.ScheduleStore(store.N_agents, store.start_date, store.sampling_time, planes=list(store.planes))
+    if model.population is not None:
+        clone.population = copy.copy(model.population)
+        clone.population.instrumentation = clone.instrumentation
+        clone.population.schedule_bank = clone.schedule_bank
+        clone.population.schedule_store = clone.schedule_store
+        if model.population.ml_discomfort is not None:
+            clone.population.ml_discomfort = copy.copy(model.population.ml_discomfort)
+    for agent in model.schedule.agents:
+        occupant = copy.copy(agent)
+        occupant.model = clone
+        occupant.output = dict(agent.output)
+        occupant.frustration = copy.copy(agent.frustration)
+        if agent.frustration.history is not None:
+            occupant.frustration.history = list(agent.frustration.history)
+        if hasattr(agent, 'ml_discomfort'):
+            occupant.ml_discomfort = copy.copy(agent.ml_discomfort)
+        clone.schedule.add(occupant)
+    return clone
+
+def fork(model, n, rngs=None):
+    """ n copies of a model in its current state, e.g. to simulate scenario variants from a warmed-up model
+
+    The copies share the compiled occupancy and routine models, the ML models and the current day's schedules
+    (read-only) with the model, only the per-occupant state and the clock are copied. With record_schedules,
+    each copy records the schedules from the fork on in its own store.
+    rngs: optional random generator of each copy, by default each copy continues the model's random stream
+          (copies given the same inputs then produce the same outputs: common random numbers)
+    """
+    if rngs is not None and len(rngs) != n:
+        raise ValueError(f"Got {len(rngs)} random generators for {n} copies")
+    state = snapshot(model)
+    forks = []
+    for i in range(n):
+        clone = _clone(model, _copy_rng(model.rng) if rngs is None else rngs[i])
+        forks.append(restore(clone, state, restore_rng=rngs is None, copy_schedules=False))
+    return forks
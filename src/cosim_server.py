@@ -0,0 +1,204 @@
+""" cosim_server.py -> Asyncio co-simulation server exchanging batched binary frames with external simulators """
+
+# Import packages
+import asyncio
+import datetime
+import struct
+import numpy as np
+
+# Frame header: magic, message type, flags, scenario, sequence number, datetime (ns since epoch), N, payload bytes
+HEADER = struct.Struct('<4sBBHIqII')
+MAGIC = b'OBM1'
+
+# Message types
+STEP = 1 # Simulator -> server: environment of the N homes of a scenario for a timestep
+RESULT = 2 # Server -> simulator: setpoints and override flags of the N occupants
+ERROR = 3 # Server -> simulator: error message (utf-8) for the frame with the same scenario and sequence number
+CLOSE = 4 # Simulator -> server: end of the session
+
+# Environment inputs of a STEP frame, float64 array of shape (len(COSIM_INPUTS), N_homes) in the model's units
+COSIM_INPUTS = ['T_in', 'T_stp_cool', 'T_stp_heat', 'T_out', 'hum', 'equip_run_heat', 'equip_run_cool']
+
+# RESULT payload: T_stp_cool and T_stp_heat (float64) of each occupant, then one byte of flags per occupant
+FLAGS = {'Motion':1, 'Habitual override':2, 'Discomfort override':4}
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def encode_frame(message_type, scenario=0, seq=0, current_datetime=None, N=0, payload=b''):
+    """ Encode a frame: header followed by the payload bytes """
+    ns = 0 if current_datetime is None else (current_datetime - EPOCH)//datetime.timedelta(microseconds=1)*1000
+    return HEADER.pack(MAGIC, message_type, 0, scenario, seq, ns, N, len(payload)) + payload
+
+async def read_frame(reader):
+    """ Read a frame, returns (message type, scenario, seq, datetime, N, payload) or None at the end of the stream """
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    magic, message_type, _, scenario, seq, ns, N, size = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError('Invalid co-simulation frame')
+    payload = await reader.readexactly(size) if size else b''
+    return message_type, scenario, seq, EPOCH + datetime.timedelta(microseconds=ns//1000), N, payload
+
+def encode_step(scenario, seq, current_datetime, env):
+    """ STEP frame for env: dict with an array (one value per home) for each of the COSIM_INPUTS """
+    values = np.stack([np.asarray(env[var], dtype='<f8') for var in COSIM_INPUTS])
+    return encode_frame(STEP, scenario, seq, current_datetime, values.shape[1], values.tobytes())
+
+def encode_result(scenario, seq, current_datetime, output):
+    """ RESULT frame for the outputs of a timestep (see OccupantModel.current_output) """
+    setpoints = np.stack([np.asarray(output['T_stp_cool'], dtype='<f8'), np.asarray(output['T_stp_heat'], dtype='<f8')])
+    flags = np.zeros(setpoints.shape[1], dtype=np.uint8)
+    for var, bit in FLAGS.items():
+        flags |= np.where(np.asarray(output[var], dtype=bool), bit, 0).astype(np.uint8)
+    return encode_frame(RESULT, scenario, seq, current_datetime, setpoints.shape[1], setpoints.tobytes() + flags.tobytes())
+
+def decode_result(N, payload):
+    """ Outputs of a RESULT frame: T_stp_cool, T_stp_heat and the override flags, one value per occupant """
+    setpoints = np.frombuffer(payload, dtype='<f8', count=2*N).reshape(2, N)
+    flags = np.frombuffer(payload, dtype=np.uint8, offset=16*N, count=N)
+    output = {'T_stp_cool':setpoints[0], 'T_stp_heat':setpoints[1]}
+    output.update({var: (flags & bit) != 0 for var, bit in FLAGS.items()})
+    return output
+
+class CosimServer:
+    """ Co-simulation server for OccupantModels (backend='population'), one per scenario
+
+    models: dict scenario number -> OccupantModel
+    executor: concurrent.futures executor the model steps run in, defaults to the event loop's default executor
+    Frames of a connection are read as they arrive and queued per scenario, each scenario is stepped by its own task,
+    so a simulator can pipeline the steps of independent scenarios without waiting for the results of each one.
+    The steps run in the executor, off the event loop, so frames keep being read while the models step (scenarios
+    stepping concurrently should not share a random generator, e.g. create the models with run_seed or their own rng).
+    Results of a scenario are returned in order, results of different scenarios may interleave.
+    """
+    def __init__(self, models, executor=None) -> None:
+        for scenario, model in models.items():
+            if model.population is None:
+                raise ValueError(f"Scenario {scenario}: the co-simulation server requires backend='population'")
+        self.models = models
+        self.executor = executor
+        self.server = None
+
+    def step(self, scenario, current_datetime, N, payload):
+        """ Simulate a timestep of a scenario from a STEP payload, returns the outputs """
+        model = self.models[scenario]
+        if N != model.N_homes:
+            raise ValueError(f"Scenario {scenario} has {model.N_homes} homes, got {N}")
+        values = np.frombuffer(payload, dtype='<f8').reshape(len(COSIM_INPUTS), N)
+        # Values of the homes are shared by their occupants
+        ip_data_env = {var: np.repeat(values[i], model.N_occupants_in_home) for i, var in enumerate(COSIM_INPUTS)}
+        ip_data_env['DateTime'] = current_datetime
+        model.step(ip_data_env)
+        return model.current_output()
+
+    async def _run_scenario(self, queue, writer, lock):
+        loop = asyncio.get_running_loop()
+        while True:
+            frame = await queue.get()
+            if frame is None:
+                return
+            scenario, seq, current_datetime, N, payload = frame
+            try:
+                output = await loop.run_in_executor(self.executor, self.step, scenario, current_datetime, N, payload)
+                response = encode_result(scenario, seq, current_datetime, output)
+            except Exception as error:
+                response = encode_frame(ERROR, scenario, seq, current_datetime, 0, str(error).encode())
+            # The scenarios of a connection share its writer, one task writes and drains at a time
+            async with lock:
+                writer.write(response)
+                await writer.drain()
+
+    async def handle(self, reader, writer):
+        """ Serve a connection until CLOSE or the end of the stream """
+        queues, tasks = {}, []
+        lock = asyncio.Lock()
+        try:
+            while True:
+                frame = await read_frame(reader)
+                if frame is None or frame[0] == CLOSE:
+                    break
+                message_type, scenario, seq, current_datetime, N, payload = frame
+                if message_type != STEP or scenario not in self.models:
+                    async with lock:
+                        writer.write(encode_frame(ERROR, scenario, seq, current_datetime, 0, f"Invalid frame for scenario {scenario}".encode()))
+                        await writer.drain()
+                    continue
+                if scenario not in queues:
+                    queues[scenario] = asyncio.Queue()
+                    tasks.append(asyncio.create_task(self._run_scenario(queues[scenario], writer, lock)))
+                queues[scenario].put_nowait((scenario, seq, current_datetime, N, payload))
+
+            # Finish the queued steps
+            for queue in queues.values():
+                queue.put_nowait(None)
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            writer.close()
+
+    async def start_unix(self, path):
+        """ Listen on a unix socket """
+        self.server = await asyncio.start_unix_server(self.handle, path=path)
+        return self.server
+
+    async def start_tcp(self, host='127.0.0.1', port=0):
+        """ Listen on a local TCP port (port 0 picks a free one, see self.server.sockets) """
+        self.server = await asyncio.start_server(self.handle, host=host, port=port)
+        return self.server
+
+class CosimClient:
+    """ Stand-in for an external simulator: sends STEP frames and receives the RESULT frames """
+    def __init__(self, reader, writer) -> None:
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect_unix(cls, path):
+        return cls(*await asyncio.open_unix_connection(path))
+
+    @classmethod
+    async def connect_tcp(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    def send_step(self, scenario, seq, current_datetime, env):
+        """ Queue a STEP frame without waiting for its result """
+        self.writer.write(encode_step(scenario, seq, current_datetime, env))
+
+    async def receive(self):
+        """ Next RESULT frame: (scenario, seq, outputs), raises RuntimeError for ERROR frames """
+        await self.writer.drain()
+        message_type, scenario, seq, _, N, payload = await read_frame(self.reader)
+        if message_type == ERROR:
+            raise RuntimeError(f"Scenario {scenario}, step {seq}: {payload.decode()}")
+        return scenario, seq, decode_result(N, payload)
+
+    async def replay(self, envs, datetimes, window=64):
+        """ Replay environment time series of several scenarios with up to window steps in flight
+
+        envs: dict scenario -> dict with an array of shape (timesteps, N_homes) for each of the COSIM_INPUTS
+        datetimes: datetimes of the timesteps
+        Returns dict scenario -> dict of arrays of shape (timesteps, N_occupants) with the outputs
+        """
+        frames = [(scenario, seq) for seq in range(len(datetimes)) for scenario in envs]
+        results = {scenario: [None]*len(datetimes) for scenario in envs}
+        sent = received = 0
+        while received < len(frames):
+            while sent < len(frames) and sent - received < window:
+                scenario, seq = frames[sent]
+                self.send_step(scenario, seq, datetimes[seq], {var: values[seq] for var, values in envs[scenario].items()})
+                sent += 1
+            scenario, seq, output = await self.receive()
+            results[scenario][seq] = output
+            received += 1
+        return {scenario: {var: np.stack([output[var] for output in outputs]) for var in outputs[0]}
+                for scenario, outputs in results.items()}
+
+    async def close(self):
+        self.writer.write(encode_frame(CLOSE))
+        await self.writer.drain()
+        self.writer.close()
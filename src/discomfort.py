@@ -0,0 +1,113 @@
+""" discomfort.py -> Bounded-state discomfort trackers and vectorized offline evaluation of the CZT and TFT theories """
+
+# Import packages
+import numpy as np
+
+def czt_override(del_tin_tct, threshold_UL, threshold_LL):
+    """ Comfort zone theory: override when the indoor temperature leaves the comfort zone (vectorized tools.comfort_zone_theory) """
+    return (del_tin_tct > threshold_UL) | (del_tin_tct < threshold_LL)
+
+def tft_step(thermal_frustration, del_tin_tct, occupied, alpha, beta, threshold_UL, threshold_LL):
+    """ Thermal frustration theory for one timestep (vectorized tools.frustration_theory)
+
+    The frustration accumulates as alpha*frustration + beta*(T_in - T_CT) while the occupant is present,
+    it is reset after a threshold is crossed and while the occupant is away.
+    Returns the frustration after the timestep and the threshold crossings (override if the occupant is present)
+    """
+    thermal_frustration_new = alpha*thermal_frustration + beta*del_tin_tct
+    crossed = (thermal_frustration_new >= threshold_UL) | (thermal_frustration_new <= threshold_LL)
+    thermal_frustration_new = np.where(occupied & ~crossed, thermal_frustration_new, 0)
+    return thermal_frustration_new, crossed
+
+class FrustrationTracker:
+    """ Thermal frustration of an occupant (TFT), keeping only the current value
+
+    Same results as tools.frustration_theory, which appends every value to a list for the whole run.
+    record_history: also keep the values in self.history (the list tools.frustration_theory would build,
+                    resets included), off by default since it grows with the run
+    """
+    def __init__(self, alpha=1, beta=1, threshold={'UL':4,'LL':-4}, record_history=False) -> None:
+        self.alpha = alpha
+        self.beta = beta
+        self.threshold = threshold # degree F minutes
+        self.value = 0 # Current thermal frustration
+        self.history = [0] if record_history else None
+
+    def step(self, del_tin_tct):
+        """ Accumulate the frustration of a timestep the occupant is present, returns True for an override """
+        self.value = self.alpha*self.value + self.beta*del_tin_tct
+        override = self.value >= self.threshold['UL'] or self.value <= self.threshold['LL']
+        if self.history is not None:
+            self.history.append(self.value)
+        if override:
+            self.reset()
+        return override
+
+    def reset(self):
+        """ Reset the frustration, after an override or while the occupant is away """
+        self.value = 0
+        if self.history is not None and self.history[-1] != 0:
+            self.history.append(0)
+
+# Below this many occupants, TFT time series are evaluated occupant by occupant with Python floats,
+# faster than one numpy operation per timestep on a few values
+SCALAR_TFT_OCCUPANTS = 16
+
+def _tft_series(del_tin_tct, occupied, alpha, beta, threshold_UL, threshold_LL, thermal_frustration):
+    """ Thermal frustration and threshold crossings of one occupant over time (same operations as tft_step) """
+    frustration = np.empty(len(del_tin_tct))
+    crossings = np.empty(len(del_tin_tct), dtype=bool)
+    value = thermal_frustration
+    for timestep, (delta, present) in enumerate(zip(del_tin_tct.tolist(), occupied.tolist())):
+        value = alpha*value + beta*delta
+        crossed = value >= threshold_UL or value <= threshold_LL
+        if crossed or not present:
+            value = 0.0
+        frustration[timestep] = value
+        crossings[timestep] = crossed
+    return frustration, crossings
+
+def evaluate_discomfort(del_tin_tct, occupied, discomfort_theory_name='czt', threshold={'UL':4,'LL':-4}, TFT_alpha=1, TFT_beta=1,
+                        thermal_frustration=0):
+    """ Discomfort overrides of whole time series in open loop (the indoor temperature does not depend on the overrides)
+
+    del_tin_tct: T_in - T_CT (degree F), array of shape (timesteps, N_occupants)
+    occupied: bool array of shape (timesteps, N_occupants)
+    discomfort_theory_name, threshold, TFT_alpha, TFT_beta: 'czt' or 'tft' and the theory parameters,
+        scalars or arrays with one value per occupant
+    thermal_frustration: frustration of the occupants before the first timestep
+
+    CZT is evaluated for all the timesteps at once, TFT in one pass over the timesteps for all the occupants
+    (one pass per occupant for fewer than SCALAR_TFT_OCCUPANTS occupants).
+    The overrides are the discomfort triggers of the theory, before the habitual overrides and the 5-minute lockout
+    of the model. Returns the override flags and the thermal frustration after each timestep, of shape (timesteps, N_occupants)
+    """
+    del_tin_tct = np.asarray(del_tin_tct, dtype=float)
+    if del_tin_tct.ndim == 1:
+        # Time series of a single occupant
+        del_tin_tct = del_tin_tct[:, np.newaxis]
+    occupied = np.asarray(occupied, dtype=bool).reshape(del_tin_tct.shape)
+    is_TFT = np.char.upper(np.asarray(discomfort_theory_name, dtype=str)) == 'TFT'
+    UL, LL = np.asarray(threshold['UL'], dtype=float), np.asarray(threshold['LL'], dtype=float)
+
+    overrides = occupied & czt_override(del_tin_tct, UL, LL)
+    frustration = np.zeros(del_tin_tct.shape)
+    if is_TFT.any():
+        tft_overrides = np.empty(del_tin_tct.shape, dtype=bool)
+        value = np.broadcast_to(np.asarray(thermal_frustration, dtype=float), del_tin_tct.shape[1:])
+        if del_tin_tct.shape[1] < SCALAR_TFT_OCCUPANTS:
+            parameters = np.broadcast_arrays(np.asarray(TFT_alpha, dtype=float), np.asarray(TFT_beta, dtype=float), UL, LL, value,
+                                             np.empty(del_tin_tct.shape[1]))[:5]
+            for occupant in range(del_tin_tct.shape[1]):
+                alpha, beta, threshold_UL, threshold_LL, initial = (float(values[occupant]) for values in parameters)
+                frustration[:, occupant], crossed = _tft_series(del_tin_tct[:, occupant], occupied[:, occupant], alpha, beta,
+                                                                threshold_UL, threshold_LL, initial)
+                tft_overrides[:, occupant] = crossed & occupied[:, occupant]
+        else:
+            for timestep in range(del_tin_tct.shape[0]):
+                value, crossed = tft_step(value, del_tin_tct[timestep], occupied[timestep], TFT_alpha, TFT_beta, UL, LL)
+                frustration[timestep] = value
+                tft_overrides[timestep] = crossed & occupied[timestep]
+        overrides = np.where(is_TFT, tft_overrides, overrides)
+        frustration = np.where(is_TFT, frustration, 0)
+    return overrides, frustration
@@ -0,0 +1,112 @@
+""" discomfort_ml.py -> Batched machine learning discomfort model: override classifier and time to override (TTO) regressor """
+
+# Import packages
+import numpy as np
+
+# Features of the classification and regression models (DyD columns, T_ctrl is the indoor temperature T_in), degree F
+ML_FEATURES = ['T_in', 'T_stp_cool', 'T_stp_heat', 'hum', 'T_out', 'mo', 'equip_run_heat', 'equip_run_cool']
+
+# No pending override
+NO_TTO = -1
+
+def feature_matrix(ip_data_env, occupied, features=ML_FEATURES):
+    """ Feature matrix of the ML models, one row per occupant (or per timestep and occupant)
+    ip_data_env: environment inputs as scalars or arrays broadcastable to occupied
+    occupied: bool array of the occupants' presence, used as the motion feature 'mo'
+    Returns an array of shape occupied.shape + (len(features),)
+    """
+    occupied = np.asarray(occupied)
+    columns = [occupied if feature == 'mo' else np.asarray(ip_data_env[feature], dtype=float) for feature in features]
+    return np.stack([np.broadcast_to(column, occupied.shape) for column in columns], axis=-1).astype(float)
+
+class MLDiscomfort:
+    """ Discomfort model of the ML theory for N occupants
+
+    The classifier (e.g. random forest) flags the timesteps at which an occupant starts feeling discomfort, the regressor
+    estimates the time until the occupant overrides the setpoint (timesteps, rounded). The TTO countdown of every occupant
+    is kept as an array, the override happens when it reaches zero while the occupant is present.
+    predict is called once per timestep for all the occupants (step) or once for a whole day (day).
+    """
+    def __init__(self, classifier, regressor, N=1, features=ML_FEATURES) -> None:
+        if classifier is None or regressor is None:
+            raise ValueError("The ML discomfort theory needs models['model_classification'] and models['model_regressor']")
+        self.classifier = classifier
+        self.regressor = regressor
+        self.features = list(features)
+        # The models must have been fitted on the features, in this order
+        for name, model in [('classifier', classifier), ('regressor', regressor)]:
+            n_features = getattr(model, 'n_features_in_', None)
+            if n_features is not None and n_features != len(self.features):
+                raise ValueError(f"The {name} was fitted on {n_features} features, the ML discomfort model uses {len(self.features)}: {self.features}")
+        self.TTO = np.full(N, NO_TTO) # Timesteps to the next override per occupant
+
+    def time_to_override(self, X):
+        """ Timesteps to override estimated by the regressor for the feature rows X """
+        if len(X) == 0:
+            return np.empty(0, dtype=int)
+        return np.maximum(np.round(self.regressor.predict(X)).astype(int), 0)
+
+    def classify(self, X):
+        """ Discomfort flags of the classifier for the feature rows X """
+        if len(X) == 0:
+            return np.empty(0, dtype=bool)
+        return np.asarray(self.classifier.predict(X)).astype(bool)
+
+    def _advance(self, occupied, discomfort, TTO):
+        """ Advance the countdowns by a timestep, returns the overrides
+        discomfort, TTO: classification and time to override of the occupants without a pending override
+        """
+        pending = self.TTO != NO_TTO
+        self.TTO = np.where(pending, self.TTO - 1, self.TTO)
+        new = ~pending & discomfort
+        self.TTO = np.where(new, TTO, self.TTO)
+
+        override = occupied & (self.TTO == 0)
+        # The countdown ends with the override, or when the occupant leaves the home
+        self.TTO = np.where(override | ~occupied, NO_TTO, self.TTO)
+        return override
+
+    def step(self, ip_data_env, occupied, active=None):
+        """ Discomfort overrides of a timestep, bool array with one value per occupant
+        active: optional bool array of the occupants following the ML theory (others are not evaluated)
+        """
+        occupied = np.asarray(occupied, dtype=bool)
+        if active is not None:
+            occupied = occupied & active
+        # Only present occupants without a pending override are classified, in one batch
+        rows = np.flatnonzero(occupied & (self.TTO == NO_TTO))
+        discomfort = np.zeros(occupied.shape, dtype=bool)
+        TTO = np.full(occupied.shape, NO_TTO)
+        if rows.size:
+            X = feature_matrix(ip_data_env, occupied, self.features)[rows]
+            discomfort[rows] = self.classify(X)
+            positive = rows[discomfort[rows]]
+            TTO[positive] = self.time_to_override(X[discomfort[rows]])
+        return self._advance(occupied, discomfort, TTO)
+
+    def day(self, env_day, occupancy):
+        """ Discomfort overrides of a whole day in open loop (the environment does not depend on the overrides)
+        env_day: environment inputs, arrays of shape (timesteps,) or (timesteps, N)
+        occupancy: bool array of shape (timesteps, N)
+        Every occupied (timestep, occupant) is classified with a single predict call, and the flagged ones are
+        regressed with a single predict call. Returns a bool array of shape (timesteps, N)
+        """
+        occupancy = np.asarray(occupancy, dtype=bool)
+        env_day = {feature: np.asarray(env_day[feature]) for feature in self.features if feature != 'mo'}
+        env_day = {feature: values[:, np.newaxis] if values.ndim == 1 else values for feature, values in env_day.items()}
+        rows = np.nonzero(occupancy)
+        X = feature_matrix(env_day, occupancy, self.features)[rows]
+
+        discomfort = np.zeros(occupancy.shape, dtype=bool)
+        discomfort[rows] = self.classify(X)
+        TTO = np.full(occupancy.shape, NO_TTO)
+        TTO[discomfort] = self.time_to_override(X[discomfort[rows]])
+
+        overrides = np.zeros(occupancy.shape, dtype=bool)
+        for timestep in range(occupancy.shape[0]):
+            overrides[timestep] = self._advance(occupancy[timestep], discomfort[timestep], TTO[timestep])
+        return overrides
+
+    def reset(self):
+        """ Clear the pending overrides """
+        self.TTO[:] = NO_TTO
@@ -0,0 +1,74 @@
+""" ensemble.py -> Monte Carlo replications of an OccupantModel scenario on a process pool, with reproducible seeding """
+
+# Import packages
+import concurrent.futures
+import numpy as np
+import env_source as om_env_source
+import model_store as om_model_store
+import init_data_store as om_init_data_store
+from model import OccupantModel, OUTPUT_VARIABLES
+
+class Scenario:
+    """ Scenario simulated by the ensemble: OccupantModel configuration and environment source
+
+    model_config: keyword arguments of OccupantModel (without rng, set per replication), pass models as a model store
+                  directory and init_data as a bundle path so the workers do not receive pickled copies of them
+    env: DataFrame or dict of arrays with the environment time series, or an HDFEnvironmentSource
+    key: home (HDF5 key) to stream when env is an HDFEnvironmentSource
+    start, periods: first datetime and number of timesteps to simulate (see OccupantModel.run)
+    """
+    def __init__(self, model_config, env, key=None, start=None, periods=None) -> None:
+        self.model_config = dict(model_config)
+        self.env = env
+        self.key = key
+        self.start = start
+        self.periods = periods
+
+    def run(self, rng):
+        """ Simulate one replication with the random generator rng, returns the results of OccupantModel.run """
+        model = OccupantModel(**self.model_config, rng=rng)
+        if hasattr(self.env, 'chunks'):
+            # Environment source streamed in chunks (e.g. HDFEnvironmentSource)
+            results = list(om_env_source.simulate(model, self.env.chunks(self.key, stop=self.periods), start=self.start))
+            return {var: np.concatenate([result[var] for result in results]) for var in results[0]}
+        return model.run(self.env, start=self.start, periods=self.periods)
+
+# Scenario of the worker process, set once by the pool initializer instead of pickling it with every replication
+_worker_scenario = None
+
+def _init_worker(scenario):
+    global _worker_scenario
+    _worker_scenario = scenario
+
+def _run_replication(seed_sequence):
+    return _worker_scenario.run(np.random.default_rng(seed_sequence))
+
+def run_ensemble(scenario, replications, seed=None, workers=None):
+    """ Simulate K replications of a scenario across a process pool
+
+    Replication k uses a generator seeded by the k-th child of SeedSequence(seed), so the results
+    only depend on seed and not on the number of workers or the order in which replications finish.
+    workers: number of worker processes (None: one per CPU, 1: run in the current process)
+
+    Returns a dict with the 'DateTime' of each timestep and, for each of the OUTPUT_VARIABLES,
+    an array of shape (replications, periods, N_occupants), and the 'seed' used
+    """
+    seed_sequence = np.random.SeedSequence(seed)
+    children = seed_sequence.spawn(replications)
+
+    if workers == 1:
+        results = [scenario.run(np.random.default_rng(child)) for child in children]
+    else:
+        # Load a model store and an init_data bundle before forking the workers, so they share the loaded data
+        if om_model_store.is_store(scenario.model_config.get('models')):
+            om_model_store.load_models(scenario.model_config['models'])
+        if om_init_data_store.is_bundle(scenario.model_config.get('init_data')):
+            om_init_data_store.load_init_data(scenario.model_config['init_data'])
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(scenario,)) as pool:
+            # map returns the results in the order of the replications
+            results = list(pool.map(_run_replication, children))
+
+    ensemble = {'DateTime':results[0]['DateTime'], 'seed':seed_sequence.entropy}
+    for var in OUTPUT_VARIABLES:
+        ensemble[var] = np.stack([result[var] for result in results])
+    return ensemble
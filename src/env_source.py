@@ -0,0 +1,98 @@
+""" env_source.py -> Streams environment inputs from large ecobee DyD HDF5 files without loading them in memory """
+
+# Import packages
+import queue
+import threading
+import pandas as pd
+import checkpoint as om_checkpoint
+
+# DyD columns needed by the occupant model (T_ctrl is the indoor temperature T_in)
+DYD_COLUMNS = ['DateTime', 'T_ctrl', 'T_stp_cool', 'T_stp_heat', 'hum', 'T_out', 'equip_run_heat', 'equip_run_cool']
+
+class HDFEnvironmentSource:
+    """ Environment source for DyD data stored in an HDF5 file in table format, one key per home
+
+    Only the needed columns are read, in time-ordered chunks of rows. Chunks of a home are read ahead
+    on a background thread while the model simulates the current chunk.
+    """
+    def __init__(self, path, keys=None, columns=DYD_COLUMNS, chunksize=288*30, prefetch=2) -> None:
+        self.path = path
+        self.columns = list(columns)
+        self.chunksize = chunksize # Rows per chunk (default: 30 days of 5-minute data)
+        self.prefetch = prefetch # Chunks read ahead of the consumer
+        with pd.HDFStore(self.path, mode='r') as store:
+            # Sub-nodes of a table (e.g. '/home/meta/...') are not homes
+            tables = [key for key in store.keys() if '/meta/' not in key]
+            self.keys = tables if keys is None else list(keys)
+            self.nrows = {key: store.get_storer(key).nrows for key in self.keys}
+
+    def read(self, key, start=0, stop=None):
+        """ Read rows [start, stop) of the needed columns for a home """
+        with pd.HDFStore(self.path, mode='r') as store:
+            return store.select(key, columns=self.columns, start=start, stop=stop)
+
+    def chunks(self, key, start=0, stop=None):
+        """ Iterate over the home's rows [start, stop) in chunks of chunksize rows, prefetched on a background thread """
+        stop = self.nrows[key] if stop is None else min(stop, self.nrows[key])
+        buffer = queue.Queue(maxsize=self.prefetch)
+        done = threading.Event()
+
+        def put(item):
+            # Wait for room in the buffer, unless the consumer stopped iterating
+            while not done.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def reader():
+            try:
+                with pd.HDFStore(self.path, mode='r') as store:
+                    for chunk_start in range(start, stop, self.chunksize):
+                        chunk = store.select(key, columns=self.columns, start=chunk_start,
+                                             stop=min(chunk_start + self.chunksize, stop))
+                        if not put(chunk):
+                            return
+            except Exception as error:
+                put(error)
+                return
+            put(None)
+
+        thread = threading.Thread(target=reader, daemon=True)
+        thread.start()
+        last_datetime = None
+        try:
+            while True:
+                chunk = buffer.get()
+                if chunk is None:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                # Chunks are fed to the model in order, the rows must be sorted by time
+                if 'DateTime' in chunk:
+                    if not chunk['DateTime'].is_monotonic_increasing or (last_datetime is not None and chunk['DateTime'].iloc[0] <= last_datetime):
+                        raise ValueError(f"Rows of {key} are not sorted by DateTime")
+                    last_datetime = chunk['DateTime'].iloc[-1] if len(chunk) else last_datetime
+                yield chunk.reset_index(drop=True)
+        finally:
+            done.set()
+            thread.join()
+
+def simulate(model, chunks, start=None, recorder=None, checkpoint_path=None):
+    """ Run an OccupantModel over a stream of environment chunks, yields the results of OccupantModel.run per chunk
+    start: datetime of the first timestep, later chunks continue from the model's clock
+    recorder: optional OutputRecorder the outputs are written to (the results are then None)
+    checkpoint_path: optional file the model state is saved to after each chunk (see checkpoint.save_checkpoint),
+                     a failed run is resumed by restoring it and streaming the rows from model.schedule.steps on
+    """
+    for chunk in chunks:
+        results = model.run(chunk, start=start, recorder=recorder)
+        if checkpoint_path is not None:
+            # The outputs on disk cover the checkpointed timesteps
+            if recorder is not None:
+                recorder.flush()
+            om_checkpoint.save_checkpoint(model, checkpoint_path)
+        yield results
+        start = None
@@ -0,0 +1,135 @@
+""" habitual_engine.py -> Compiled, vectorized samplers for the 1st and 2nd order markov chain habitual override models """
+
+# Import packages
+import numpy as np
+import tools as om_tools
+
+# Transition matrices are defined for 5-minute timesteps, i.e. 288 timesteps per day
+N_TIMESTEPS = 288
+TIMESTEP_MINUTES = 5
+
+# Labels of the 2nd order transition matrices (season_daytype)
+LABELS = ['cool_wd', 'cool_we', 'heat_wd', 'heat_we']
+
+def compile_habitual_tm(TM, order=1):
+    """ Convert a habitual transition matrix (DataFrame in the TM_habitual.csv format) into a dense probability tensor
+    order 1: columns time, cur_state, p_2_0, p_2_1 -> (timestep x current state x next state), shape (288, 2, 2)
+    order 2: columns timestep, prev_state, cur_state, p_2_0, p_2_1 -> (timestep x previous state x current state x next state),
+             shape (288, 2, 2, 2)
+    """
+    if order == 1:
+        timesteps = TM['time'].values.astype(int) - 1
+        states = [TM['cur_state'].values.astype(bool).astype(int)]
+    elif order == 2:
+        timesteps = TM['timestep'].values.astype(int) - 1
+        states = [TM['prev_state'].values.astype(bool).astype(int), TM['cur_state'].values.astype(bool).astype(int)]
+    else:
+        raise ValueError(f"Habitual model order should be 1 or 2, got {order}")
+    probs = TM.loc[:, 'p_2_0':'p_2_1'].values.astype(float)
+
+    # The markov models use the first row that matches a (timestep, state(s)) pair
+    cell = timesteps
+    for state in states:
+        cell = cell*2 + state
+    _, first_rows = np.unique(cell, return_index=True)
+    timesteps, states, probs = timesteps[first_rows], [state[first_rows] for state in states], probs[first_rows]
+
+    # Probability should add up to 1 (Rounding off leads to thousandth of difference from 1), same fix as the markov models
+    total = probs[:,0] + probs[:,1]
+    rounded = total != 1
+    probs[rounded,0] = probs[rounded,0] + np.abs(1 - total[rounded])
+
+    if (probs < 0).any() or (np.abs(probs.sum(axis=1) - 1) > 1e-8).any():
+        raise ValueError('Habitual transition probabilities must be non-negative and add up to 1')
+
+    tm = np.full((N_TIMESTEPS,) + (2,)*order + (2,), np.nan)
+    tm[(timesteps, *states)] = probs
+    if np.isnan(tm).any():
+        raise ValueError('Habitual transition matrix does not cover every timestep and state')
+    return tm
+
+class HabitualEngine:
+    """ Compiled habitual override model: Samples whole days of habitual overrides for many agents and days at once
+
+    TM: transition matrix DataFrame used for every day (1st order model, e.g. TM_habitual.csv), or dict of DataFrames
+        keyed by season_daytype label (see LABELS) for the 2nd order model
+    The transition matrices are compiled once into a (label, timestep, [previous state,] current state, next state) tensor.
+    A day is realized from order + 288 uniforms: the random start state(s), then one uniform per timestep, using the
+    same inverse CDF that np.random.choice applies in the markov models.
+    """
+    def __init__(self, TM, sampling_time, order=1) -> None:
+        if TIMESTEP_MINUTES % sampling_time != 0:
+            raise ValueError(f"Sampling time ({sampling_time} min) should divide the {TIMESTEP_MINUTES}-minute transition timestep")
+        self.order = order
+        self.sampling_time = sampling_time
+        self.repeat = int(TIMESTEP_MINUTES/sampling_time) # Timesteps per transition timestep
+        self.steps_per_day = N_TIMESTEPS*self.repeat
+
+        if isinstance(TM, dict):
+            self.labels = [label for label in LABELS if label in TM]
+            self.tm = np.stack([compile_habitual_tm(TM[label], order) for label in self.labels])
+        else:
+            self.labels = None
+            self.tm = compile_habitual_tm(TM, order)[np.newaxis]
+        # Next state is True when the uniform is at or above the normalized CDF of the False state
+        self.threshold = self.tm[..., 0]/(self.tm[..., 0] + self.tm[..., 1])
+
+    def label_index(self, current_datetime):
+        """ Index of the transition matrix used for the day of current_datetime """
+        if self.labels is None:
+            return 0
+        label = om_tools.get_season(current_datetime) + '_' + ('we' if om_tools.is_weekend(current_datetime) else 'wd')
+        return self.labels.index(label)
+
+    def draw_uniforms(self, size=(), rng=np.random):
+        """ Draw the uniforms needed to realize days of habitual overrides, shape: size + (order + 288,) """
+        return rng.random(tuple(np.atleast_1d(size).astype(int)) + (self.order + N_TIMESTEPS,))
+
+    def sample(self, label_index, uniforms):
+        """ Realize habitual overrides from pre-drawn uniforms
+
+        label_index: transition matrix index (see label_index), int or array broadcastable to uniforms.shape[:-1]
+        uniforms: array of shape (..., order + 288), e.g. (agents, days, order + 288)
+        Returns a bool array of shape (..., steps_per_day)
+        """
+        uniforms = np.asarray(uniforms)
+        label_index = np.broadcast_to(np.asarray(label_index, dtype=int), uniforms.shape[:-1])
+        states = np.empty(uniforms.shape[:-1] + (N_TIMESTEPS,), dtype=bool)
+
+        # Start state(s) are randomly selected
+        history = [(uniforms[..., i] >= 0.5).astype(int) for i in range(self.order)]
+        for timestep in range(N_TIMESTEPS):
+            next_state = uniforms[..., self.order + timestep] >= self.threshold[(label_index, timestep, *history)]
+            states[..., timestep] = next_state
+            history = history[1:] + [next_state.astype(int)]
+
+        return np.repeat(states, self.repeat, axis=-1)
+
+    def sample_days(self, current_datetimes, n_agents=1, rng=np.random):
+        """ Realize habitual overrides for n_agents over the days of current_datetimes
+        Returns a bool array of shape (n_agents, days, steps_per_day)
+        """
+        label_index = np.array([self.label_index(current_datetime) for current_datetime in current_datetimes])
+        uniforms = self.draw_uniforms((n_agents, label_index.size), rng=rng)
+        return self.sample(label_index[np.newaxis, :], uniforms)
+
+    def sample_day(self, current_datetime=None, rng=np.random):
+        """ Realize habitual overrides for the day starting at current_datetime, bool array of shape (steps_per_day,) """
+        label_index = 0 if current_datetime is None else self.label_index(current_datetime)
+        return self.sample(label_index, self.draw_uniforms(rng=rng))
+
+# HabitualEngines built by compiled_engine, keyed by (id of TM, sampling time, order), with a reference to TM.
+# Only the CACHE_SIZE most recently used engines are kept, so the TMs of past models are released
+CACHE_SIZE = 8
+_engines = {}
+
+def compiled_engine(TM, sampling_time, order=1):
+    """ HabitualEngine of TM, built once per TM, sampling time and order (TM is not to be modified afterwards) """
+    key = (id(TM), sampling_time, order)
+    entry = _engines.pop(key, None)
+    if entry is None or entry[0] is not TM:
+        entry = (TM, HabitualEngine(TM, sampling_time, order))
+    _engines[key] = entry
+    while len(_engines) > CACHE_SIZE:
+        del _engines[next(iter(_engines))]
+    return entry[1]
@@ -0,0 +1,148 @@
+""" init_data_store.py -> Stores the init_data tables (occupancy TMs, routine msc PMFs) in a single file, loaded memory mapped """
+
+# Import packages
+import json
+import mmap
+import os
+import pathlib
+import re
+import struct
+import zipfile
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+
+# Columns the models read from the tables, by table name
+SCHEMA = [(r'^occ_tm_w[de]$', ['Ten minute period number', 'Current state', 'Unoccup_prob', 'Occupied_prob']),
+          (r'^TM_habitual$', ['time', 'cur_state', 'p_2_0', 'p_2_1']),
+          (r'_Nmscpd$', ['N', 'prob']),
+          (r'_(2mscpd_tod1|1mscpd_tod)$', ['tod', 'prob']),
+          (r'_(2mscpd_type1|1mscpd_type|2mscpd_type2_type1_[a-z]+)$', ['types', 'prob']),
+          (r'_2mscpd_tod2_tod1$', ['tod']),
+          (r'_DOO1?_[a-z]+_type$', ['tod']),
+          (r'_DOO2_[a-z]+_type1_[a-z]+_type2$', ['doo'])]
+
+# init_data loaded by this process, keyed by bundle path
+_loaded = {}
+
+def check_init_data(init_data):
+    """ Check the tables of init_data (dict name -> DataFrame) against SCHEMA, raises a ValueError """
+    for name, table in init_data.items():
+        for pattern, columns in SCHEMA:
+            if re.search(pattern, name):
+                missing = [column for column in columns if column not in table.columns]
+                if missing:
+                    raise ValueError(f"init_data table {name} has no column {missing}")
+
+def _column_blocks(table):
+    """ Split a table into blocks of consecutive columns of the same dtype, list of (first column, 2-D array) """
+    blocks = []
+    for i, column in enumerate(table.columns):
+        values = table.iloc[:, i].values
+        if values.dtype == object:
+            if not all(isinstance(value, str) for value in values):
+                raise ValueError(f"Column {column} mixes strings and other values")
+            values = values.astype(str)
+        if blocks and blocks[-1][1][-1].dtype == values.dtype:
+            blocks[-1][1].append(values)
+        else:
+            blocks.append((i, [values]))
+    return [(first, np.asfortranarray(np.stack(columns, axis=1))) for first, columns in blocks]
+
+def save_init_data(init_data, path):
+    """ Save the tables of init_data (dict name -> DataFrame) in a single bundle file (uncompressed npz, no pickled objects)
+
+    Consecutive columns of a table with the same dtype are stored as one column-major 2-D array (strings as
+    fixed-width unicode), so the numeric columns can be memory mapped. Returns the path of the bundle.
+    """
+    check_init_data(init_data)
+    tables, arrays = {}, {}
+    for name, table in sorted(init_data.items()):
+        try:
+            blocks = _column_blocks(table)
+        except ValueError as error:
+            raise ValueError(f"init_data table {name}: {error}") from None
+        for k, (first, values) in enumerate(blocks):
+            arrays[f"{name}/{k}"] = values
+        tables[name] = {'columns':[str(column) for column in table.columns], 'rows':len(table),
+                        'blocks':[[first, values.shape[1], values.dtype.str] for first, values in blocks]}
+    meta = {'format_version':FORMAT_VERSION, 'tables':tables}
+    path = pathlib.Path(path)
+    path = path if path.suffix == '.npz' else path.with_name(path.name + '.npz')
+    np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+    return path
+
+def convert_csv_dir(csv_dir, path):
+    """ Convert the csv tables of csv_dir (e.g. input_data/csv, one table per file named after its key) into a bundle """
+    init_data = {csv_file.stem: pd.read_csv(csv_file) for csv_file in sorted(pathlib.Path(csv_dir).glob('*.csv'))}
+    if not init_data:
+        raise FileNotFoundError(f"No tables (*.csv) found in {csv_dir}")
+    return save_init_data(init_data, path)
+
+def is_bundle(init_data):
+    """ True if init_data refers to a bundle file instead of a dict of tables """
+    return isinstance(init_data, (str, os.PathLike))
+
+def _member_offset(buffer, info):
+    """ Offset of the array data of an uncompressed npz member in the file """
+    # The member follows its local file header (30 bytes, the file name and an extra field)
+    name_length, extra_length = struct.unpack_from('<HH', buffer, info.header_offset + 26)
+    start = info.header_offset + 30 + name_length + extra_length
+    # .npy header: magic string and version (8 bytes), header length (2 bytes in version 1, 4 bytes after) and header
+    if buffer[start + 6] == 1:
+        return start + 10 + struct.unpack_from('<H', buffer, start + 8)[0]
+    return start + 12 + struct.unpack_from('<I', buffer, start + 8)[0]
+
+def load_init_data(path, mmap_mode='r'):
+    """ Load the tables of a bundle saved by save_init_data, once per process
+
+    With mmap_mode='r' the numeric columns are views of the memory mapped file (read-only), so the processes using
+    the bundle share its pages in the OS page cache. String columns are converted to python objects for pandas.
+    mmap_mode=None reads the arrays into memory.
+    Returns init_data, a dict of DataFrames (shared by the models of the process, not to be modified)
+    """
+    key = (str(pathlib.Path(path).resolve()), mmap_mode)
+    if key in _loaded:
+        return _loaded[key]
+
+    with zipfile.ZipFile(path) as bundle, open(path, 'rb') as file:
+        with bundle.open('meta.npy') as member:
+            meta = json.loads(np.lib.format.read_array(member, allow_pickle=False).item())
+        if meta['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported init_data bundle format version {meta['format_version']}")
+        buffer = None
+        if mmap_mode is not None:
+            if mmap_mode != 'r':
+                raise ValueError("init_data bundles are memory mapped read-only, use mmap_mode='r' or None")
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        init_data = {}
+        for name, table in meta['tables'].items():
+            blocks = []
+            for k, (first, n_columns, dtype) in enumerate(table['blocks']):
+                info = bundle.getinfo(f"{name}/{k}.npy")
+                shape = (table['rows'], n_columns)
+                if buffer is not None and info.compress_type == zipfile.ZIP_STORED:
+                    values = np.frombuffer(buffer, dtype=dtype, count=shape[0]*shape[1],
+                                           offset=_member_offset(buffer, info)).reshape(shape, order='F')
+                else:
+                    with bundle.open(info) as member:
+                        values = np.lib.format.read_array(member, allow_pickle=False)
+                if values.shape != shape or values.dtype != np.dtype(dtype):
+                    raise ValueError(f"Block {k} of init_data table {name} is {values.dtype}{values.shape}, expected {dtype}{shape}")
+                blocks.append((first, values.astype(object) if values.dtype.kind == 'U' else values))
+
+            # The frame is built on its largest block (no copy), the columns of the other blocks are inserted in order
+            columns = table['columns']
+            largest = max(range(len(blocks)), key=lambda k: blocks[k][1].shape[1])
+            first, values = blocks[largest]
+            frame = pd.DataFrame(values, columns=columns[first:first + values.shape[1]], copy=False)
+            for k, (first, values) in enumerate(blocks):
+                if k != largest:
+                    for j in range(values.shape[1]):
+                        frame.insert(first + j, columns[first + j], values[:, j])
+            init_data[name] = frame
+    check_init_data(init_data)
+    _loaded[key] = init_data
+    return init_data
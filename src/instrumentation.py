@@ -0,0 +1,96 @@
+""" instrumentation.py -> Event log, per-phase timers and counters for profiling simulations """
+
+# Import packages
+import logging
+import time
+from collections import defaultdict
+
+# Event levels, same values as the logging module
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+
+# Simulation phases timed by the occupant models
+PHASES = ['occupancy', 'routine', 'discomfort', 'override', 'setpoints']
+
+class Instrumentation:
+    """ Instrumentation of a simulation: structured, levelled event log, per-phase timers and counters
+
+    Everything is off by default. When disabled, each hook costs an attribute check:
+    - level: minimum level of the events to record (e.g. INFO), None disables the event log
+    - timers: True to time the simulation phases and count events
+    - logger: optional logging.Logger the recorded events are also forwarded to
+    """
+    def __init__(self, level=None, timers=False, logger=None) -> None:
+        self.level = level
+        self.timers = timers
+        self.logger = logger
+        self.events = [] # Recorded events: dicts with level, event name and fields
+        self.phase_time = defaultdict(float) # Seconds spent per phase
+        self.phase_calls = defaultdict(int) # Number of times each phase ran
+        self.counters = defaultdict(int) # Event counters
+
+    def is_enabled(self, level):
+        """ True if events of level are recorded """
+        return self.level is not None and level >= self.level
+
+    def event(self, level, name, **fields):
+        """ Record an event, fields are stored as is (e.g. occupant ID, datetime, setpoints) """
+        if self.level is None or level < self.level:
+            return
+        record = {'level':logging.getLevelName(level), 'event':name, **fields}
+        self.events.append(record)
+        if self.logger is not None:
+            self.logger.log(level, '%s %s', name, fields)
+
+    def tic(self):
+        """ Start timing a phase, returns None when the timers are disabled """
+        if self.timers:
+            return time.perf_counter()
+        return None
+
+    def toc(self, phase, tic):
+        """ Stop timing a phase started with tic """
+        if tic is not None:
+            self.phase_time[phase] += time.perf_counter() - tic
+            self.phase_calls[phase] += 1
+
+    def count(self, name, n=1):
+        """ Increase the counter name by n """
+        if self.timers:
+            self.counters[name] += n
+
+    def reset(self):
+        """ Clear the recorded events, timers and counters """
+        self.events = []
+        self.phase_time.clear()
+        self.phase_calls.clear()
+        self.counters.clear()
+
+    def summary(self):
+        """ Summary of the run: time and calls per phase, counters and number of events per level """
+        events_per_level = defaultdict(int)
+        for record in self.events:
+            events_per_level[record['level']] += 1
+        return {'phases':{phase: {'seconds':self.phase_time[phase], 'calls':self.phase_calls[phase]} for phase in self.phase_time},
+                'counters':dict(self.counters),
+                'events':dict(events_per_level)}
+
+    def report(self):
+        """ Summary of the run as text """
+        summary = self.summary()
+        total = sum(phase['seconds'] for phase in summary['phases'].values())
+        lines = [f"{'Phase':<12}{'Calls':>12}{'Seconds':>12}{'Share':>8}"]
+        for phase, timing in sorted(summary['phases'].items(), key=lambda item: -item[1]['seconds']):
+            share = timing['seconds']/total if total else 0
+            lines.append(f"{phase:<12}{timing['calls']:>12}{timing['seconds']:>12.4f}{share:>8.1%}")
+        if summary['counters']:
+            lines.append('Counters:')
+            lines.extend(f"  {name}: {value}" for name, value in sorted(summary['counters'].items()))
+        if summary['events']:
+            lines.append('Events:')
+            lines.extend(f"  {level}: {value}" for level, value in summary['events'].items())
+        return '\n'.join(lines)
+
+# Shared disabled instrumentation, default of the functions and classes that accept one
+DISABLED = Instrumentation()
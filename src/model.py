@@ -1,8 +1,30 @@
 """ model.py -> Contains basic framework to simulate an occupant agent for a given set of environment inputs """
 
 # Import packages
+import datetime
+import os
+import numpy as np
 import mesa
 import tools as om_tools
+import occupancy_engine as om_occupancy
+import routine_engine as om_routine
+import population as om_population
+import instrumentation as om_instrumentation
+import rng_streams as om_rng_streams
+import discomfort_ml as om_discomfort_ml
+import discomfort as om_discomfort
+import model_store as om_model_store
+import init_data_store as om_init_data_store
+import schedule_bank as om_schedule_bank
+import schedule_store as om_schedule_store
+import sim_clock as om_sim_clock
+
+# Environment variables passed to the occupants, with the ecobee DyD column names accepted as aliases
+ENV_VARIABLES = {'T_in':['T_in','T_ctrl'], 'T_stp_cool':['T_stp_cool'], 'T_stp_heat':['T_stp_heat'], 'hum':['hum'],
+                 'T_out':['T_out'], 'equip_run_heat':['equip_run_heat'], 'equip_run_cool':['equip_run_cool']}
+# Simulation outputs per occupant
+OUTPUT_VARIABLES = ['Motion', 'T_stp_cool', 'T_stp_heat', 'Thermal Frustration', 'Comfort Delta', 'Habitual override', 'Discomfort override']
+OUTPUT_DTYPES = {var: bool if var in ['Motion', 'Habitual override', 'Discomfort override'] else float for var in OUTPUT_VARIABLES}
 
 # Occupant agent class
 class Occupant(mesa.Agent):
@@ -10,86 +32,116 @@ class Occupant(mesa.Agent):
     def __init__(self, unique_id: int, model, home_ID,units, init_data, models,
                 comfort_temperature, discomfort_theory_name='czt', threshold={'UL':4,'LL':-4},
                 TFT_alpha=1, TFT_beta=1, start_datetime=om_tools.datetime.datetime(1996,3,30,0,0),
-                tstat_db=0.0) -> None:
+                tstat_db=0.0, occupant_ID=0, record_frustration=False) -> None:
         
         super().__init__(unique_id, model)
         self.home_ID = home_ID # Occupant's residence
+        self.occupant_ID = occupant_ID # Occupant's number in the residence
         self.units = units # Temperature units followed by the occupant
         self.current_env_features = None # Place holder variable to contain environment info for each timestep
         self.recent_stp_change = False # Flag to show if the change in setpoint was implemented by the occupant
         self.init_data = init_data # Initial data dictionary containing TM's and PDFs/PMFs
-        self.occupancy = None # Occupancy Model - Place holder variable to contain simulated occupancy for a simulation's day
-        self.routine_msc_schedule = None # Routine Model - Place holder variable to contain simulated routine for a simulation's day
+        self.occupancy = None # Occupancy Model - Place holder variable to contain simulated occupancy for a simulation's day, indexed by timestep of the day
+        self.routine_msc = None # Routine Model - Place holder variable to flag the simulated routine mscs for a simulation's day, indexed by timestep of the day
+        self.routine_delT_cool = None # Routine Model - Change in cooling setpoint per timestep of the day
+        self.routine_delT_heat = None # Routine Model - Change in heating setpoint per timestep of the day
         if self.units == 'C':
             self.T_CT = om_tools.C_to_F(comfort_temperature) # Track comfort temperature
         else:
             self.T_CT = comfort_temperature
         self.override_theory = discomfort_theory_name.upper() # Override theory name
-        self.last_override_datetime = start_datetime # Time since the last override
+        self.last_override_step = model.clock.index(start_datetime) # Timestep (clock tick) of the last override
         self.tstat_db = tstat_db
+        # Thermal frustration tracker (stays at 0 for CZT), keeps only the current value unless record_frustration
+        self.frustration = om_discomfort.FrustrationTracker(TFT_alpha, TFT_beta, threshold, record_history=record_frustration)
 
         # Discomfort model - Initialize parameters
         if self.override_theory == 'TFT':
             self.TFT_alpha = TFT_alpha
             self.TFT_beta = TFT_beta
             self.tf_threshold = threshold # degree F minutes
-            self.thermal_frustration =[0] # Initialize thermal frustration tracker        
         elif self.override_theory == 'CZT':
             self.cz_threshold = threshold # degree F
 
         self.discomfort_class_model = models['model_classification']
         self.discomfort_regres_model = models['model_regressor']
+        if self.override_theory == 'ML':
+            # Override classifier and time to override regressor, with the TTO countdown of the occupant
+            self.ml_discomfort = om_discomfort_ml.MLDiscomfort(self.discomfort_class_model, self.discomfort_regres_model)
 
         # Simulation output container
         self.output = {'Motion':None, 'T_stp_cool':None, 'T_stp_heat':None, 'Thermal Frustration': None, 'Comfort Delta': None, 'Habitual override':False, 'Discomfort override':False}
-        print(f"Occupant created,\nID: {unique_id}\nDiscomfort theory: {self.override_theory}")
+        model.instrumentation.event(om_instrumentation.INFO, 'occupant_created', unique_id=unique_id, home_ID=home_ID,
+                                    discomfort_theory=self.override_theory)
 
     def step(self) -> None:
-        print(f"Occupant idN: {self.unique_id} simulation started")
-        season = om_tools.get_season(self.current_env_features['DateTime'])
+        instrumentation = self.model.instrumentation
+        instrumentation.event(om_instrumentation.DEBUG, 'occupant_step_started', unique_id=self.unique_id)
+        clock = self.model.clock
+        season = clock.season
         if season == 'heat' or season == 'cool':
             # Initialize the output dictionary to avoid errors
             self.output['Habitual override'] = False
             self.output['Discomfort override'] = False
 
-            # Send simulated indoor env data to the occupant agent
-            if self.units == 'C':
-                vars_2_convert = [key for key in self.current_env_features.keys() if 'T_' in key]
-                for var in vars_2_convert:
-                        self.current_env_features[var] = om_tools.C_to_F(self.current_env_features[var])
+            # Simulated indoor env data is sent to the occupant agent in degree F (converted by OccupantModel)
             """ 
             +-------------------+
             | Model predictions |
             +-------------------+
             """
-            # Generate data for the day at midnight
-            if (self.current_env_features['DateTime'].hour == 0) & (self.current_env_features['DateTime'].minute == 0):
-                # Generate occupancy data at midnight for the next day
-                self.occupancy = om_tools.Markov_occupancy_model(
-                                                                init_data= self.init_data,
-                                                                sampling_time = self.model.sampling_frequency,
-                                                                current_datetime=self.current_env_features['DateTime']
-                                                                )
-
-                # Generate habitual override data at midnight for the next day
-                self.routine_msc_schedule = om_tools.realize_routine_msc(
-                                                                        init_data=self.init_data,
-                                                                        occupancy_schedule= self.occupancy,
-                                                                        current_datetime=self.current_env_features['DateTime']
-                                                                        )
+            # Timestep of the day, index of the day's occupancy and routine schedules
+            timestep = clock.timestep_day
+
+            # Generate data for the day at midnight (or at the first step if the simulation starts within a day)
+            if timestep == 0 or self.occupancy is None:
+                # Random generator for the day: the occupant's own stream if the model has a run_seed
+                rng = self.model.day_rng(self.home_ID, self.occupant_ID, self.current_env_features['DateTime'])
+
+                if self.model.schedule_bank is not None:
+                    # Draw the day's occupancy and routine msc schedules from the schedule bank
+                    tic = instrumentation.tic()
+                    bank = self.model.schedule_bank
+                    self.occupancy, self.routine_msc, self.routine_delT_cool, self.routine_delT_heat = bank.day_schedules(
+                                                                            self.current_env_features['DateTime'], bank.draw(rng=rng))
+                    instrumentation.toc('schedule_bank', tic)
+                else:
+                    # Generate occupancy data at midnight for the next day
+                    tic = instrumentation.tic()
+                    occupancy_engine = self.model.occupancy_engine
+                    self.occupancy = occupancy_engine.sample(clock.weekend, occupancy_engine.draw_uniforms(rng=rng))
+                    instrumentation.toc('occupancy', tic)
+
+                    # Generate habitual override data at midnight for the next day
+                    tic = instrumentation.tic()
+                    self.routine_msc, self.routine_delT_cool, self.routine_delT_heat = om_routine.routine_msc_arrays(
+                                                                            *om_routine.realize_routine_msc(
+                                                                                                            routine_data=self.model.routine_data,
+                                                                                                            occupancy=self.occupancy,
+                                                                                                            current_datetime=self.current_env_features['DateTime'],
+                                                                                                            sampling_time=self.model.sampling_frequency,
+                                                                                                            rng=rng,
+                                                                                                            label=clock.label
+                                                                                                            ),
+                                                                            sampling_time=self.model.sampling_frequency
+                                                                            )
+                    instrumentation.toc('routine', tic)
+
+                if self.model.schedule_store is not None:
+                    self.model.schedule_store.record_day(self.current_env_features['DateTime'], self.occupancy, self.routine_msc,
+                                                         self.routine_delT_cool, self.routine_delT_heat, agents=[self.unique_id])
 
             # Get current heating and cooling setpoint
             T_stp_cool, T_stp_heat = (self.current_env_features['T_stp_cool'], self.current_env_features['T_stp_heat'])
             
             # The occupant only feels discomfort if they are present in the home
-            if self.occupancy.loc[self.occupancy.datetime.values == self.current_env_features['DateTime'],'occupancy'].values[0]:
+            if self.occupancy[timestep]:
             
                 # Discomfort Model:
                 # Prepare input data for ML
-                self.current_env_features['mo'] = self.occupancy.loc[
-                                                                    self.occupancy.datetime == self.current_env_features['DateTime'],'occupancy'
-                                                                    ].values[0]
+                self.current_env_features['mo'] = self.occupancy[timestep]
 
+                tic = instrumentation.tic()
                 if self.override_theory == 'CZT':
                     discomfort_override = om_tools.comfort_zone_theory(
                                                                         del_tin_tct = self.current_env_features['T_in'] - self.T_CT,
@@ -97,25 +149,13 @@ class Occupant(mesa.Agent):
                                                                         )
 
                 elif self.override_theory == 'TFT':
-                    discomfort_override = om_tools.frustration_theory(
-                                                                        del_tin_tct=self.current_env_features['T_in'] - self.T_CT,
-                                                                        alpha=self.TFT_alpha, beta=self.TFT_beta,
-                                                                        thermal_frustration=self.thermal_frustration, 
-                                                                        tf_threshold=self.tf_threshold
-                                                                        )
+                    discomfort_override = self.frustration.step(del_tin_tct=self.current_env_features['T_in'] - self.T_CT)
 
-                # # Decrease the timer per timestep if a TTO value exists
-                # if self.TTO == 0:
-                #     raise ValueError('Check TTO')
-                # if self.TTO:
-                #     self.TTO =- 1
-                
-                # # Classify override using the random forest classification model
-                # is_override = self.discomfort_class_model.predict([list(self.current_env_features.values())])[0]
-                
-                # if is_override:
-                #     # Estimate time to override for the classified override using the random forest regressor model
-                #     self.TTO = int(om_tools.np.round(self.discomfort_regres_model.predict([list(self.current_env_features.values())])))
+                elif self.override_theory == 'ML':
+                    # Override when the time to override estimated at the onset of discomfort has elapsed
+                    # (backend='population' classifies all the occupants of a timestep in one batch)
+                    discomfort_override = bool(self.ml_discomfort.step(self.current_env_features, occupied=[True])[0])
+                instrumentation.toc('discomfort', tic)
 
                 """ 
                 +---------------------------+
@@ -124,16 +164,11 @@ class Occupant(mesa.Agent):
                 """
                             
                 # If routine based habitual model predicts override and the occupant is present in the home: then decide the setpoint change
-                if self.current_env_features['DateTime'] in self.routine_msc_schedule.datetime.values:
-
-                    DOMSC_cool = self.routine_msc_schedule.loc[
-                                                                self.routine_msc_schedule.datetime == self.current_env_features['DateTime'],
-                                                                ['delT_cool','delT_heat']
-                                                                ].values[0][0]
-                    DOMSC_heat = self.routine_msc_schedule.loc[
-                                                                self.routine_msc_schedule.datetime == self.current_env_features['DateTime'],
-                                                                ['delT_cool','delT_heat']
-                                                                ].values[0][1]
+                tic = instrumentation.tic()
+                if self.routine_msc[timestep]:
+
+                    DOMSC_cool = self.routine_delT_cool[timestep]
+                    DOMSC_heat = self.routine_delT_heat[timestep]
                 
                     T_stp_cool, T_stp_heat = om_tools.decide_heat_cool_stp(
                                                                             DOMSC_cool,DOMSC_heat,\
@@ -141,11 +176,14 @@ class Occupant(mesa.Agent):
                                                                             self.current_env_features['T_stp_cool'],
                                                                             current_datetime= self.current_env_features['DateTime'],
                                                                             tstat_db = self.tstat_db,
-                                                                            temp_units=self.units                                                                                                                                                    
+                                                                            temp_units=self.units,
+                                                                            instrumentation=instrumentation
                                                                             )
-                    self.last_override_datetime =  self.current_env_features['DateTime'] # Update the last override time
+                    self.last_override_step = clock.tick # Update the last override time
                     self.output['Habitual override'] = True
-                    print('Occupant decides to override: Routine override')
+                    instrumentation.count('habitual_override')
+                    instrumentation.event(om_instrumentation.INFO, 'habitual_override', unique_id=self.unique_id,
+                                          datetime=self.current_env_features['DateTime'], T_stp_cool=T_stp_cool, T_stp_heat=T_stp_heat)
 
                 elif discomfort_override:
                     # Decide the setpoint change
@@ -159,46 +197,45 @@ class Occupant(mesa.Agent):
                         del_T_MSC = self.T_CT - self.current_env_features['T_in']
                         DOMSC_cool = del_T_MSC
                         DOMSC_heat = del_T_MSC
-                    if (self.current_env_features['DateTime'] - self.last_override_datetime).seconds > 300:
+                    # Elapsed time since the last override, wrapped to the day like timedelta.seconds
+                    if (clock.tick - self.last_override_step)*clock.step_seconds % 86400 > 300:
                         T_stp_cool, T_stp_heat = om_tools.decide_heat_cool_stp(
                                                                                 DOMSC_cool,DOMSC_heat,\
                                                                                 self.current_env_features['T_stp_heat'],
                                                                                 self.current_env_features['T_stp_cool'],
                                                                                 current_datetime= self.current_env_features['DateTime'],
                                                                                 tstat_db = self.tstat_db,
-                                                                                temp_units=self.units                                                                                                                                                    
+                                                                                temp_units=self.units,
+                                                                                instrumentation=instrumentation
                                                                             )
-                        self.last_override_datetime =  self.current_env_features['DateTime'] # Update the last override time
+                        self.last_override_step = clock.tick # Update the last override time
                         self.output['Discomfort override'] = True
-                        print('Occupant decides to override: Discomfort override')
-
-                    # if self.TTO == 0 and self.occupancy[self.model.timestep_day]:
-                    #     T_stp_cool, T_stp_heat = om_tools.decide_heat_cool_stp(self.occupant.T_CT, self.current_env_features['T_in'],\
-                    #          self.current_env_features['T_stp_heat'], self.current_env_features['T_stp_cool'])
-                    #     self.TTO = None
-                    
-                    # if self.occupancy[self.model.timestep_day] and is_override:
-                    #     T_stp_cool, T_stp_heat = om_tools.decide_heat_cool_stp(self.T_CT, self.current_env_features['T_in'],\
-                    #              self.current_env_features['T_stp_heat'], self.current_env_features['T_stp_cool'])
+                        instrumentation.count('discomfort_override')
+                        instrumentation.event(om_instrumentation.INFO, 'discomfort_override', unique_id=self.unique_id,
+                                              datetime=self.current_env_features['DateTime'], T_stp_cool=T_stp_cool, T_stp_heat=T_stp_heat)
+                instrumentation.toc('override', tic)
             else:
-                self.thermal_frustration =[0] # Reset thermal frustration if the occupant is not present in the home
+                self.frustration.reset() # Reset thermal frustration if the occupant is not present in the home
+                if self.override_theory == 'ML':
+                    self.ml_discomfort.reset() # The pending override is dropped when the occupant leaves the home
 
+            tic = instrumentation.tic()
             if self.units == 'C':
                 T_stp_cool, T_stp_heat = om_tools.check_setpoints(om_tools.F_to_C(T_stp_cool), om_tools.F_to_C(T_stp_heat),
-                                                          self.current_env_features['DateTime'],tstat_db = self.tstat_db,temp_units=self.units)
+                                                          self.current_env_features['DateTime'],tstat_db = self.tstat_db,temp_units=self.units,
+                                                          instrumentation=instrumentation)
                 self.output['T_stp_cool'] = T_stp_cool
                 self.output['T_stp_heat'] = T_stp_heat
             else: 
                 T_stp_cool, T_stp_heat = om_tools.check_setpoints(om_tools.F_to_C(T_stp_cool), om_tools.F_to_C(T_stp_heat),
-                                                          self.current_env_features['DateTime'],tstat_db = self.tstat_db,temp_units=self.units)
+                                                          self.current_env_features['DateTime'],tstat_db = self.tstat_db,temp_units=self.units,
+                                                          instrumentation=instrumentation)
                 self.output['T_stp_cool'] = T_stp_cool
                 self.output['T_stp_heat'] = T_stp_heat
+            instrumentation.toc('setpoints', tic)
             
-            self.output['Motion'] = self.occupancy.loc[
-                                                        self.occupancy.datetime == self.current_env_features['DateTime'],
-                                                        'occupancy'
-                                                        ].values[0]
-            self.output['Thermal Frustration'] = self.thermal_frustration[-1]
+            self.output['Motion'] = self.occupancy[timestep]
+            self.output['Thermal Frustration'] = self.frustration.value
             self.output['Comfort Delta'] = self.current_env_features['T_in'] - self.T_CT
         else:
             self.output = {'Motion':False,
@@ -209,7 +246,7 @@ class Occupant(mesa.Agent):
                             'Habitual override':False,
                             'Discomfort override':False}
             pass
-        print(f"Occupant idN: {self.unique_id} simulation completed")
+        instrumentation.event(om_instrumentation.DEBUG, 'occupant_step_completed', unique_id=self.unique_id)
 
 class OccupantModel(mesa.Model):
     '''
@@ -222,50 +259,304 @@ class OccupantModel(mesa.Model):
     2. Run the model: TODO
     3. Return occupant data: TODO
 
-    Uses the Occupant class to simulate occupants in a home
+    Uses the Occupant class to simulate occupants in a home, or with backend='population' the
+    OccupantPopulation class that simulates all the occupants at once using arrays (outputs in self.population.output)
     '''
     def __init__(self, units, N_homes,N_occupants_in_home, sampling_frequency,
                  models, init_data,  comfort_temperature, discomfort_theory_name,
-                 threshold, TFT_alpha, TFT_beta, start_datetime, tstat_db) -> None:
+                 threshold, TFT_alpha, TFT_beta, start_datetime, tstat_db, backend='agents', instrumentation=None, rng=None,
+                 run_seed=None, n_variants=1, schedule_bank=None, record_schedules=False,
+                 record_frustration=False) -> None:
         '''
         Intialize the model for occupant(s) in home(s)
+        instrumentation: optional Instrumentation (event log, phase timers and counters), disabled by default
+        rng: random generator of the stochastic models (e.g. np.random.default_rng(seed)), defaults to the global np.random state
+        models: dict of the ML models ('model_classification', 'model_regressor'), or the directory of a model store
+                (see model_store), loaded memory mapped once per process
+        init_data: dict of the occupancy TMs and routine msc PMF tables, or the path of an init_data bundle
+                   (see init_data_store), loaded memory mapped once per process
+        run_seed: if given, each occupant draws its schedules from its own stream per day, derived from
+                  (run_seed, home_ID, occupant ID, date), so any day can be regenerated with rng_streams.regenerate_day
+        n_variants: with backend='population', number of parameter variants of every occupant sharing its schedules
+                    (see sweep), the occupant parameters are then arrays with one value per occupant and variant
+        schedule_bank: optional schedule_bank.ScheduleBank (or the path of a saved one) the occupants draw their daily
+                       occupancy and routine schedules from, instead of sampling them every midnight
+        record_schedules: keep the daily occupancy and routine schedules of every occupant in self.schedule_store
+                          (schedule_store.ScheduleStore, bit-packed occupancy and sparse msc events)
+        record_frustration: with backend='agents', keep the history of each occupant's thermal frustration
+                            (occupant.frustration.history), the outputs hold its value at every timestep
         '''
         super().__init__() # Initialize the mesa model
 
+        # Random generator used by the occupancy and routine models
+        self.rng = np.random if rng is None else rng
+        self.streams = None if run_seed is None else om_rng_streams.OccupantStreams(run_seed)
+
+        # Discomfort ML models
+        if om_model_store.is_store(models):
+            models = om_model_store.load_models(models)
+        # Occupancy TMs and routine msc PMFs
+        if om_init_data_store.is_bundle(init_data):
+            init_data = om_init_data_store.load_init_data(init_data)
+
+        # Event log, per-phase timers and counters
+        self.instrumentation = om_instrumentation.Instrumentation() if instrumentation is None else instrumentation
+
         # Temperature units
         self.units = units.upper()
         # Number of occupants to be simulated in a home
         self.N_occupants_in_home = N_occupants_in_home
         # Number of homes to be simulated
         self.N_homes = N_homes
+        # Number of parameter variants of each occupant (outputs are ordered by variant, then home and occupant)
+        self.n_variants = n_variants
         # Type of schedule to be used to trigger occupants to react
         self.schedule = mesa.time.BaseScheduler(self)
         # The data/simulated needs to be simulated at the following frequency
         self.sampling_frequency = sampling_frequency
+        # Datetime of the first timestep
+        self.start_datetime = start_datetime
+
+        # Simulation clock: integer timesteps from midnight of the first day, with the calendar of the simulated days
+        # (the timestep of the day runs from 0 to 287 for 5-min sampling frequency), starts at the timestep of start_datetime
+        self.clock = om_sim_clock.SimClock(start_datetime, sampling_frequency)
+        self.steps_per_day = self.clock.steps_per_day
+
+        # Occupancy and routine models compiled once and shared by all the occupants
+        self.occupancy_engine = om_occupancy.OccupancyEngine(init_data=init_data, sampling_time=sampling_frequency)
+        self.routine_data = om_routine.compile_routine_data(init_data)
+
+        # Pre-sampled daily schedules, the model refreshes its own copy of the bank
+        if isinstance(schedule_bank, (str, os.PathLike)):
+            schedule_bank = om_schedule_bank.ScheduleBank.load(schedule_bank)
+        self.schedule_bank = None if schedule_bank is None else schedule_bank.copy()
+        if self.schedule_bank is not None and self.schedule_bank.sampling_time != sampling_frequency:
+            raise ValueError(f"The schedule bank was sampled every {self.schedule_bank.sampling_time} min, the model runs every {sampling_frequency} min")
 
-        # Simulation's equivalent of timestep of the day (for 5-min sampling frequency, max value of this var is 288)
-        self.timestep_day = 0
+        # History of the occupants' daily schedules (the variants of an occupant share its schedules)
+        self.schedule_store = None
+        if record_schedules:
+            self.schedule_store = om_schedule_store.ScheduleStore(N_homes*N_occupants_in_home, start_datetime, sampling_frequency)
 
-        # Create homes
-        for home_ID in range(0, N_homes):
-            for occup_ID in range(0,self.N_occupants_in_home):
+        # Simulation backend: 'agents' (one mesa agent per occupant) or 'population' (struct of arrays)
+        self.backend = backend.lower()
+        self.population = None
+        if self.backend == 'population':
+            self.population = om_population.OccupantPopulation(occupancy_engine=self.occupancy_engine, routine_data=self.routine_data,
+                                                              home_ID=np.tile(np.repeat(np.arange(N_homes), N_occupants_in_home), n_variants),
+                                                              units=self.units, comfort_temperature=comfort_temperature,
+                                                              discomfort_theory_name=discomfort_theory_name, threshold=threshold,
+                                                              TFT_alpha=TFT_alpha, TFT_beta=TFT_beta, start_datetime=start_datetime, tstat_db=tstat_db,
+                                                              models=models, instrumentation=self.instrumentation, streams=self.streams,
+                                                              occupant_ID=np.tile(np.arange(N_occupants_in_home), N_homes*n_variants),
+                                                              n_variants=n_variants, schedule_bank=self.schedule_bank,
+                                                              schedule_store=self.schedule_store)
+        elif self.backend == 'agents':
+            if n_variants != 1:
+                raise ValueError("Parameter variants require backend='population'")
+            # Create homes
+            for home_ID in range(0, N_homes):
+                for occup_ID in range(0,self.N_occupants_in_home):
                 
-                # Create occupant
-                occup = Occupant(unique_id=home_ID + occup_ID, model=self, home_ID=home_ID, units=self.units,\
-                                models=models, init_data=init_data, comfort_temperature=comfort_temperature,\
-                                discomfort_theory_name=discomfort_theory_name, threshold=threshold,\
-                                TFT_alpha=TFT_alpha,TFT_beta=TFT_beta, start_datetime=start_datetime, tstat_db = tstat_db)
+                    # Create occupant
+                    occup = Occupant(unique_id=home_ID*self.N_occupants_in_home + occup_ID, model=self, home_ID=home_ID, units=self.units,\
+                                    models=models, init_data=init_data, comfort_temperature=comfort_temperature,\
+                                    discomfort_theory_name=discomfort_theory_name, threshold=threshold,\
+                                    TFT_alpha=TFT_alpha,TFT_beta=TFT_beta, start_datetime=start_datetime, tstat_db = tstat_db,
+                                    occupant_ID=occup_ID, record_frustration=record_frustration)
 
-                # Add occupant to the scheduler
-                self.schedule.add(occup)
+                    # Add occupant to the scheduler
+                    self.schedule.add(occup)
+        else:
+            raise ValueError(f"Unknown backend: {backend}, use 'agents' or 'population'")
+
+    @property
+    def timestep_day(self):
+        """ Timestep of the day of the next step, index of the occupants' daily schedules """
+        return self.clock.timestep_day
+
+    def day_rng(self, home_ID, occupant_ID, current_datetime):
+        """ Random generator of an occupant's schedules for the day of current_datetime """
+        if self.streams is None:
+            return self.rng
+        return self.streams.day(home_ID, occupant_ID, current_datetime)
 
     def step(self, ip_data_env) -> None:
-        print(f"OCcupant simulation started for timestep: {self.schedule.steps}")
-        for agent in self.schedule.agents:
-            agent.current_env_features = ip_data_env
-        
-        self.schedule.step()
+        # Convert the temperatures to degree F once for all the occupants (the caller's dict is not modified)
+        self._step(om_tools.convert_env_to_F(ip_data_env, self.units))
+
+    def _step(self, ip_data_env) -> None:
+        """ Simulate a timestep, temperatures in ip_data_env are in degree F """
+        self.instrumentation.event(om_instrumentation.DEBUG, 'model_step_started', step=self.schedule.steps)
+        if self.schedule_bank is not None and self.clock.timestep_day == 0 and self.schedule.steps > 0:
+            self.schedule_bank.new_day(self.occupancy_engine, self.routine_data)
+        if self.population is not None:
+            self.population.step(ip_data_env, self.clock, rng=self.rng)
+            self.schedule.steps += 1
+            self.schedule.time += 1
+        else:
+            for agent in self.schedule.agents:
+                agent.current_env_features = ip_data_env
+            
+            self.schedule.step()
         
         # Update simulation specific time parameters
         om_tools.update_simulation_timestep(self)
-        print(f"Occupant simulation finished for timestep: {self.schedule.steps}")
+        self.instrumentation.count('steps')
+        self.instrumentation.event(om_instrumentation.DEBUG, 'model_step_finished', step=self.schedule.steps)
+
+    def current_output(self):
+        """ Outputs of the last simulated timestep: dict with an array (one value per occupant) for each of the OUTPUT_VARIABLES """
+        if self.population is not None:
+            return self.population.output
+        output = {}
+        for var in OUTPUT_VARIABLES:
+            values = [agent.output[var] for agent in self.schedule.agents]
+            output[var] = np.array([np.nan if value is None else value for value in values], dtype=OUTPUT_DTYPES[var])
+        return output
+
+    def _read_env(self, env_frame, start, periods, required):
+        """ Read the environment time series once, convert the temperatures to degree F up front, set the clock to start
+        and compute the calendar of the horizon
+        The inputs are checked before the clock is moved, a failed read leaves the model unchanged
+        Returns the environment arrays and the datetimes of the timesteps
+        """
+        if start is None:
+            start = self.start_datetime + datetime.timedelta(minutes=self.sampling_frequency*self.schedule.steps)
+
+        env = {}
+        for var, columns in ENV_VARIABLES.items():
+            column = next((column for column in columns if column in env_frame), None)
+            if column is not None:
+                env[var] = np.asarray(env_frame[column])
+        for var in required:
+            if var not in env:
+                raise KeyError(f"Environment input '{var}' is missing")
+        length = len(env[required[0]])
+        if periods is None:
+            periods = length
+        elif not 0 <= periods <= length:
+            raise ValueError(f"Cannot simulate {periods} timesteps, the environment inputs have {length} rows")
+        env = om_tools.convert_env_to_F({var: values[:periods].astype(float) if var.startswith('T_') else values[:periods]
+                                         for var, values in env.items()}, self.units)
+        datetimes = [start + datetime.timedelta(minutes=self.sampling_frequency*timestep) for timestep in range(periods)]
+        self.clock.set(start)
+        self.clock.extend(periods)
+        return env, datetimes
+
+    def run(self, env_frame, start=None, periods=None, recorder=None):
+        """ Simulate the whole horizon of an environment time series
+
+        env_frame: DataFrame or dict of arrays with one row per timestep (see ENV_VARIABLES, T_ctrl is accepted for T_in)
+        start: datetime of the first timestep, defaults to the timestep following the last simulated one
+        periods: number of timesteps to simulate, defaults to (and at most) the length of env_frame
+        recorder: optional OutputRecorder the outputs are written to instead of being kept in memory
+
+        Returns a dict with the 'DateTime' of each timestep and, for each of the OUTPUT_VARIABLES,
+        an array of shape (periods, N_occupants), or None with a recorder
+        """
+        env, datetimes = self._read_env(env_frame, start, periods, required=['T_in', 'T_stp_cool', 'T_stp_heat'])
+        periods = len(datetimes)
+
+        # Preallocated columnar output: (time x occupant) per variable
+        results = None
+        if recorder is None:
+            N_occupants = self.N_homes*self.N_occupants_in_home*self.n_variants
+            results = {'DateTime':np.array(datetimes, dtype='datetime64[ns]')}
+            for var in OUTPUT_VARIABLES:
+                results[var] = np.empty((periods, N_occupants), dtype=OUTPUT_DTYPES[var])
+
+        # The environment inputs of a timestep are written into one dict, reused from step to step
+        ip_data_env = {}
+        columns = list(env.items())
+        for timestep in range(periods):
+            for var, values in columns:
+                ip_data_env[var] = values[timestep]
+            ip_data_env['DateTime'] = datetimes[timestep]
+            self._step(ip_data_env)
+
+            output = self.current_output()
+            if recorder is not None:
+                recorder.record(datetimes[timestep], output)
+            else:
+                for var in OUTPUT_VARIABLES:
+                    results[var][timestep] = output[var]
+        return results
+
+    def run_closed_loop(self, weather, plant, start=None, periods=None, recorder=None):
+        """ Simulate the occupants in closed loop with a thermal model of their homes (backend='population')
+
+        weather: DataFrame or dict of arrays with one row per timestep: T_out and the scheduled T_stp_cool, T_stp_heat
+                 (optional hum), as arrays of shape (periods,) shared by the homes or (periods, N_homes)
+        plant: thermal_plant.RCPlant of the N_homes homes, its thermostat follows the setpoints
+        start, periods, recorder: see run
+
+        At each timestep the occupants react to the plant's indoor temperature, their overrides are held by the
+        thermostat until the next change of the scheduled setpoints, and the plant is advanced with the held setpoints.
+        Returns the results of run, plus 'T_in', 'equip_run_heat' and 'equip_run_cool' of shape (periods, N_homes)
+        """
+        if self.population is None:
+            raise ValueError("Closed loop simulation requires backend='population'")
+        if self.n_variants != 1:
+            raise ValueError('Closed loop simulation of parameter variants is not supported, simulate one model per variant')
+        if plant.N_homes != self.N_homes:
+            raise ValueError(f"The plant has {plant.N_homes} homes, the model {self.N_homes}")
+        weather, datetimes = self._read_env(weather, start, periods, required=['T_out', 'T_stp_cool', 'T_stp_heat'])
+        periods = len(datetimes)
+        home_ID = self.population.home_ID
+
+        def per_home(values):
+            return np.broadcast_to(values, (self.N_homes,))
+
+        results = None
+        if recorder is None:
+            N_occupants = self.N_homes*self.N_occupants_in_home
+            results = {'DateTime':np.array(datetimes, dtype='datetime64[ns]')}
+            for var in OUTPUT_VARIABLES:
+                results[var] = np.empty((periods, N_occupants), dtype=OUTPUT_DTYPES[var])
+            for var in ['T_in', 'equip_run_heat', 'equip_run_cool']:
+                results[var] = np.empty((periods, self.N_homes), dtype=float if var == 'T_in' else bool)
+
+        # Setpoints held by the thermostats (degree F)
+        T_stp_cool = per_home(weather['T_stp_cool'][0]).astype(float)
+        T_stp_heat = per_home(weather['T_stp_heat'][0]).astype(float)
+        heat_on, cool_on = plant.thermostat.heat_on, plant.thermostat.cool_on
+        for timestep in range(periods):
+            # A change of the scheduled setpoints ends the hold of the overrides
+            if timestep > 0:
+                T_stp_cool = np.where(per_home(weather['T_stp_cool'][timestep] != weather['T_stp_cool'][timestep - 1]),
+                                      per_home(weather['T_stp_cool'][timestep]), T_stp_cool)
+                T_stp_heat = np.where(per_home(weather['T_stp_heat'][timestep] != weather['T_stp_heat'][timestep - 1]),
+                                      per_home(weather['T_stp_heat'][timestep]), T_stp_heat)
+
+            ip_data_env = {'DateTime':datetimes[timestep], 'T_in':plant.T_in[home_ID],
+                           'T_stp_cool':T_stp_cool[home_ID], 'T_stp_heat':T_stp_heat[home_ID],
+                           'T_out':per_home(weather['T_out'][timestep])[home_ID],
+                           'equip_run_heat':heat_on[home_ID], 'equip_run_cool':cool_on[home_ID]}
+            if 'hum' in weather:
+                ip_data_env['hum'] = per_home(weather['hum'][timestep])[home_ID]
+            self._step(ip_data_env)
+
+            # The thermostats hold the setpoints of the overriding occupants (the last one if several override in a home),
+            # as decided in degree F before the conversion of the outputs
+            output = self.current_output()
+            override = output['Habitual override'] | output['Discomfort override']
+            if override.any():
+                T_stp_cool, T_stp_heat = T_stp_cool.copy(), T_stp_heat.copy()
+                T_stp_cool[home_ID[override]] = self.population.T_stp_cool[override]
+                T_stp_heat[home_ID[override]] = self.population.T_stp_heat[override]
+
+            if recorder is not None:
+                recorder.record(datetimes[timestep], output)
+            else:
+                for var in OUTPUT_VARIABLES:
+                    results[var][timestep] = output[var]
+                T_in = plant.T_in if self.units == 'F' else (plant.T_in - 32)*5/9
+                results['T_in'][timestep] = T_in
+
+            # Advance the homes with the held setpoints
+            _, heat_on, cool_on = plant.step(per_home(weather['T_out'][timestep]), T_stp_cool, T_stp_heat)
+            if results is not None:
+                results['equip_run_heat'][timestep] = heat_on
+                results['equip_run_cool'][timestep] = cool_on
+        return results
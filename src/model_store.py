@@ -0,0 +1,47 @@
+""" model_store.py -> Stores the discomfort ML models (random forests) once on disk and loads them memory mapped """
+
+# Import packages
+import os
+import pathlib
+import pickle
+
+# Models loaded by this process, keyed by store directory
+_loaded = {}
+
+def save_models(models, store_dir):
+    """ Save models (dict name -> model) in store_dir as uncompressed joblib files, which can be memory mapped """
+    import joblib
+    store_dir = pathlib.Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    for name, model in models.items():
+        joblib.dump(model, store_dir / (name + '.joblib'))
+    return store_dir
+
+def convert_pickles(pickle_dir, store_dir):
+    """ Convert the pickled models of pickle_dir (e.g. input_data/models/*.pkl) into a model store """
+    models = {}
+    for pickle_file in sorted(pathlib.Path(pickle_dir).glob('*.pkl')):
+        with open(pickle_file, 'rb') as file:
+            models[pickle_file.stem] = pickle.load(file)
+    return save_models(models, store_dir)
+
+def is_store(models):
+    """ True if models refers to a model store directory instead of a dict of models """
+    return isinstance(models, (str, os.PathLike))
+
+def load_models(store_dir, mmap_mode='r'):
+    """ Load the models of a model store, once per process
+
+    The numpy arrays of the models are memory mapped read-only (mmap_mode='r'), so their pages are read from the OS
+    page cache shared by every process using the store instead of being unpickled into private copies.
+    Note: scikit-learn copies the tree nodes into its own buffers when a tree is loaded. Loading the store in the parent
+    process before the worker processes are forked (e.g. ensemble.run_ensemble) shares those buffers copy-on-write.
+    """
+    import joblib
+    key = str(pathlib.Path(store_dir).resolve())
+    if key not in _loaded:
+        _loaded[key] = {model_file.stem: joblib.load(model_file, mmap_mode=mmap_mode)
+                        for model_file in sorted(pathlib.Path(key).glob('*.joblib'))}
+        if not _loaded[key]:
+            raise FileNotFoundError(f"No models (*.joblib) found in the model store {store_dir}")
+    return _loaded[key]
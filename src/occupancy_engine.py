@@ -0,0 +1,100 @@
+""" occupancy_engine.py -> Compiled, vectorized sampler for the 1st order markov chain occupancy model """
+
+# Import packages
+import datetime
+import numpy as np
+import pandas as pd
+import tools as om_tools
+
+# Transition matrices are defined for 10-minute periods, i.e. 144 periods per day
+N_PERIODS = 144
+PERIOD_MINUTES = 10
+
+def compile_occupancy_tm(tp_matrix):
+    """ Convert an occupancy transition matrix (DataFrame read from the csv) into a dense
+    (period x current state x next state) probability tensor of shape (144, 2, 2)
+    """
+    periods = tp_matrix['Ten minute period number'].values.astype(int) - 1
+    states = tp_matrix['Current state'].values.astype(bool).astype(int)
+    probs = tp_matrix[['Unoccup_prob','Occupied_prob']].values.astype(float)
+
+    # Markov_occupancy_model uses the first row that matches a (period, state) pair
+    _, first_rows = np.unique(periods*2 + states, return_index=True)
+    periods, states, probs = periods[first_rows], states[first_rows], probs[first_rows]
+
+    # Probability should add up to 1.
+    # If the probabilities were rounded up, remove the thousandnth decimal (same fix as Markov_occupancy_model)
+    total = probs[:,0] + probs[:,1]
+    rounded = total != 1
+    probs[rounded,0] = probs[rounded,0] + 1 - total[rounded]
+
+    if (probs < 0).any() or (np.abs(probs.sum(axis=1) - 1) > 1e-8).any():
+        raise ValueError('Occupancy transition probabilities must be non-negative and add up to 1')
+
+    tm = np.full((N_PERIODS, 2, 2), np.nan)
+    tm[periods, states] = probs
+    if np.isnan(tm).any():
+        raise ValueError('Occupancy transition matrix does not cover every period and current state')
+    return tm
+
+class OccupancyEngine:
+    """ Compiled occupancy model: Samples whole days of occupancy for many agents and days at once
+
+    The weekday and weekend transition matrices are compiled once into a (daytype, period, state, next state)
+    tensor. A day is realized from 144 uniforms (one per 10-minute period) using the same inverse CDF
+    that np.random.choice applies in Markov_occupancy_model, so for the same uniforms both produce the same schedule.
+    """
+    def __init__(self, init_data, sampling_time) -> None:
+        if PERIOD_MINUTES % sampling_time != 0:
+            raise ValueError(f"Sampling time ({sampling_time} min) should divide the {PERIOD_MINUTES}-minute transition period")
+        self.sampling_time = sampling_time
+        self.repeat = int(PERIOD_MINUTES/sampling_time) # Timesteps per transition period
+        self.steps_per_day = N_PERIODS*self.repeat
+
+        # Daytype index: 0 -> weekday, 1 -> weekend
+        self.tm = np.stack([compile_occupancy_tm(init_data['occ_tm_wd']), compile_occupancy_tm(init_data['occ_tm_we'])])
+        # Next state is occupied when the uniform is at or above the normalized CDF of the unoccupied state
+        self.threshold = self.tm[..., 0]/(self.tm[..., 0] + self.tm[..., 1])
+
+    def draw_uniforms(self, size=(), rng=np.random):
+        """ Draw the uniforms needed to realize days of occupancy, shape: size + (144,) """
+        return rng.random(tuple(np.atleast_1d(size).astype(int)) + (N_PERIODS,))
+
+    def sample(self, weekend, uniforms):
+        """ Realize occupancy from pre-drawn uniforms
+
+        weekend: bool or array broadcastable to uniforms.shape[:-1]
+        uniforms: array of shape (..., 144), e.g. (agents, days, 144)
+        Returns a bool array of shape (..., steps_per_day)
+        """
+        uniforms = np.asarray(uniforms)
+        daytype = np.broadcast_to(np.asarray(weekend).astype(int), uniforms.shape[:-1])
+        states = np.empty(uniforms.shape, dtype=bool)
+
+        # Start state is occupied, same as Markov_occupancy_model
+        current_state = np.ones(uniforms.shape[:-1], dtype=int)
+        for period in range(N_PERIODS):
+            next_state = uniforms[..., period] >= self.threshold[daytype, period, current_state]
+            states[..., period] = next_state
+            current_state = next_state.astype(int)
+
+        return np.repeat(states, self.repeat, axis=-1)
+
+    def sample_days(self, weekend, n_agents=1, rng=np.random):
+        """ Realize occupancy for n_agents over the days flagged by weekend (one flag per day)
+        Returns a bool array of shape (n_agents, days, steps_per_day)
+        """
+        weekend = np.atleast_1d(weekend)
+        uniforms = self.draw_uniforms((n_agents, weekend.size), rng=rng)
+        return self.sample(weekend[np.newaxis, :], uniforms)
+
+    def sample_day(self, current_datetime, rng=np.random):
+        """ Realize occupancy for the day starting at current_datetime, bool array of shape (steps_per_day,)
+        Use occupancy_frame to get the DataFrame format returned by Markov_occupancy_model
+        """
+        return self.sample(om_tools.is_weekend(current_datetime), self.draw_uniforms(rng=rng))
+
+def occupancy_frame(occupancy, current_datetime, sampling_time):
+    """ Wrap a day of sampled occupancy into the DataFrame format returned by Markov_occupancy_model """
+    datetimes = [current_datetime + datetime.timedelta(minutes=sampling_time*timestep) for timestep in range(len(occupancy))]
+    return pd.DataFrame({'datetime':pd.Series(datetimes, dtype='object'), 'occupancy':occupancy})
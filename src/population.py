@@ -0,0 +1,244 @@
+""" population.py -> Struct-of-arrays backend that simulates every occupant of the model at once """
+
+# Import packages
+import numpy as np
+import tools as om_tools
+import routine_engine as om_routine
+import instrumentation as om_instrumentation
+import discomfort_ml as om_discomfort_ml
+import discomfort as om_discomfort
+
+def check_setpoints(T_stp_cool, T_stp_heat, season, tstat_db, temp_units_C, instrumentation=om_instrumentation.DISABLED):
+    """ Vectorized tools.check_setpoints for arrays of setpoints (one value per occupant) """
+    T_stp_cool = np.array(T_stp_cool, dtype=float)
+    T_stp_heat = np.array(T_stp_heat, dtype=float)
+
+    # Cooling setpoint should always be greater than the heating setpoint
+    overlap = T_stp_cool - tstat_db < T_stp_heat
+    instrumentation.count('setpoint_overlap', int(overlap.sum()))
+    if season == 'cool':
+        T_stp_heat = np.where(overlap, np.floor(T_stp_cool - (tstat_db + 0.5)), T_stp_heat)
+    elif season == 'heat':
+        T_stp_cool = np.where(overlap, np.ceil(T_stp_heat + (tstat_db + 0.5)), T_stp_cool)
+
+    negative = (T_stp_cool < 0) | (T_stp_heat < 0)
+    instrumentation.count('setpoint_negative', int(negative.sum()))
+    T_stp_cool = np.where(negative, np.where(temp_units_C, 15, 60), T_stp_cool)
+    T_stp_heat = np.where(negative, np.where(temp_units_C, 10, 50), T_stp_heat)
+    return T_stp_cool, T_stp_heat
+
+def C_to_F(T):
+    # Convert temperature from Celsius to Fahrenheit, same rounding as tools.C_to_F
+    return np.round((T * 9/5) + 32)
+
+def F_to_C(T):
+    # Convert temperature from Fahrenheit to Celsius, same rounding as tools.F_to_C
+    return np.round((T - 32) * 5/9)
+
+class OccupantPopulation:
+    """ Population of occupants held as arrays (struct of arrays)
+
+    Every occupant attribute of the Occupant agent (comfort temperature, discomfort theory and thresholds,
+    TFT alpha/beta, thermal frustration, last override time, thermostat deadband, units) is an array with one
+    value per occupant, and each timestep is evaluated for all the occupants with vectorized operations.
+    The outputs per occupant match the ones of the Occupant agent.
+
+    Parameters can be scalars (same for all the occupants) or arrays with one value per occupant.
+    n_variants: number of parameter variants of each occupant (e.g. a parameter sweep), occupants are ordered by
+                variant and the N/n_variants occupants of the first variant draw the schedules shared by all the variants
+    schedule_bank: optional schedule_bank.ScheduleBank the daily schedules are drawn from
+    schedule_store: optional schedule_store.ScheduleStore the daily schedules of the N/n_variants occupants are recorded in
+    """
+    def __init__(self, occupancy_engine, routine_data, home_ID, units, comfort_temperature,
+                discomfort_theory_name='czt', threshold={'UL':4,'LL':-4}, TFT_alpha=1, TFT_beta=1,
+                start_datetime=om_tools.datetime.datetime(1996,3,30,0,0), tstat_db=0.0,
+                models=None, instrumentation=om_instrumentation.DISABLED, streams=None, occupant_ID=0, n_variants=1,
+                schedule_bank=None, schedule_store=None) -> None:
+
+        self.occupancy_engine = occupancy_engine # Compiled occupancy model
+        self.routine_data = routine_data # Compiled routine model PMFs
+        self.sampling_frequency = occupancy_engine.sampling_time
+        self.home_ID = np.asarray(home_ID) # Occupants' residence
+        self.N = self.home_ID.size # Number of occupants
+        if self.N % n_variants:
+            raise ValueError(f"{self.N} occupants can not be split into {n_variants} variants")
+        self.n_variants = n_variants
+        self.N_base = self.N//n_variants # Occupants drawing the schedules
+        self.occupant_ID = np.broadcast_to(np.asarray(occupant_ID), (self.N,)).copy() # Occupants' number in their residence
+        self.streams = streams # Optional per-occupant random streams (rng_streams.OccupantStreams)
+        self.schedule_bank = schedule_bank # Optional pre-sampled daily schedules
+        self.schedule_store = schedule_store # Optional history of the daily schedules
+        self.start_datetime = start_datetime
+        self.instrumentation = instrumentation # Event log, per-phase timers and counters
+
+        def per_occupant(value, dtype=float):
+            return np.broadcast_to(np.asarray(value, dtype=dtype), (self.N,)).copy()
+
+        # Temperature units followed by the occupants, the model is evaluated in degree F
+        self.units = per_occupant(np.char.upper(np.asarray(units, dtype=str)), dtype=str)
+        self.units_C = self.units == 'C'
+        comfort_temperature = per_occupant(comfort_temperature)
+        self.T_CT = np.where(self.units_C, C_to_F(comfort_temperature), comfort_temperature) # Comfort temperature
+        self.tstat_db = per_occupant(tstat_db)
+
+        # Discomfort model parameters
+        self.override_theory = per_occupant(np.char.upper(np.asarray(discomfort_theory_name, dtype=str)), dtype=str)
+        self.is_TFT = self.override_theory == 'TFT'
+        self.is_ML = self.override_theory == 'ML'
+        self.threshold_UL = per_occupant(threshold['UL']) # degree F (CZT) or degree F minutes (TFT)
+        self.threshold_LL = per_occupant(threshold['LL'])
+        self.TFT_alpha = per_occupant(TFT_alpha)
+        self.TFT_beta = per_occupant(TFT_beta)
+        self.thermal_frustration = np.zeros(self.N) # Current thermal frustration
+        # Timestep of the last override, tick of the model clock (timesteps from midnight of the day of start_datetime)
+        self.last_override = np.full(self.N, (start_datetime.hour*60 + start_datetime.minute)//self.sampling_frequency)
+        self.ml_discomfort = None # ML theory: override classifier, TTO regressor and TTO countdowns
+        if self.is_ML.any():
+            models = {} if models is None else models
+            self.ml_discomfort = om_discomfort_ml.MLDiscomfort(models.get('model_classification'), models.get('model_regressor'), N=self.N)
+
+        # Daily schedules indexed by (occupant, timestep of the day)
+        self.occupancy = None
+        self.routine_msc = None
+        self.routine_delT_cool = None
+        self.routine_delT_heat = None
+
+        # Setpoints decided at the last timestep (degree F), before the conversion and checks of the outputs
+        self.T_stp_cool = None
+        self.T_stp_heat = None
+
+        # Simulation output container, one value per occupant
+        self.output = None
+
+    def generate_schedules(self, current_datetime, rng=np.random, label=None):
+        """ Generate the occupancy and routine msc schedules of all the occupants for the day of current_datetime
+        label: season and weekday/weekend label of the day (e.g. from the model's calendar), derived from current_datetime by default
+        With per-occupant streams, each occupant draws from its own generator for the day, otherwise all draw from rng
+        The variants of an occupant share its schedules (common random numbers)
+        """
+        tic = self.instrumentation.tic()
+        if self.streams is not None:
+            rngs = [self.streams.day(home_ID, occupant_ID, current_datetime)
+                    for home_ID, occupant_ID in zip(self.home_ID[:self.N_base], self.occupant_ID[:self.N_base])]
+        else:
+            rngs = [rng]*self.N_base
+
+        if self.schedule_bank is not None:
+            # Draw the index of each occupant's day in the schedule bank
+            if self.streams is not None:
+                indices = np.array([self.schedule_bank.draw(rng=occupant_rng) for occupant_rng in rngs])
+            else:
+                indices = self.schedule_bank.draw(self.N_base, rng=rng)
+            self.occupancy, self.routine_msc, self.routine_delT_cool, self.routine_delT_heat = self.schedule_bank.day_schedules(
+                                                                                                current_datetime, indices)
+            self.instrumentation.toc('schedule_bank', tic)
+        else:
+            if self.streams is not None:
+                uniforms = np.stack([self.occupancy_engine.draw_uniforms(rng=occupant_rng) for occupant_rng in rngs])
+            else:
+                uniforms = self.occupancy_engine.draw_uniforms(self.N_base, rng=rng)
+            if label is None:
+                label = om_tools.get_season(current_datetime) + ('_we' if om_tools.is_weekend(current_datetime) else '_wd')
+            self.occupancy = self.occupancy_engine.sample(label.endswith('_we'), uniforms)
+            self.instrumentation.toc('occupancy', tic)
+
+            tic = self.instrumentation.tic()
+            routines = [om_routine.routine_msc_arrays(
+                                                    *om_routine.realize_routine_msc(
+                                                                                    routine_data=self.routine_data,
+                                                                                    occupancy=occupancy,
+                                                                                    current_datetime=current_datetime,
+                                                                                    sampling_time=self.sampling_frequency,
+                                                                                    rng=occupant_rng,
+                                                                                    label=label
+                                                                                    ),
+                                                    sampling_time=self.sampling_frequency
+                                                    ) for occupancy, occupant_rng in zip(self.occupancy, rngs)]
+            self.routine_msc, self.routine_delT_cool, self.routine_delT_heat = (np.array(schedule) for schedule in zip(*routines))
+            self.instrumentation.toc('routine', tic)
+
+        if self.schedule_store is not None:
+            self.schedule_store.record_day(current_datetime, self.occupancy, self.routine_msc, self.routine_delT_cool, self.routine_delT_heat)
+        if self.n_variants > 1:
+            self.occupancy, self.routine_msc, self.routine_delT_cool, self.routine_delT_heat = (
+                np.tile(schedule, (self.n_variants, 1)) for schedule in [self.occupancy, self.routine_msc, self.routine_delT_cool, self.routine_delT_heat])
+
+    def step(self, ip_data_env, clock, rng=np.random) -> None:
+        """ Simulate one timestep for all the occupants
+        ip_data_env: environment inputs, 'DateTime' and temperatures (degree F) as scalars or arrays with one value per occupant
+        clock: simulation clock of the model (sim_clock.SimClock), at the timestep to simulate
+        """
+        current_datetime = ip_data_env['DateTime']
+        T_in = np.broadcast_to(np.asarray(ip_data_env['T_in'], dtype=float), (self.N,))
+        T_stp_cool = np.broadcast_to(np.asarray(ip_data_env['T_stp_cool'], dtype=float), (self.N,))
+        T_stp_heat = np.broadcast_to(np.asarray(ip_data_env['T_stp_heat'], dtype=float), (self.N,))
+
+        season = clock.season
+        timestep_day = clock.timestep_day
+        if season != 'heat' and season != 'cool':
+            self.T_stp_cool, self.T_stp_heat = T_stp_cool.copy(), T_stp_heat.copy()
+            self.output = {'Motion':np.zeros(self.N, dtype=bool),
+                           'T_stp_cool':T_stp_cool.copy(),
+                           'T_stp_heat':T_stp_heat.copy(),
+                           'Thermal Frustration':np.zeros(self.N),
+                           'Comfort Delta':np.full(self.N, np.nan),
+                           'Habitual override':np.zeros(self.N, dtype=bool),
+                           'Discomfort override':np.zeros(self.N, dtype=bool)}
+            return
+
+        # Generate data for the day at midnight (or at the first step if the simulation starts within a day)
+        if timestep_day == 0 or self.occupancy is None:
+            self.generate_schedules(current_datetime, rng=rng, label=clock.label)
+        occupied = self.occupancy[:, timestep_day]
+
+        instrumentation = self.instrumentation
+
+        # Discomfort model
+        tic = instrumentation.tic()
+        del_tin_tct = T_in - self.T_CT
+        czt_override = om_discomfort.czt_override(del_tin_tct, self.threshold_UL, self.threshold_LL)
+        # Thermal frustration is reset after an override threshold is crossed and when the occupant is not present in the home
+        thermal_frustration, tft_override = om_discomfort.tft_step(self.thermal_frustration, del_tin_tct, occupied,
+                                                                   self.TFT_alpha, self.TFT_beta, self.threshold_UL, self.threshold_LL)
+        self.thermal_frustration = np.where(self.is_TFT, thermal_frustration, 0)
+        discomfort_override = occupied & np.where(self.is_TFT, tft_override, czt_override)
+        if self.ml_discomfort is not None:
+            # Occupants following the ML theory are classified in one batch
+            ml_override = self.ml_discomfort.step(ip_data_env, occupied, active=self.is_ML)
+            discomfort_override = np.where(self.is_ML, ml_override, discomfort_override)
+
+        instrumentation.toc('discomfort', tic)
+
+        # Override decision process
+        tic = instrumentation.tic()
+        # Routine based habitual overrides take precedence over discomfort overrides
+        habitual_override = occupied & self.routine_msc[:, timestep_day]
+        # Discomfort overrides are locked out for 5 minutes after the last override,
+        # elapsed time is wrapped to the day like timedelta.seconds in Occupant.step
+        lockout = np.mod((clock.tick - self.last_override)*clock.step_seconds, 86400) <= 300
+        discomfort_override = discomfort_override & ~habitual_override & ~lockout
+
+        override = habitual_override | discomfort_override
+        if override.any():
+            DOMSC_cool = np.where(habitual_override, self.routine_delT_cool[:, timestep_day], self.T_CT - T_in)[override]
+            DOMSC_heat = np.where(habitual_override, self.routine_delT_heat[:, timestep_day], self.T_CT - T_in)[override]
+            T_stp_cool, T_stp_heat = T_stp_cool.copy(), T_stp_heat.copy()
+            T_stp_cool[override], T_stp_heat[override] = check_setpoints(T_stp_cool[override] + DOMSC_cool, T_stp_heat[override] + DOMSC_heat,
+                                                                         season, self.tstat_db[override], self.units_C[override], instrumentation)
+            self.last_override = np.where(override, clock.tick, self.last_override)
+        instrumentation.count('habitual_override', int(habitual_override.sum()))
+        instrumentation.count('discomfort_override', int(discomfort_override.sum()))
+        instrumentation.toc('override', tic)
+
+        self.T_stp_cool, self.T_stp_heat = T_stp_cool.copy(), T_stp_heat.copy()
+
+        tic = instrumentation.tic()
+        T_stp_cool, T_stp_heat = check_setpoints(F_to_C(T_stp_cool), F_to_C(T_stp_heat), season, self.tstat_db, self.units_C, instrumentation)
+        instrumentation.toc('setpoints', tic)
+        self.output = {'Motion':occupied.copy(),
+                       'T_stp_cool':T_stp_cool,
+                       'T_stp_heat':T_stp_heat,
+                       'Thermal Frustration':self.thermal_frustration.copy(),
+                       'Comfort Delta':del_tin_tct,
+                       'Habitual override':habitual_override,
+                       'Discomfort override':discomfort_override}
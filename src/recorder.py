@@ -0,0 +1,112 @@
+""" recorder.py -> Writes the simulation outputs in chunks to columnar files (HDF5 or Parquet), partitioned by home """
+
+# Import packages
+import os
+import numpy as np
+import pandas as pd
+from model import OUTPUT_VARIABLES, OUTPUT_DTYPES
+
+FORMATS = ['hdf', 'parquet']
+
+class OutputRecorder:
+    """ Recorder of the outputs of an OccupantModel
+
+    The outputs of each timestep are copied into preallocated typed buffers of chunksize timesteps,
+    which are written to disk when full, so the memory used does not depend on the length of the run.
+    Each home is written to its own partition, in long format (one row per timestep and occupant):
+    - 'hdf': one table per home in the HDF5 file path, under the key 'home_<home_ID>'
+    - 'parquet': one directory per home, path/home_ID=<home_ID>/part-<chunk>.parquet (requires pyarrow)
+
+    home_ID, occupant_ID: residence and number in the residence of each occupant, in the order of the model's outputs
+    variant: optional parameter variant of each occupant (see sweep), recorded in a 'variant' column
+    """
+    def __init__(self, path, home_ID, occupant_ID, format='hdf', chunksize=288*7, variables=OUTPUT_VARIABLES, complevel=5,
+                 variant=None) -> None:
+        if format not in FORMATS:
+            raise ValueError(f"Unknown output format '{format}', expected one of {FORMATS}")
+        if format == 'parquet':
+            try:
+                import pyarrow
+            except ImportError:
+                raise ImportError("format='parquet' requires pyarrow (pip install pyarrow), or use format='hdf'") from None
+        self.path = path
+        self.format = format
+        self.chunksize = chunksize # Timesteps per chunk written to disk
+        self.variables = list(variables)
+        self.complevel = complevel
+        self.home_ID = np.asarray(home_ID)
+        self.occupant_ID = np.asarray(occupant_ID)
+        self.variant = None if variant is None else np.asarray(variant)
+        self.homes = {home_ID: np.flatnonzero(self.home_ID == home_ID) for home_ID in np.unique(self.home_ID)} # Occupants of each home
+
+        # Preallocated buffers: (timestep x occupant) per variable
+        self.datetimes = np.empty(chunksize, dtype='datetime64[ns]')
+        self.buffers = {var: np.empty((chunksize, self.home_ID.size), dtype=OUTPUT_DTYPES[var]) for var in self.variables}
+        self.rows = 0 # Timesteps in the buffers
+        self.chunks_written = 0
+
+        self.store = None
+        if format == 'hdf':
+            self.store = pd.HDFStore(path, mode='w', complevel=complevel, complib='blosc' if complevel else None)
+        else:
+            os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def for_model(cls, model, path, **kwargs):
+        """ Recorder for the occupants of an OccupantModel, and their parameter variants with backend='population' """
+        if model.population is not None:
+            population = model.population
+            variant = np.repeat(np.arange(population.n_variants), population.N_base) if population.n_variants > 1 else None
+            return cls(path, population.home_ID, population.occupant_ID, variant=variant, **kwargs)
+        home_ID = np.repeat(np.arange(model.N_homes), model.N_occupants_in_home)
+        occupant_ID = np.tile(np.arange(model.N_occupants_in_home), model.N_homes)
+        return cls(path, home_ID, occupant_ID, **kwargs)
+
+    def record(self, current_datetime, output):
+        """ Copy the outputs of a timestep (one value per occupant for each variable) into the buffers """
+        self.datetimes[self.rows] = np.datetime64(current_datetime, 'ns')
+        for var in self.variables:
+            self.buffers[var][self.rows] = output[var]
+        self.rows += 1
+        if self.rows == self.chunksize:
+            self.flush()
+
+    def flush(self):
+        """ Write the buffered timesteps to disk """
+        if self.rows == 0:
+            return
+        for home_ID, occupants in self.homes.items():
+            frame = pd.DataFrame({'DateTime':np.repeat(self.datetimes[:self.rows], occupants.size),
+                                  'occupant_ID':np.tile(self.occupant_ID[occupants], self.rows),
+                                  **{var: self.buffers[var][:self.rows, occupants].ravel() for var in self.variables}})
+            if self.variant is not None:
+                frame.insert(1, 'variant', np.tile(self.variant[occupants], self.rows))
+            if self.format == 'hdf':
+                self.store.append(f'home_{home_ID}', frame, format='table', index=False)
+            else:
+                partition = os.path.join(self.path, f'home_ID={home_ID}')
+                os.makedirs(partition, exist_ok=True)
+                frame.to_parquet(os.path.join(partition, f'part-{self.chunks_written:05d}.parquet'), index=False)
+        self.chunks_written += 1
+        self.rows = 0
+
+    def close(self):
+        """ Write the remaining timesteps and close the output file """
+        self.flush()
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_home(path, home_ID, format='hdf'):
+    """ Read the recorded outputs of a home as a DataFrame (one row per timestep and occupant) """
+    if format == 'hdf':
+        return pd.read_hdf(path, f'home_{home_ID}')
+    partition = os.path.join(path, f'home_ID={home_ID}')
+    parts = sorted(part for part in os.listdir(partition) if part.endswith('.parquet'))
+    return pd.concat([pd.read_parquet(os.path.join(partition, part)) for part in parts], ignore_index=True)
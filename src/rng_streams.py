@@ -0,0 +1,53 @@
+""" rng_streams.py -> Per-occupant, per-day random streams using a counter-based bit generator (Philox) """
+
+# Import packages
+import numpy as np
+import routine_engine as om_routine
+
+class OccupantStreams:
+    """ Random streams of the occupants of a run
+
+    The Philox key is derived from (run_seed, home_ID, occupant ID) and the day is placed in the highest
+    word of the Philox counter, so the stream of any occupant and day is created directly (O(1)), without
+    drawing the numbers of the previous days or of the other occupants.
+    """
+    def __init__(self, run_seed) -> None:
+        self.run_seed = run_seed
+        self._keys = {} # Philox keys per (home_ID, occupant ID)
+
+    def key(self, home_ID, occupant_ID):
+        """ Philox key of an occupant """
+        agent = (int(home_ID), int(occupant_ID))
+        if agent not in self._keys:
+            self._keys[agent] = np.random.SeedSequence([int(self.run_seed), *agent]).generate_state(2, dtype=np.uint64)
+        return self._keys[agent]
+
+    def day(self, home_ID, occupant_ID, current_datetime):
+        """ Random generator of an occupant for the day of current_datetime """
+        day_number = current_datetime.date().toordinal()
+        return np.random.Generator(np.random.Philox(key=self.key(home_ID, occupant_ID), counter=[0, 0, 0, day_number]))
+
+def regenerate_day(model, home_ID, occupant_ID, current_datetime):
+    """ Regenerate the occupancy and routine msc schedule an occupant of an OccupantModel (created with run_seed)
+    realized for the day of current_datetime, without simulating the previous days
+
+    Returns the occupancy, routine_msc, routine_delT_cool and routine_delT_heat arrays indexed by timestep of the day
+    With a schedule bank, the day is drawn from the model's bank in its current state (refreshes included)
+    """
+    if model.streams is None:
+        raise ValueError('The model has no per-occupant random streams, create it with run_seed')
+    rng = model.streams.day(home_ID, occupant_ID, current_datetime)
+    if model.schedule_bank is not None:
+        return model.schedule_bank.day_schedules(current_datetime, model.schedule_bank.draw(rng=rng))
+    occupancy = model.occupancy_engine.sample_day(current_datetime=current_datetime, rng=rng)
+    routine = om_routine.routine_msc_arrays(
+                                            *om_routine.realize_routine_msc(
+                                                                            routine_data=model.routine_data,
+                                                                            occupancy=occupancy,
+                                                                            current_datetime=current_datetime,
+                                                                            sampling_time=model.sampling_frequency,
+                                                                            rng=rng
+                                                                            ),
+                                            sampling_time=model.sampling_frequency
+                                            )
+    return (occupancy, *routine)
@@ -0,0 +1,288 @@
+""" routine_engine.py -> Compiled PMFs for the routine based (habitual) manual setpoint change (MSC) model """
+
+# Import packages
+import datetime
+import numpy as np
+import pandas as pd
+import tools as om_tools
+
+MINUTES_PER_DAY = 1440
+# Days with at most this many occupied timesteps have no mscs
+MIN_OCCUPIED_TIMESTEPS = 10
+
+def tod_to_minute(tod):
+    """ Convert time of day strings ('%H:%M:%S') to integer minutes of the day """
+    return (pd.to_timedelta(np.asarray(tod, dtype=str)).total_seconds()//60).astype(int)
+
+def _doo_values(columns):
+    """ Degree of override (DOO) values from the column headers of a DOO table """
+    return np.round(np.array(columns).astype(float)).astype(int)
+
+def cumulative_probability(prob, fix_index=0):
+    """ Cumulative probability used for inverse CDF sampling
+    Rounded PMFs are patched the same way as realize_routine_msc (prob[fix_index] += diff) and normalized
+    the same way as np.random.choice, so a uniform draw realizes the same value as np.random.choice would.
+    """
+    prob = np.array(prob, dtype=float)
+    total = np.sum(prob, axis=-1)
+    if np.any(total != 1):
+        prob[..., fix_index] = prob[..., fix_index] + np.where(total != 1, np.abs(1 - total), 0)
+    cdf = np.cumsum(prob, axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return cdf/cdf[..., -1:]
+
+def masked_sample(values, pmf, mask, u):
+    """ Realize a value for the uniform u from the pmf restricted to the values where mask is True and renormalized,
+    i.e. the distribution of rejection sampling until a value in mask is drawn, with one draw
+    Returns None if no value in mask has probability mass
+    """
+    cdf = np.cumsum(np.where(mask, pmf, 0))
+    if not cdf[-1] > 0:
+        return None
+    return values[np.searchsorted(cdf/cdf[-1], u, side='right')]
+
+class DiscretePMF:
+    """ Probability mass function over a set of values with a precomputed cumulative probability """
+    def __init__(self, values, prob, fix_index=0) -> None:
+        self.values = np.asarray(values)
+        self.cdf = cumulative_probability(prob, fix_index)
+        self.pmf = np.diff(self.cdf, prepend=0)
+
+    def sample(self, u):
+        """ Realize value(s) for the uniform(s) u """
+        return self.values[np.searchsorted(self.cdf, u, side='right')]
+
+    def sample_masked(self, mask, u):
+        """ Realize a value for the uniform u conditioned on mask (bool per value), None if mask has no mass """
+        return masked_sample(self.values, self.pmf, mask, u)
+
+class ConditionalPMF:
+    """ Conditional probability mass functions P(value | key), one row per key, with precomputed cumulative probabilities
+    Rows with zero total probability are flagged in has_mass, the caller decides on the fallback for those.
+    """
+    def __init__(self, keys, values, prob, fix_index=0) -> None:
+        keys = np.asarray(keys)
+        prob = np.asarray(prob, dtype=float)
+
+        # Sort the keys for searchsorted lookup, keep the first row of duplicated keys
+        self.keys, rows = np.unique(keys, return_index=True)
+        prob = prob[rows]
+        self.values = np.asarray(values)
+        self.mass = prob.sum(axis=1) != 0
+        self.cdf = cumulative_probability(prob, fix_index)
+        self.pmf = np.nan_to_num(np.diff(self.cdf, axis=1, prepend=0))
+
+    def row(self, key):
+        """ Row index of the distribution for key """
+        row = np.searchsorted(self.keys, key)
+        if row == self.keys.size or self.keys[row] != key:
+            raise KeyError(f"No distribution for key {key}")
+        return row
+
+    def has_mass(self, key):
+        """ False if the distribution for key has zero total probability """
+        return self.mass[self.row(key)]
+
+    def sample(self, key, u):
+        """ Realize a value given key for the uniform u """
+        return self.values[np.searchsorted(self.cdf[self.row(key)], u, side='right')]
+
+    def sample_masked(self, key, mask, u):
+        """ Realize a value given key for the uniform u conditioned on mask (bool per value), None if mask has no mass """
+        return masked_sample(self.values, self.pmf[self.row(key)], mask, u)
+
+def _discrete_pmf(data, column, fix_index=0):
+    return DiscretePMF(data[column].values, data['prob'].values, fix_index)
+
+def _tod_conditional_pmf(data, values=None, fix_index=0):
+    if values is None:
+        values = _doo_values(data.columns[1:])
+    return ConditionalPMF(tod_to_minute(data['tod'].values), values, data.iloc[:,1:].values.astype(float), fix_index)
+
+class RoutineTables:
+    """ Compiled PMFs for one season and weekday/weekend label, e.g. 'cool_wd'
+    Times of day are stored as integer minutes of the day, degrees of override (DOO) as integers
+    """
+    def __init__(self, init_data, label) -> None:
+        self.label = label
+        self.season = label.split('_')[0]
+        season = self.season
+
+        # Number of mscs per day
+        self.N_mscpd = DiscretePMF(init_data[label + '_Nmscpd']['N'].values.astype(int), init_data[label + '_Nmscpd']['prob'].values)
+
+        # Two mscs per day: tod1, type1, DOO1 | (type1, tod1), tod2 | tod1, type2 | type1, DOO2 | (type1, type2, DOO1)
+        data = init_data[label + '_2mscpd_tod1']
+        self.tod1 = DiscretePMF(tod_to_minute(data['tod'].values), data['prob'].values)
+        self.type1 = _discrete_pmf(init_data[label + '_2mscpd_type1'], 'types')
+        self.DOO1 = {type_1: _tod_conditional_pmf(init_data[label + '_2mscpd_' + season + '_DOO1_' + type_1 + '_type'])
+                     for type_1 in self.type1.values}
+        data = init_data[label + '_2mscpd_tod2_tod1']
+        self.tod2_tod1 = _tod_conditional_pmf(data, values=tod_to_minute(data['tod'].values), fix_index=-1)
+        self.type2_type1 = {type_1: _discrete_pmf(init_data[label + '_2mscpd_type2_type1_' + type_1], 'types')
+                            for type_1 in self.type1.values}
+        self.DOO2_DOO1 = {}
+        for type_1 in self.type1.values:
+            for type_2 in self.type2_type1[type_1].values:
+                data = init_data[label + '_2mscpd_row' + season + '_col' + season + '_DOO2_' + type_1 + '_type1_' + type_2 + '_type2']
+                self.DOO2_DOO1[(type_1, type_2)] = ConditionalPMF(data['doo'].values.astype(int), _doo_values(data.columns[1:]),
+                                                                  data.iloc[:,1:].values.astype(float))
+
+        # One msc per day: tod, type, DOO | (type, tod)
+        data = init_data[label + '_1mscpd_tod']
+        self.tod = DiscretePMF(tod_to_minute(data['tod'].values), data['prob'].values)
+        self.type = _discrete_pmf(init_data[label + '_1mscpd_type'], 'types')
+        self.DOO = {type: _tod_conditional_pmf(init_data[label + '_1mscpd_' + season + '_DOO_' + type + '_type'])
+                    for type in self.type.values}
+
+def compile_routine_data(init_data):
+    """ Compile the routine MSC PMFs in init_data into RoutineTables, keyed by label (season_daytype) """
+    labels = [key[:-len('_Nmscpd')] for key in init_data.keys() if key.endswith('_Nmscpd')]
+    return {label: RoutineTables(init_data, label) for label in labels}
+
+# RoutineTables compiled by routine_tables, keyed by (id of init_data, label), with a reference to init_data.
+# Only the CACHE_SIZE most recently used tables are kept, so the init_data of past models are released
+CACHE_SIZE = 16
+_compiled = {}
+
+def routine_tables(init_data, label):
+    """ RoutineTables of a label, compiled once per init_data (the tables of init_data are not to be modified afterwards) """
+    key = (id(init_data), label)
+    entry = _compiled.pop(key, None)
+    if entry is None or entry[0] is not init_data:
+        entry = (init_data, RoutineTables(init_data, label))
+    _compiled[key] = entry
+    while len(_compiled) > CACHE_SIZE:
+        del _compiled[next(iter(_compiled))]
+    return entry[1]
+
+def realize_routine_msc(routine_data, occupancy, current_datetime, sampling_time, rng=np.random, label=None):
+    """ Compiled counterpart of tools.realize_routine_msc
+
+    routine_data: output of compile_routine_data
+    occupancy: bool array of the day's occupancy, one value per sampling_time minutes from midnight
+    label: season and weekday/weekend label of the day (e.g. from the model's calendar), derived from current_datetime by default
+    Returns the mscs of the day as arrays: minute of the day, delT_cool and delT_heat
+
+    Days with MIN_OCCUPIED_TIMESTEPS occupied timesteps or less have no mscs, routine_data is then not looked up.
+
+    The time of an msc is drawn from its PMF conditioned on the occupied timesteps (masked and renormalized),
+    with a single draw. An msc whose PMF has no mass at the occupied timesteps is not realized.
+    If the PMF of the second msc's time given the first one's has no mass at all, the second msc is drawn uniformly
+    among the occupied times after the first msc (none if there are no such times).
+
+    Random stream: every realized quantity (N_mscpd, time, type and degree of each msc) takes exactly one rng.random().
+    A draw from a PMF realizes the value np.random.choice(values, p=pmf) would for the same uniform, a uniform choice
+    among n values takes values[int(u*n)]. The stream is not the one of the baseline tools.realize_routine_msc, which
+    redrew msc times until they were occupied and drew its uniform choices with np.random.choice(values) (an integer draw),
+    so the same seed does not realize the same mscs as the baseline.
+    """
+    occupancy = np.asarray(occupancy, dtype=bool)
+    if occupancy.sum() <= MIN_OCCUPIED_TIMESTEPS:
+        return _no_msc()
+
+    # Get the PMFs for the current season and weekday/weekend
+    if label is None:
+        label = om_tools.get_season(current_datetime) + '_' + ('we' if om_tools.is_weekend(current_datetime) else 'wd')
+    return realize_tables_msc(routine_data[label], occupancy, sampling_time, rng=rng)
+
+def _no_msc():
+    """ Mscs of a day without mscs: empty minute of the day, delT_cool and delT_heat arrays """
+    return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+def realize_tables_msc(tables, occupancy, sampling_time, rng=np.random):
+    """ Realize the mscs of a day from the RoutineTables of its season and weekday/weekend label (see realize_routine_msc) """
+    minutes, delT_cool, delT_heat = _no_msc()
+    occupancy = np.asarray(occupancy, dtype=bool)
+    if occupancy.sum() <= MIN_OCCUPIED_TIMESTEPS:
+        return minutes, delT_cool, delT_heat
+
+    # Occupied minutes of the day, an msc can only be realized at an occupied timestep
+    occupied = np.zeros(MINUTES_PER_DAY, dtype=bool)
+    occupied[np.flatnonzero(occupancy)*sampling_time] = True
+    season = tables.season
+
+    # First realize the number of mscs per day i.e. N_mscpd
+    # For now, any larger number of mscs is considered as 2 mscs,
+    # TODO: update when PDFs are available for higher number of MSCs
+    N_mscpd = min(tables.N_mscpd.sample(rng.random()), 2)
+
+    if N_mscpd == 2:
+        # Realize the time of first msc i.e. t_msc_1 at an occupied timestep
+        t_msc_1 = tables.tod1.sample_masked(occupied[tables.tod1.values], rng.random())
+        if t_msc_1 is None:
+            return minutes, delT_cool, delT_heat
+
+        # Realize the type and degree of first msc i.e. type_1, domsc_1
+        type_1 = tables.type1.sample(rng.random())
+        if tables.DOO1[type_1].has_mass(t_msc_1):
+            domsc_1 = tables.DOO1[type_1].sample(t_msc_1, rng.random())
+        else:
+            domsc_1 = _uniform_choice(tables.DOO1[type_1].values, rng)
+
+        # Realize the time of second msc i.e. t_msc_2 given the time of first msc i.e., t_msc_1 at an occupied timestep
+        if tables.tod2_tod1.has_mass(t_msc_1):
+            t_msc_2 = tables.tod2_tod1.sample_masked(t_msc_1, occupied[tables.tod2_tod1.values], rng.random())
+        else:
+            # No PMF given t_msc_1: uniform choice among the occupied times after t_msc_1
+            tod_2 = tables.tod2_tod1.values
+            tod_2 = tod_2[(tod_2 > t_msc_1) & occupied[tod_2]]
+            t_msc_2 = _uniform_choice(tod_2, rng) if tod_2.size else None
+        if t_msc_2 is None:
+            # Only the first msc can be realized
+            minutes, domscs = np.array([t_msc_1]), np.array([domsc_1])
+        else:
+            # Realize the type of second msc given type_1 and its degree given (type_1, type_2, domsc_1)
+            type_2 = tables.type2_type1[type_1].sample(rng.random())
+            domsc_2 = tables.DOO2_DOO1[(type_1, type_2)].sample(domsc_1, rng.random())
+
+            minutes, domscs = np.array([t_msc_1, t_msc_2]), np.array([domsc_1, domsc_2])
+
+    elif N_mscpd == 1:
+        # Realize the time of the msc i.e. t_msc at an occupied timestep
+        t_msc = tables.tod.sample_masked(occupied[tables.tod.values], rng.random())
+        if t_msc is None:
+            return minutes, delT_cool, delT_heat
+
+        # Realize the type and degree of the msc
+        type = tables.type.sample(rng.random())
+        domsc = tables.DOO[type].sample(t_msc, rng.random())
+
+        minutes, domscs = np.array([t_msc]), np.array([domsc])
+    else:
+        return minutes, delT_cool, delT_heat
+
+    if season == 'cool':
+        delT_cool, delT_heat = domscs, np.zeros_like(domscs)
+    elif season == 'heat':
+        delT_cool, delT_heat = np.zeros_like(domscs), domscs
+    else:
+        minutes, delT_cool, delT_heat = minutes[:0], delT_cool[:0], delT_heat[:0]
+    return minutes, delT_cool, delT_heat
+
+def _uniform_choice(values, rng):
+    """ Choose one of the values with equal probability from a single uniform draw, values[int(u*n)] """
+    return values[int(rng.random()*len(values))]
+
+def routine_msc_arrays(minutes, delT_cool, delT_heat, sampling_time):
+    """ Spread realized mscs over the timesteps of the day
+    Returns a bool array flagging the msc timesteps and the delT_cool, delT_heat arrays indexed by timestep of the day
+    """
+    steps_per_day = int(MINUTES_PER_DAY/sampling_time)
+    routine_msc = np.zeros(steps_per_day, dtype=bool)
+    routine_delT_cool = np.zeros(steps_per_day)
+    routine_delT_heat = np.zeros(steps_per_day)
+
+    # Assign in reverse order so the first msc wins if two mscs share a timestep
+    timesteps = np.asarray(minutes, dtype=int)//sampling_time
+    routine_msc[timesteps] = True
+    routine_delT_cool[timesteps[::-1]] = np.asarray(delT_cool)[::-1]
+    routine_delT_heat[timesteps[::-1]] = np.asarray(delT_heat)[::-1]
+    return routine_msc, routine_delT_cool, routine_delT_heat
+
+def routine_msc_frame(minutes, delT_cool, delT_heat, current_datetime):
+    """ Wrap realized mscs into the DataFrame format returned by tools.realize_routine_msc """
+    day_start = datetime.datetime.combine(current_datetime.date(), datetime.time())
+    datetimes = [day_start + datetime.timedelta(minutes=int(minute)) for minute in minutes]
+    return pd.DataFrame({'datetime':pd.Series(datetimes, dtype='object'),
+                         'delT_cool':delT_cool, 'delT_heat':delT_heat})
@@ -0,0 +1,148 @@
+""" schedule_bank.py -> Library of pre-sampled daily occupancy and routine msc schedules, drawn by index at midnight """
+
+# Import packages
+import copy
+import json
+import numpy as np
+import tools as om_tools
+import schedule_store as om_schedule_store
+import routine_engine as om_routine
+
+FORMAT_VERSION = 2
+MAX_MSC = 2 # Most mscs realized in a day (see routine_engine.realize_routine_msc)
+
+def _label(current_datetime):
+    """ Season and weekday/weekend label of a day, e.g. 'cool_wd' """
+    return om_tools.get_season(current_datetime) + ('_we' if om_tools.is_weekend(current_datetime) else '_wd')
+
+class ScheduleBank:
+    """ Pre-sampled daily schedules per season and weekday/weekend label
+
+    Each label holds size days sampled from the init_data distributions: the occupancy (bool, one value per timestep)
+    and up to MAX_MSC routine mscs (minute of the day, -1 if not realized, and delT_cool, delT_heat).
+    At midnight an occupant draws the index of its day in the bank with its own random generator (one uniform),
+    instead of realizing the occupancy and routine models.
+
+    The size of the bank trades the diversity of the schedules against the time spent sampling them.
+    With refresh_days, a fraction refresh_fraction of the days of every label is resampled every refresh_days
+    simulated days. The refreshes are seeded from the bank's seed and their number, so the bank's content only
+    depends on the number of refreshes done (see checkpoint).
+    """
+    def __init__(self, schedules, sampling_time, seed, refresh_days=None, refresh_fraction=1.0) -> None:
+        self.schedules = schedules # label -> dict of arrays 'occupancy', 'minutes', 'delT_cool', 'delT_heat'
+        self.sampling_time = sampling_time
+        self.seed = seed # Entropy of the SeedSequence of the bank
+        self.refresh_days = refresh_days
+        self.refresh_fraction = refresh_fraction
+        self.days = 0 # Midnights since the bank is used by a model
+        self.refreshes = 0 # Refreshes done
+
+    @property
+    def labels(self):
+        return list(self.schedules)
+
+    @property
+    def size(self):
+        """ Days per label """
+        return len(next(iter(self.schedules.values()))['occupancy'])
+
+    @staticmethod
+    def sample(occupancy_engine, routine_data, label, n, rng):
+        """ Sample n days of schedules of a label """
+        occupancy = occupancy_engine.sample(label.endswith('_we'), occupancy_engine.draw_uniforms(n, rng=rng))
+        minutes = np.full((n, MAX_MSC), -1, dtype=np.int16)
+        delT_cool = np.zeros((n, MAX_MSC), dtype=np.int16)
+        delT_heat = np.zeros((n, MAX_MSC), dtype=np.int16)
+        for day in range(n):
+            msc_minutes, msc_delT_cool, msc_delT_heat = om_routine.realize_tables_msc(routine_data[label], occupancy[day],
+                                                                                      occupancy_engine.sampling_time, rng=rng)
+            minutes[day, :len(msc_minutes)] = msc_minutes
+            delT_cool[day, :len(msc_minutes)] = msc_delT_cool
+            delT_heat[day, :len(msc_minutes)] = msc_delT_heat
+        return {'occupancy':occupancy, 'minutes':minutes, 'delT_cool':delT_cool, 'delT_heat':delT_heat}
+
+    @classmethod
+    def generate(cls, occupancy_engine, routine_data, size=1024, seed=None, labels=None, **kwargs):
+        """ Sample a bank of size days per label (default: every label of routine_data) with the compiled models of a
+        model (OccupantModel.occupancy_engine and .routine_data), kwargs: refresh_days, refresh_fraction
+        """
+        seed = np.random.SeedSequence(seed).entropy
+        rng = np.random.default_rng(seed)
+        labels = sorted(routine_data) if labels is None else labels
+        schedules = {label: cls.sample(occupancy_engine, routine_data, label, size, rng) for label in labels}
+        return cls(schedules, occupancy_engine.sampling_time, seed, **kwargs)
+
+    def save(self, path):
+        """ Save the bank to path (compressed npz, no pickled objects), the occupancy is bit-packed """
+        meta = {'format_version':FORMAT_VERSION, 'sampling_time':self.sampling_time, 'seed':self.seed, 'labels':self.labels}
+        arrays = {f"{label}.{name}": om_schedule_store.pack(values) if name == 'occupancy' else values
+                  for label, schedules in self.schedules.items() for name, values in schedules.items()}
+        np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """ Read a bank saved by save, kwargs: refresh_days, refresh_fraction """
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(data['meta'].item())
+            if meta['format_version'] != FORMAT_VERSION:
+                raise ValueError(f"Unsupported schedule bank format version {meta['format_version']}")
+            steps_per_day = int(1440/meta['sampling_time'])
+            schedules = {label: {name: om_schedule_store.unpack(data[f"{label}.{name}"], steps_per_day) if name == 'occupancy'
+                                 else data[f"{label}.{name}"] for name in ['occupancy', 'minutes', 'delT_cool', 'delT_heat']}
+                         for label in meta['labels']}
+        return cls(schedules, meta['sampling_time'], meta['seed'], **kwargs)
+
+    def copy(self):
+        """ Copy sharing the schedules (refreshes replace the arrays instead of modifying them) """
+        bank = copy.copy(self)
+        bank.schedules = dict(self.schedules)
+        return bank
+
+    def draw(self, n=None, rng=np.random):
+        """ Indices of drawn days, one per occupant (n) or a single one (n=None) """
+        if n is None:
+            return int(rng.random()*self.size)
+        return (rng.random(n)*self.size).astype(int)
+
+    def day_schedules(self, current_datetime, index):
+        """ Schedules of the drawn days: occupancy, routine_msc, routine_delT_cool and routine_delT_heat arrays
+        indexed by timestep of the day, of shape (steps_per_day,) for a single index or (n, steps_per_day)
+        """
+        label = _label(current_datetime)
+        if label not in self.schedules:
+            raise KeyError(f"The schedule bank has no days for {label}")
+        schedules = self.schedules[label]
+        occupancy = schedules['occupancy'][index]
+        minutes = np.atleast_2d(schedules['minutes'][index])
+        routine_msc = np.zeros((minutes.shape[0], occupancy.shape[-1]), dtype=bool)
+        routine_delT_cool = np.zeros(routine_msc.shape)
+        routine_delT_heat = np.zeros(routine_msc.shape)
+        # Assign in reverse order so the first msc wins if two mscs share a timestep (see routine_engine.routine_msc_arrays)
+        for msc in reversed(range(MAX_MSC)):
+            rows = np.flatnonzero(minutes[:, msc] >= 0)
+            timesteps = minutes[rows, msc]//self.sampling_time
+            routine_msc[rows, timesteps] = True
+            routine_delT_cool[rows, timesteps] = np.atleast_2d(schedules['delT_cool'][index])[rows, msc]
+            routine_delT_heat[rows, timesteps] = np.atleast_2d(schedules['delT_heat'][index])[rows, msc]
+        if np.ndim(index) == 0:
+            return occupancy, routine_msc[0], routine_delT_cool[0], routine_delT_heat[0]
+        return occupancy, routine_msc, routine_delT_cool, routine_delT_heat
+
+    def refresh(self, occupancy_engine, routine_data):
+        """ Resample refresh_fraction of the days of every label """
+        self.refreshes += 1
+        rng = np.random.default_rng([self.seed, self.refreshes])
+        n = max(int(round(self.refresh_fraction*self.size)), 1)
+        for label, schedules in self.schedules.items():
+            days = rng.choice(self.size, n, replace=False)
+            new = self.sample(occupancy_engine, routine_data, label, n, rng)
+            schedules = {name: values.copy() for name, values in schedules.items()}
+            for name, values in new.items():
+                schedules[name][days] = values
+            self.schedules[label] = schedules
+
+    def new_day(self, occupancy_engine, routine_data):
+        """ Count a midnight of the simulation, refresh the bank every refresh_days days """
+        self.days += 1
+        if self.refresh_days and self.days % self.refresh_days == 0:
+            self.refresh(occupancy_engine, routine_data)
@@ -0,0 +1,162 @@
+""" schedule_store.py -> Compact, time-indexed storage of the daily schedules of many agents over long horizons """
+
+# Import packages
+import datetime
+import json
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# Manual setpoint change (msc) events of the routine model, one record per event
+EVENT_DTYPE = np.dtype([('day', np.int32), ('agent', np.int32), ('slot', np.int16), ('delT_cool', np.float32), ('delT_heat', np.float32)])
+
+def pack(values):
+    """ Bit-pack bool arrays along the last axis (slots of the day) """
+    return np.packbits(np.asarray(values, dtype=bool), axis=-1)
+
+def unpack(bits, steps_per_day):
+    """ Bool arrays of bit-packed slots """
+    return np.unpackbits(bits, axis=-1, count=steps_per_day).astype(bool)
+
+class ScheduleStore:
+    """ Schedules of N_agents agents indexed by (agent, day, slot of the day)
+
+    - Bool schedules (e.g. 'occupancy' of the occupancy model, 'habitual' of the habitual model) are bit-packed
+      planes of shape (N_agents, days, steps_per_day/8) bytes, a year of 5-minute occupancy takes 13 kB per agent.
+      Whole horizons sampled at once (e.g. HabitualEngine.sample_days) are recorded with record(name, 0, values).
+    - Routine msc events are records (day, agent, slot, delT_cool, delT_heat), kept sorted by (day, agent, slot)
+      with an offset index, so the events of a day or of an agent's day are a slice.
+    Days are counted from start_date and the planes grow as later days are recorded.
+    """
+    def __init__(self, N_agents, start_date, sampling_time=5, days=0, planes=('occupancy',)) -> None:
+        self.N_agents = N_agents
+        self.start_date = start_date.date() if isinstance(start_date, datetime.datetime) else start_date
+        self.sampling_time = sampling_time
+        self.steps_per_day = int(1440/sampling_time)
+        self.bytes_per_day = -(-self.steps_per_day//8)
+        self.days = days # Days covered by the store
+        self.capacity = days # Days allocated in the planes
+        self.planes = {name: np.zeros((N_agents, days, self.bytes_per_day), dtype=np.uint8) for name in planes}
+        self._events = [np.empty(0, dtype=EVENT_DTYPE)] # Event records, merged and sorted when queried
+        self._offsets = None # Index of the sorted events: first event of each (day, agent)
+
+    def day_index(self, current_datetime):
+        """ Day of current_datetime, counted from start_date """
+        current_date = current_datetime.date() if isinstance(current_datetime, datetime.datetime) else current_datetime
+        return (current_date - self.start_date).days
+
+    def _grow(self, days):
+        """ Make room for days days, doubling the capacity of the planes """
+        if days > self.capacity:
+            self.capacity = max(days, 2*self.capacity)
+            for name, bits in self.planes.items():
+                grown = np.zeros((self.N_agents, self.capacity, self.bytes_per_day), dtype=np.uint8)
+                grown[:, :bits.shape[1]] = bits
+                self.planes[name] = grown
+        self.days = max(self.days, days)
+
+    def record(self, name, day, values, agents=slice(None)):
+        """ Store the bool schedules of a day (or of consecutive days): values of shape (agents, steps_per_day)
+        or (agents, days, steps_per_day), agents: indices of the agents (default: all)
+        """
+        values = np.asarray(values, dtype=bool)
+        days = 1 if values.ndim == 2 else values.shape[1]
+        if name not in self.planes:
+            self.planes[name] = np.zeros((self.N_agents, self.capacity, self.bytes_per_day), dtype=np.uint8)
+        self._grow(day + days)
+        bits = pack(values)
+        self.planes[name][agents, day:day + days] = bits if values.ndim == 3 else bits[:, np.newaxis]
+
+    def record_routine(self, day, routine_msc, delT_cool, delT_heat, agents=None):
+        """ Store the msc events of a day from the routine arrays of shape (agents, steps_per_day)
+        (see routine_engine.routine_msc_arrays), agents: indices of the agents of the rows (default: all)
+        """
+        rows, slots = np.nonzero(np.atleast_2d(routine_msc))
+        events = np.empty(rows.size, dtype=EVENT_DTYPE)
+        events['day'] = day
+        events['agent'] = rows if agents is None else np.atleast_1d(agents)[rows]
+        events['slot'] = slots
+        events['delT_cool'] = np.atleast_2d(delT_cool)[rows, slots]
+        events['delT_heat'] = np.atleast_2d(delT_heat)[rows, slots]
+        self._grow(day + 1)
+        self._events.append(events)
+        self._offsets = None
+
+    def record_day(self, current_datetime, occupancy, routine_msc, delT_cool, delT_heat, agents=None):
+        """ Store the occupancy and routine schedules of the day of current_datetime """
+        day = self.day_index(current_datetime)
+        self.record('occupancy', day, np.atleast_2d(occupancy), agents=slice(None) if agents is None else agents)
+        self.record_routine(day, routine_msc, delT_cool, delT_heat, agents=agents)
+
+    @property
+    def event_records(self):
+        """ All the msc events, sorted by (day, agent, slot) """
+        if self._offsets is None:
+            events = np.concatenate(self._events)
+            events = events[np.lexsort((events['slot'], events['agent'], events['day']))]
+            self._events = [events]
+            keys = events['day'].astype(np.int64)*self.N_agents + events['agent']
+            self._offsets = np.searchsorted(keys, np.arange(self.days*self.N_agents + 1))
+        return self._events[0]
+
+    def events(self, day, agent=None):
+        """ Msc events of a day, or of an agent's day """
+        events = self.event_records
+        if agent is None:
+            return events[self._offsets[day*self.N_agents]:self._offsets[(day + 1)*self.N_agents]]
+        return events[self._offsets[day*self.N_agents + agent]:self._offsets[day*self.N_agents + agent + 1]]
+
+    def schedule(self, name, day, agents=slice(None)):
+        """ Bool schedules of a day, array of shape (agents, steps_per_day) """
+        return unpack(self.planes[name][agents, day], self.steps_per_day)
+
+    def at(self, name, slot, day=None, agents=slice(None)):
+        """ Value of the bool schedules at a slot of the day, e.g. at('occupancy', t, d): occupied agents at slot t of day d
+        Only the byte holding the slot is read, returns an array of shape (agents,) or (agents, days) (default: all days)
+        """
+        byte = self.planes[name][agents, slice(0, self.days) if day is None else day, slot//8]
+        return (byte >> (7 - slot % 8)) & 1 == 1
+
+    def occupied(self, slot, day=None, agents=slice(None)):
+        """ Occupied agents at a slot of the day (see at) """
+        return self.at('occupancy', slot, day, agents)
+
+    def routine_arrays(self, day, agents=None):
+        """ Routine arrays of a day (routine_msc, routine_delT_cool, routine_delT_heat) of shape (N_agents, steps_per_day),
+        or of shape (steps_per_day,) for a single agent
+        """
+        events = self.events(day, agents) if np.ndim(agents) == 0 and agents is not None else self.events(day)
+        routine_msc = np.zeros((self.N_agents, self.steps_per_day), dtype=bool)
+        routine_delT_cool = np.zeros(routine_msc.shape)
+        routine_delT_heat = np.zeros(routine_msc.shape)
+        routine_msc[events['agent'], events['slot']] = True
+        routine_delT_cool[events['agent'], events['slot']] = events['delT_cool']
+        routine_delT_heat[events['agent'], events['slot']] = events['delT_heat']
+        if agents is None:
+            return routine_msc, routine_delT_cool, routine_delT_heat
+        return routine_msc[agents], routine_delT_cool[agents], routine_delT_heat[agents]
+
+    @property
+    def nbytes(self):
+        """ Memory used by the schedules """
+        return sum(bits[:, :self.days].nbytes for bits in self.planes.values()) + sum(events.nbytes for events in self._events)
+
+    def save(self, path):
+        """ Save the store to path (compressed npz, no pickled objects) """
+        meta = {'format_version':FORMAT_VERSION, 'N_agents':self.N_agents, 'start_date':self.start_date.isoformat(),
+                'sampling_time':self.sampling_time, 'days':self.days, 'planes':list(self.planes)}
+        np.savez_compressed(path, meta=np.array(json.dumps(meta)), events=self.event_records,
+                            **{'plane.' + name: bits[:, :self.days] for name, bits in self.planes.items()})
+
+    @classmethod
+    def load(cls, path):
+        """ Read a store saved by save """
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(data['meta'].item())
+            if meta['format_version'] != FORMAT_VERSION:
+                raise ValueError(f"Unsupported schedule store format version {meta['format_version']}")
+            store = cls(meta['N_agents'], datetime.date.fromisoformat(meta['start_date']), meta['sampling_time'], planes=())
+            store.days = store.capacity = meta['days']
+            store.planes = {name: data['plane.' + name] for name in meta['planes']}
+            store._events = [data['events']]
+        return store
@@ -0,0 +1,80 @@
+""" sim_clock.py -> Integer simulation clock and calendar of the simulated days """
+
+# Import packages
+import datetime
+import tools as om_tools
+
+class Calendar:
+    """ Season, weekday/weekend and label (e.g. 'cool_wd') of the simulated days, indexed by day number from origin
+
+    The days are computed once with tools.get_season and tools.is_weekend (a whole horizon at once with extend),
+    the step loop only looks them up.
+    """
+    def __init__(self, origin) -> None:
+        self.origin = origin # Date of day 0
+        self.days = {} # day -> (season, weekend, label)
+
+    def date(self, day):
+        """ Date of a day number """
+        return self.origin + datetime.timedelta(days=day)
+
+    def extend(self, first_day, last_day):
+        """ Compute the days first_day to last_day (included) """
+        for day in range(first_day, last_day + 1):
+            if day not in self.days:
+                midnight = datetime.datetime.combine(self.date(day), datetime.time())
+                season = om_tools.get_season(midnight)
+                weekend = om_tools.is_weekend(midnight)
+                self.days[day] = (season, weekend, season + ('_we' if weekend else '_wd'))
+
+    def __getitem__(self, day):
+        entry = self.days.get(day)
+        if entry is None:
+            self.extend(day, day)
+            entry = self.days[day]
+        return entry
+
+class SimClock:
+    """ Simulation clock counting timesteps (ticks) from midnight of the day of start_datetime
+
+    The timestep of the day, the day number and its calendar entry (season, weekend, label) are plain attributes
+    updated with integer arithmetic as the clock advances, the calendar is only looked up at midnight.
+    Datetimes are only built for the outputs and the event log. The tick is the timestep simulated by the next step.
+    """
+    def __init__(self, start_datetime, sampling_frequency) -> None:
+        self.sampling_frequency = sampling_frequency
+        self.steps_per_day = int(1440/sampling_frequency)
+        self.step_seconds = sampling_frequency*60 # Duration of a timestep
+        self.origin = start_datetime.replace(hour=0, minute=0, second=0, microsecond=0) # Midnight of day 0
+        self.calendar = Calendar(self.origin.date())
+        self.move(self.index(start_datetime))
+
+    def index(self, current_datetime):
+        """ Tick of the timestep containing current_datetime """
+        return int((current_datetime - self.origin)//datetime.timedelta(minutes=self.sampling_frequency))
+
+    def move(self, tick):
+        """ Move the clock to a tick """
+        self.tick = tick
+        self.day, self.timestep_day = divmod(tick, self.steps_per_day)
+        self.season, self.weekend, self.label = self.calendar[self.day]
+
+    def set(self, current_datetime):
+        """ Move the clock to the timestep of current_datetime """
+        self.move(self.index(current_datetime))
+
+    def advance(self):
+        """ Move the clock to the next timestep """
+        self.tick += 1
+        self.timestep_day += 1
+        if self.timestep_day == self.steps_per_day:
+            self.move(self.tick)
+
+    def extend(self, periods):
+        """ Compute the calendar of the next periods timesteps """
+        self.calendar.extend(self.day, (self.tick + max(periods, 1) - 1)//self.steps_per_day)
+
+    @property
+    def datetime(self):
+        """ Datetime of the current timestep """
+        return self.origin + datetime.timedelta(minutes=self.sampling_frequency*self.tick)
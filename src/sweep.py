@@ -0,0 +1,56 @@
+""" sweep.py -> Parameter sweeps of the discomfort model with common random numbers across the parameter grid """
+
+# Import packages
+import itertools
+import numpy as np
+import ensemble as om_ensemble
+from model import OUTPUT_VARIABLES
+
+# Occupant parameters that can be swept (keyword arguments of OccupantModel)
+SWEEP_PARAMETERS = ['comfort_temperature', 'threshold', 'TFT_alpha', 'TFT_beta', 'discomfort_theory_name', 'tstat_db']
+
+def parameter_grid(**axes):
+    """ Cartesian product of parameter values, list of dicts (one per grid point)
+    e.g. parameter_grid(comfort_temperature=[68, 70, 72], threshold=[{'UL':3,'LL':-3}, {'UL':4,'LL':-4}])
+    """
+    for name in axes:
+        if name not in SWEEP_PARAMETERS:
+            raise ValueError(f"Unknown sweep parameter '{name}', expected one of {SWEEP_PARAMETERS}")
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+def grid_config(model_config, grid):
+    """ OccupantModel configuration simulating every grid point as a variant of the occupants
+
+    Parameters of the grid points override the ones of model_config and become arrays with one value per occupant
+    and variant (variant major), the other parameters are shared by the variants.
+    """
+    N_base = model_config['N_homes']*model_config['N_occupants_in_home']
+    config = dict(model_config, backend='population', n_variants=len(grid))
+    for name in grid[0]:
+        values = [point[name] for point in grid]
+        if name == 'threshold':
+            config[name] = {limit: np.repeat([value[limit] for value in values], N_base) for limit in ['UL', 'LL']}
+        else:
+            config[name] = np.repeat(values, N_base)
+    return config
+
+def run_sweep(model_config, grid, env, key=None, start=None, periods=None, replications=1, seed=None, workers=1):
+    """ Simulate every point of a parameter grid over replications of a scenario
+
+    The occupancy and routine schedules are realized once per replication and shared by all the grid points
+    (common random numbers), which are evaluated together as variants of the occupants of a single population.
+    model_config, env, key, start, periods: see ensemble.Scenario
+    grid: list of dicts of parameter values (see parameter_grid)
+    replications, seed, workers: see ensemble.run_ensemble
+
+    Returns a dict with the 'DateTime' of each timestep, the 'grid', the 'seed' and, for each of the OUTPUT_VARIABLES,
+    an array of shape (replications, periods, grid points, N_occupants)
+    """
+    scenario = om_ensemble.Scenario(grid_config(model_config, grid), env, key=key, start=start, periods=periods)
+    ensemble = om_ensemble.run_ensemble(scenario, replications, seed=seed, workers=workers)
+    results = {'DateTime':ensemble['DateTime'], 'grid':grid, 'seed':ensemble['seed']}
+    for var in OUTPUT_VARIABLES:
+        shape = ensemble[var].shape
+        results[var] = ensemble[var].reshape(shape[0], shape[1], len(grid), shape[2]//len(grid))
+    return results
@@ -0,0 +1,64 @@
+""" thermal_plant.py -> Reduced order (1R1C) thermal model of the homes with an on/off thermostat, vectorized over homes """
+
+# Import packages
+import numpy as np
+
+class Thermostat:
+    """ On/off thermostat with deadband, one per home
+
+    Heating turns on when T_in drops below T_stp_heat - tstat_db and off once T_in reaches T_stp_heat,
+    cooling turns on when T_in rises above T_stp_cool + tstat_db and off once T_in reaches T_stp_cool.
+    With tstat_db = 0 the equipment runs whenever T_in is on the wrong side of a setpoint.
+    """
+    def __init__(self, N_homes, tstat_db=0.0) -> None:
+        self.tstat_db = np.broadcast_to(np.asarray(tstat_db, dtype=float), (N_homes,)).copy()
+        self.heat_on = np.zeros(N_homes, dtype=bool)
+        self.cool_on = np.zeros(N_homes, dtype=bool)
+
+    def step(self, T_in, T_stp_cool, T_stp_heat):
+        """ Update the equipment state for the current indoor temperature and setpoints, returns (heat_on, cool_on) """
+        self.heat_on = np.where(self.heat_on, T_in < T_stp_heat, T_in < T_stp_heat - self.tstat_db)
+        self.cool_on = np.where(self.cool_on, T_in > T_stp_cool, T_in > T_stp_cool + self.tstat_db)
+        # Heating and cooling never run together, the one serving the larger error wins
+        both = self.heat_on & self.cool_on
+        heat_first = (T_stp_heat - T_in) >= (T_in - T_stp_cool)
+        self.heat_on = self.heat_on & ~(both & ~heat_first)
+        self.cool_on = self.cool_on & ~(both & heat_first)
+        return self.heat_on, self.cool_on
+
+class RCPlant:
+    """ 1R1C thermal model of N homes, temperatures in degree F
+
+    C dT_in/dt = (T_out - T_in)/R + Q, with Q the heating (+) or cooling (-) power of the equipment.
+    The equation is integrated exactly over each timestep for a constant T_out and Q.
+    Parameters can be scalars (same for all the homes) or arrays with one value per home:
+    - R: envelope resistance (degree F/kW), C: thermal capacitance (kWh/degree F), default time constant R*C = 20 h
+    - Q_heat, Q_cool: heating and cooling capacity (kW)
+    - T_in: initial indoor temperature (degree F)
+    """
+    def __init__(self, N_homes, sampling_time=5, R=3.6, C=5.6, Q_heat=10.0, Q_cool=7.0, T_in=70.0, tstat_db=0.0) -> None:
+        def per_home(value):
+            return np.broadcast_to(np.asarray(value, dtype=float), (N_homes,)).copy()
+
+        self.N_homes = N_homes
+        self.sampling_time = sampling_time # minutes
+        self.R = per_home(R)
+        self.C = per_home(C)
+        self.Q_heat = per_home(Q_heat)
+        self.Q_cool = per_home(Q_cool)
+        self.T_in = per_home(T_in)
+        self.thermostat = Thermostat(N_homes, tstat_db)
+
+        # Exact discretization: the indoor temperature decays towards T_out + Q*R with the time constant R*C
+        self.decay = np.exp(-(sampling_time/60)/(self.R*self.C))
+
+    def step(self, T_out, T_stp_cool, T_stp_heat):
+        """ Advance the homes by one timestep
+        T_out: outdoor temperature (degree F), T_stp_cool, T_stp_heat: thermostat setpoints (degree F), per home or scalars
+        Returns the indoor temperature at the end of the timestep and the equipment states (heat_on, cool_on) during it
+        """
+        heat_on, cool_on = self.thermostat.step(self.T_in, T_stp_cool, T_stp_heat)
+        Q = np.where(heat_on, self.Q_heat, 0) - np.where(cool_on, self.Q_cool, 0)
+        T_eq = T_out + Q*self.R
+        self.T_in = T_eq + (self.T_in - T_eq)*self.decay
+        return self.T_in, heat_on, cool_on
@@ -0,0 +1,133 @@
+""" tm_estimator.py -> Vectorized estimation of the habitual transition matrices (TM_habitual.csv) from DyD data """
+
+# Import packages
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+# Habitual transition matrices are defined for 5-minute timesteps, i.e. 288 timesteps per day
+N_TIMESTEPS = 288
+TIMESTEP_MINUTES = 5
+
+# Days counted by the weekday ('wd') and weekend ('we') transition matrices
+DAYTYPES = {'wd':[0, 1, 2, 3, 4], 'we':[5, 6]}
+
+def transition_counts(datetimes, states, select=None, order=1, check_gaps=True):
+    """ Count the state transitions between consecutive rows of a home's time series
+
+    datetimes: time of each row (5-minute data, sorted)
+    states: bool state of each row (e.g. manual setpoint change 'mdsp')
+    select: optional bool per row, only transitions from the selected rows are counted (e.g. weekdays)
+    order: 1 -> counts of (timestep, current state, next state), shape (288, 2, 2)
+           2 -> counts of (timestep, previous state, current state, next state), shape (288, 2, 2, 2)
+    check_gaps: skip transitions between rows that are not 5 minutes apart
+
+    The timestep of a transition is the one following the current state, i.e. timestep 1 counts the transitions from 23:55
+    (same convention as data_analysis/tools_ipynb.extract_TM_DyD and Markov_habitual_model).
+    """
+    datetimes = pd.DatetimeIndex(datetimes)
+    states = np.asarray(states, dtype=bool).astype(np.int64)
+    shape = (N_TIMESTEPS,) + (2,)*order + (2,)
+    if states.size <= order:
+        return np.zeros(shape, dtype=np.int64)
+
+    # Row of the current state of each transition, the next state is the following row
+    current = np.arange(order - 1, states.size - 1)
+    valid = np.ones(current.size, dtype=bool)
+    if select is not None:
+        valid &= np.asarray(select, dtype=bool)[current]
+    if check_gaps:
+        minutes = datetimes.asi8//(60*10**9)
+        for lag in range(order):
+            valid &= (minutes[current + 1 - lag] - minutes[current - lag]) == TIMESTEP_MINUTES
+    current = current[valid]
+
+    # Flat index of (timestep, [previous state,] current state, next state)
+    minute = datetimes.hour.values[current]*60 + datetimes.minute.values[current]
+    index = (minute//TIMESTEP_MINUTES + 1) % N_TIMESTEPS
+    for lag in range(order - 1, -1, -1):
+        index = index*2 + states[current - lag]
+    index = index*2 + states[current + 1]
+    return np.bincount(index, minlength=np.prod(shape)).reshape(shape)
+
+def home_counts(df, state_column='mdsp', daytype=None, order=1, check_gaps=True):
+    """ Transition counts of a home's DataFrame (columns DateTime and state_column)
+    daytype: 'wd' or 'we' to only count transitions from weekdays or weekends (see DAYTYPES), None for every day
+    """
+    if callable(df):
+        # Loader of the home's data, e.g. functools.partial(pd.read_hdf, path, key), called in the worker process
+        df = df()
+    datetimes = pd.DatetimeIndex(df['DateTime'])
+    select = None if daytype is None else np.isin(datetimes.weekday, DAYTYPES[daytype])
+    return transition_counts(datetimes, df[state_column].values, select=select, order=order, check_gaps=check_gaps)
+
+class TransitionCounter:
+    """ Transition counts accumulated over homes and months of data
+
+    Counts are additive, so partial counts of homes processed in parallel are merged by summing them,
+    and new months of data are added to the saved counts without reprocessing the old ones.
+    """
+    def __init__(self, order=1, counts=None) -> None:
+        self.order = order
+        shape = (N_TIMESTEPS,) + (2,)*order + (2,)
+        self.counts = np.zeros(shape, dtype=np.int64) if counts is None else np.array(counts, dtype=np.int64)
+        if self.counts.shape != shape:
+            raise ValueError(f"Transition counts of a order {order} model should have shape {shape}, got {self.counts.shape}")
+
+    def update(self, homes, state_column='mdsp', daytype=None, check_gaps=True, workers=1):
+        """ Add the transition counts of homes: DataFrames or callables returning one (loaded in the worker processes)
+        workers: number of worker processes (None: one per CPU, 1: count in the current process)
+        """
+        homes = list(homes)
+        kwargs = {'state_column':state_column, 'daytype':daytype, 'order':self.order, 'check_gaps':check_gaps}
+        if workers == 1:
+            for df in homes:
+                self.counts += home_counts(df, **kwargs)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                for counts in pool.map(_home_counts, homes, [kwargs]*len(homes)):
+                    self.counts += counts
+        return self
+
+    def merge(self, other):
+        """ Add the counts of another TransitionCounter """
+        if other.order != self.order:
+            raise ValueError('Cannot merge the transition counts of models of different orders')
+        self.counts += other.counts
+        return self
+
+    def probabilities(self):
+        """ Transition probabilities, states without observed transitions stay in state 0 (p_2_0 = 1) """
+        total = self.counts.sum(axis=-1, keepdims=True)
+        probs = np.divide(self.counts, total, out=np.zeros(self.counts.shape), where=total > 0)
+        probs[..., 0] = np.where(total[..., 0] > 0, probs[..., 0], 1)
+        return probs
+
+    def to_frame(self):
+        """ Transition matrix in the TM_habitual.csv format, readable by habitual_engine.HabitualEngine """
+        probs = self.probabilities().reshape(-1, 2)
+        cells = np.indices(self.counts.shape[:-1]).reshape(self.order + 1, -1)
+        if self.order == 1:
+            columns = {'time':cells[0] + 1, 'cur_state':cells[1]}
+        else:
+            columns = {'timestep':cells[0] + 1, 'prev_state':cells[1], 'cur_state':cells[2]}
+        return pd.DataFrame({**columns, 'p_2_0':probs[:,0], 'p_2_1':probs[:,1]})
+
+    def save(self, path):
+        """ Save the counts (.npz) to update them when new data arrives """
+        np.savez(path, counts=self.counts, order=self.order)
+
+    @classmethod
+    def load(cls, path):
+        """ Load counts saved with save """
+        with np.load(path) as data:
+            return cls(order=int(data['order']), counts=data['counts'])
+
+def _home_counts(df, kwargs):
+    return home_counts(df, **kwargs)
+
+def estimate_TM(homes, state_column='mdsp', daytype=None, order=1, check_gaps=True, workers=None):
+    """ Estimate a habitual transition matrix (TM_habitual.csv format) from the data of many homes, counted in parallel """
+    counter = TransitionCounter(order=order).update(homes, state_column=state_column, daytype=daytype,
+                                                    check_gaps=check_gaps, workers=workers)
+    return counter.to_frame()
@@ -1,12 +1,21 @@
 import numpy as np
 import pandas as pd
 import pickle
-import matplotlib.pyplot as plt
-import seaborn as sns
+import importlib
 import pathlib
 import datetime
-import warnings
 import math
+import instrumentation as om_instrumentation
+
+# Plotting packages, only imported when used (e.g. om_tools.plt, om_tools.sns) since the simulation does not need them
+_LAZY_MODULES = {'plt':'matplotlib.pyplot', 'sns':'seaborn'}
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        module = importlib.import_module(_LAZY_MODULES[name])
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def comfort_zone_theory(del_tin_tct, cz_threshold = {'UL':4,'LL':-4}):
@@ -21,21 +30,26 @@ def comfort_zone_theory(del_tin_tct, cz_threshold = {'UL':4,'LL':-4}):
         override = False
     return override
 
-def check_setpoints(T_stp_cool, T_stp_heat, current_datetime,tstat_db,temp_units):
+def check_setpoints(T_stp_cool, T_stp_heat, current_datetime,tstat_db,temp_units, instrumentation=om_instrumentation.DISABLED):
     """
     Cooling setpoint should always be greater than the heating setpoint. 
     If not, based on the season, the setpoints are adjusted for energy intensive overrides.
+    Adjustments are reported as events and counters of the instrumentation (off by default).
     """ 
     if T_stp_cool - tstat_db < T_stp_heat:
-        warnings.warn(f"Cooling setpoint({T_stp_cool}) - db({tstat_db}) is less than the heating setpoint({T_stp_heat})")
+        instrumentation.count('setpoint_overlap')
+        instrumentation.event(om_instrumentation.WARNING, 'setpoint_overlap', datetime=current_datetime,
+                              T_stp_cool=T_stp_cool, T_stp_heat=T_stp_heat, tstat_db=tstat_db)
         season = get_season(current_datetime)
         if season == 'cool':
             T_stp_heat = math.floor(T_stp_cool - (tstat_db + 0.5))
         elif season == 'heat':
             T_stp_cool = math.ceil(T_stp_heat + (tstat_db + 0.5))
     
-    if T_stp_cool < 0 | T_stp_heat < 0:
-        warnings.warn(f"Cooling setpoint {T_stp_cool} or heating setpoint {T_stp_heat} is less than 0")
+    if (T_stp_cool < 0) | (T_stp_heat < 0):
+        instrumentation.count('setpoint_negative')
+        instrumentation.event(om_instrumentation.WARNING, 'setpoint_negative', datetime=current_datetime,
+                              T_stp_cool=T_stp_cool, T_stp_heat=T_stp_heat)
         if temp_units == "F":
             T_stp_cool = 60
             T_stp_heat = 50
@@ -61,7 +75,7 @@ def frustration_theory(del_tin_tct, alpha=1, beta=1, thermal_frustration=[0], tf
         override = False
     return override
 
-def Markov_occupancy_model(init_data, sampling_time,current_datetime):
+def Markov_occupancy_model(init_data, sampling_time,current_datetime, rng=np.random):
     """ Generate a 1st order markov chain model that synthesizes occupancy schedule for the entire day
     Created using transition matrices discussed in the paper: https://doi.org/10.1016/j.enbuild.2008.02.006
     """
@@ -97,7 +111,7 @@ def Markov_occupancy_model(init_data, sampling_time,current_datetime):
             probs[0] = probs[0] + 1 - (probs[0] + probs[1])
         
         # Estimate the next state
-        next_state = np.random.choice([False, True], p = probs)
+        next_state = rng.choice([False, True], p = probs)
 
         # Add the next state based on the sampling time
         occupancy.append([next_state]*int(10/sampling_time))
@@ -116,40 +130,11 @@ def Markov_occupancy_model(init_data, sampling_time,current_datetime):
     return sampled_occupancy
 
 
-def Markov_habitual_model(TM,sampling_time):
-    """ Define a schedule for routine based habitual overrides using first order markov chain  """
-    # Intitating output variable
-    override_schedule = []
-
-    # 5-minutes sampling time used for transition matrices. 
-    # Therefore, the data is synthesized for 288 minutes numbers and is later sampled based on input parameter "sampling_time"
-    for timestep in range(0, 288):
-        
-        # Set state based on current timestep of the day
-        if timestep == 0:
-            # Start state is randomly selected
-            start_state = np.random.choice([False, True])
-            current_state = start_state
-        else:
-            current_state = override_schedule[timestep-1][0]
-        
-        # Get transition state for the period number
-        probs = TM.loc[(TM['time'] == timestep + 1) & (TM['cur_state'] == current_state), 'p_2_0':'p_2_1'].values[0]
-
-        # Probability should add up to 1 (Rounding off leads to thousandth of difference from 1)
-        if probs[0] + probs[1] != 1:
-            dif = abs(1 - probs[0] - probs[1])
-            probs[0] = probs[0] + dif
-        
-        # Estimate the next state
-        next_state = np.random.choice([False,True], p = probs)
-
-        # Add the next state based on the sampling time
-        override_schedule.append([next_state]*int(5/sampling_time))
-        
-    sampled_override_schedule = []
-    sampled_override_schedule = [y for x in override_schedule for y in x]
-    return sampled_override_schedule
+def Markov_habitual_model(TM,sampling_time, rng=np.random):
+    """ Define a schedule for routine based habitual overrides using first order markov chain
+    Sampled with the habitual_engine.HabitualEngine of TM, built on the first call (habitual_engine.compiled_engine) """
+    import habitual_engine as om_habitual
+    return list(om_habitual.compiled_engine(TM, sampling_time, order=1).sample_day(rng=rng))
 
 # Function to output season for the input date
 def get_season(current_datetime):
@@ -189,247 +174,61 @@ def is_weekend(current_datetime):
     return is_weekend
 
 # Determine routine msc schedule
-def realize_routine_msc(init_data, occupancy_schedule, current_datetime):
-    """ Given the input of Probability density functions, this function computes the next habitual override(s) based on the current season and current weekday/weekend"""
-    
-    # Initialize output variable
-    routine_msc_schedule = pd.DataFrame([], columns=['datetime','delT_cool','delT_heat'])
-    true_occupancy_dt = pd.to_datetime(occupancy_schedule.loc[occupancy_schedule['occupancy'] == True,'datetime'].values)
-    
-    if true_occupancy_dt.size > 10:
-        # Get current season
-        season = get_season(current_datetime)
-        weekend = is_weekend(current_datetime)
-        
-        # Get the probability density function for the current season and weekday/weekend
-        if weekend == True:
-            typeofday_label = 'we'
-        else:
-            typeofday_label = 'wd'
-        label = season + '_' + typeofday_label
-
-        # First realize the number of mscs per day i.e. N_mscpd
-        N = init_data[label +'_Nmscpd']['N'].values
-        probs = init_data[label+'_Nmscpd']['prob'].values
-        if np.sum(probs) != 1:
-                diff = abs(1 - np.sum(probs))
-                probs[0] = probs[0] + diff
-        N_mscpd = np.random.choice(N, p = probs)
-
-        if N_mscpd > 2:
-            # For now, any larger number of mscs is considered as 2 mscs,
-            # TODO: update when PDFs are available for higher number of MSCs
-            N_mscpd = 2
-
-        # N_mscpd = 2 # For testing purposes, # TODO: remove this line
-        if N_mscpd == 2:
-            # Realize the time of first msc i.e. t_msc_1
-            t_msc_1 = None
-            iterations = 0
-            while t_msc_1 not in true_occupancy_dt and true_occupancy_dt[-1] != t_msc_1:
-                iterations += 1
-                if iterations > 100:
-                    warnings.warn('Could not find a valid time for first msc')
-                data = init_data[label + '_' + str(N_mscpd) + 'mscpd_tod1']
-                tod_1 = data['tod'].values
-                prob = data['prob'].values
-                if np.sum(prob) != 1:
-                    diff = abs(1 - np.sum(prob))
-                    prob[0] = prob[0] + diff
-                t_msc_1 = datetime.datetime.combine(current_datetime.date(), pd.to_datetime(np.random.choice(tod_1, p = prob), format='%H:%M:%S').time())
-
-            # Realize the type of first msc i.e. type_msc_1
-            data = init_data[label + '_' + str(N_mscpd) + 'mscpd_type1']
-            types_1 = data['types'].values
-            prob = data['prob'].values
-            if np.sum(prob) != 1:
-                diff = abs(1 - np.sum(prob))
-                prob[0] = prob[0] + diff
-            type_1 = np.random.choice(types_1, p = prob)
-
-            # Realize the degree of first msc i.e. domsc_1
-            data = init_data[label + '_' + str(N_mscpd) + 'mscpd_'+ season + '_DOO1_'+ type_1 +'_type']
-            domscs_1 = np.array(data.columns[1:]).astype(int)
-            prob = np.array(data.loc[data['tod'] == str(t_msc_1.time())].values[0][1:]).astype(float)
-            if np.sum(prob) == 0:
-                domsc_1 = np.random.choice(domscs_1)
-            elif np.sum(prob) != 1:
-                diff = abs(1 - np.sum(prob))
-                prob[0] = prob[0] + diff
-                domsc_1 = np.random.choice(domscs_1, p = prob)
-            else:
-                domsc_1 = np.random.choice(domscs_1, p = prob)
-
-            # Realize the time of second msc i.e. t_msc_2 given the time of first msc i.e., t_msc_1
-            t_msc_2 = None
-            data = init_data[label + '_' + str(N_mscpd) + 'mscpd_tod2_tod1']
-            tod_2 = pd.to_datetime([datetime.datetime.combine(current_datetime.date(),pd.to_datetime(item, format='%H:%M:%S').time()) for item in data['tod'].values])
-            iterations = 0
-            while t_msc_2 not in true_occupancy_dt:
-                iterations += 1
-                if iterations > 100:
-                    warnings.warn('Could not find a valid time for second msc, choosing one from the true occupancy schedule after 1st msc')
-                    t_msc_2 = pd.to_datetime(np.random.choice(true_occupancy_dt[true_occupancy_dt> t_msc_1]))
-                    break
-                prob = np.array(data.loc[data.tod == str(t_msc_1.time())].values[0][1:]).astype(float)
-                if np.sum(prob) == 0:
-                    t_msc_2 = pd.to_datetime(np.random.choice(tod_2[tod_2 > t_msc_1]))
-                elif np.sum(prob) != 1:
-                    diff = abs(1 - np.sum(prob))
-                    prob[-1] = prob[-1] + diff
-                    t_msc_2 = pd.to_datetime(np.random.choice(tod_2,p =prob))
-                else:
-                    t_msc_2 = pd.to_datetime(np.random.choice(tod_2,p =prob))
-
-            # Realize the type of second msc i.e. type_msc_2 given the type of first msc i.e. type_1
-            data = init_data[label + '_' + str(N_mscpd) + 'mscpd_type2_type1_' + type_1]
-            types_2 = data['types'].values
-            prob = data['prob'].values
-            if np.sum(prob) != 1:
-                diff = abs(1 - np.sum(prob))
-                prob[0] = prob[0] + diff
-            type_2 = np.random.choice(types_2, p = prob)
-            
-            # Realize the degree of second msc i.e. DOO_msc_2 given the type and degree of first msc and type of second msc i.e. type_1, DOMSC_1, type_2
-            data = init_data[label + '_' + str(N_mscpd) + 'mscpd_row' + season + '_col' + season + '_DOO2_' + type_1 + '_type1_' + type_2 + '_type2']
-            domscs_2 = np.array(data.columns[1:]).astype(int)
-            prob = np.array(data.loc[data['doo'] == domsc_1].values[0][1:]).astype(float)
-            if np.sum(prob) != 1:
-                diff = abs(1 - np.sum(prob))
-                prob[0] = prob[0] + diff
-            domsc_2 = np.random.choice(domscs_2, p = prob)
-
-            if season == 'cool':
-                routine_msc_schedule.datetime = [t_msc_1,t_msc_2]
-                routine_msc_schedule.datetime = pd.Series(routine_msc_schedule.datetime.dt.to_pydatetime(),dtype='object')
-                routine_msc_schedule.delT_cool = [domsc_1,domsc_2]
-                routine_msc_schedule.delT_heat = [0,0]
-            elif season == 'heat':
-                routine_msc_schedule.datetime = [t_msc_1,t_msc_2]
-                routine_msc_schedule.datetime = pd.Series(routine_msc_schedule.datetime.dt.to_pydatetime(),dtype='object')
-                routine_msc_schedule.delT_cool = [0,0]
-                routine_msc_schedule.delT_heat = [domsc_1,domsc_2]
-
-        elif N_mscpd == 1:
-            # Realize the time of first msc i.e. t_msc_1
-            t_msc = None
-            iterations = 0
-            while t_msc not in true_occupancy_dt:
-                iterations += 1
-                if iterations > 100:
-                    warnings.warn('Could not find a valid time for msc')
-                data = init_data[label + '_' + str(N_mscpd) + 'mscpd_tod']
-                tod = data['tod'].values
-                prob = data['prob'].values
-                if np.sum(prob) != 1:
-                    diff = abs(1 - np.sum(prob))
-                    prob[0] = prob[0] + diff
-                t_msc = datetime.datetime.combine(current_datetime.date(), pd.to_datetime(np.random.choice(tod, p = prob), format='%H:%M:%S').time())
-
-            # Realize the type of first msc i.e. type_msc_1
-            data = init_data[label + '_' + str(N_mscpd) + 'mscpd_type']
-            types = data['types'].values
-            prob = data['prob'].values
-            if np.sum(prob) != 1:
-                diff = abs(1 - np.sum(prob))
-                prob[0] = prob[0] + diff
-            type = np.random.choice(types, p = prob)
-
-            # Realize the degree of first msc i.e. domsc
-            data = init_data[label + '_' + str(N_mscpd) + 'mscpd_'+ season + '_DOO_'+ type +'_type']
-            domscs = np.round(np.array(data.columns[1:]).astype('float')).astype('int')
-            prob = np.array(data.loc[data['tod'] == str(t_msc.time())].values[0][1:]).astype(float)
-            if np.sum(prob) != 1:
-                diff = abs(1 - np.sum(prob))
-                prob[0] = prob[0] + diff
-            domsc = np.random.choice(domscs, p = prob)
-            
-            if season == 'cool':
-                routine_msc_schedule.datetime = t_msc
-                routine_msc_schedule.datetime = pd.Series(routine_msc_schedule.datetime.dt.to_pydatetime(),dtype='object')
-                routine_msc_schedule.delT_cool = domsc
-                routine_msc_schedule.delT_heat =0
-            elif season == 'heat':
-                routine_msc_schedule.datetime = t_msc
-                routine_msc_schedule.datetime = pd.Series(routine_msc_schedule.datetime.dt.to_pydatetime(),dtype='object')
-                routine_msc_schedule.delT_cool = 0
-                routine_msc_schedule.delT_heat = domsc
-
-    return routine_msc_schedule
-
-def Markov_2nd_order_habitual_model(TM,sampling_time,current_datetime):
-    """ Generates routine based habitual overrides using second order markov chain for the day based on current season and weekday/weekend"""
-    # Intitating output variable
-    override_schedule = []
-
-    # Get current season
-    season = get_season(current_datetime)
-    weekend = is_weekend(current_datetime)
-
-    if season == 'summer' or season == 'fall':
-        if weekend == True:
-            tm_2_use = TM['cool_we']
-        else:
-            tm_2_use = TM['cool_wd']
-    else:
-        if weekend == True:
-            tm_2_use = TM['heat_we']
-        else:
-            tm_2_use = TM['heat_wd']
-            
-    # 5-minutes sampling time used for transition matrices. 
-    # Therefore, the data is synthesized for 288 minutes numbers and is later sampled based on input parameter "sampling_time"
-    for timestep in range(0, 288):
-        
-        # Set state based on current timestep of the day
-        if timestep == 0:
-            # Start state is randomly selected
-            prev_state = np.random.choice([False, True])
-            current_state = np.random.choice([False, True])
-        elif timestep == 1:
-            prev_state = current_state
-            current_state = override_schedule[timestep-1][0]
-        else:
-            prev_state = override_schedule[timestep-2][0]
-            current_state = override_schedule[timestep-1][0]
-        
-        # Get transition state for the period number
-        # probs = TM.loc[(TM['time'] == timestep + 1) & (TM['cur_state'] == current_state), 'p_2_0':'p_2_1'].values[0]
-        probs = tm_2_use.loc[(tm_2_use['timestep'] == timestep + 1) & 
-                             (tm_2_use['prev_state'] == prev_state) & 
-                             (tm_2_use['cur_state'] == current_state),
-                               'p_2_0':'p_2_1'].values[0]
-
-        # Probability should add up to 1 (Rounding off leads to thousandth of difference from 1)
-        if probs[0] + probs[1] != 1:
-            dif = abs(1 - probs[0] - probs[1])
-            probs[0] = probs[0] + dif
-        
-        # Estimate the next state
-        next_state = np.random.choice([False,True], p = probs)
-
-        # Add the next state based on the sampling time
-        override_schedule.append([next_state]*int(5/sampling_time))
-        
-    sampled_override_schedule = []
-    sampled_override_schedule = [y for x in override_schedule for y in x]
-    return sampled_override_schedule
-
-def decide_heat_cool_stp(DOMSC_cool, DOMSC_heat, T_stp_heat, T_stp_cool,current_datetime,tstat_db,temp_units):
+def realize_routine_msc(init_data, occupancy_schedule, current_datetime, rng=np.random):
+    """ Given the input of Probability density functions, this function computes the next habitual override(s) based on the current season and current weekday/weekend
+    The mscs are realized with routine_engine.realize_routine_msc, whose msc times are drawn at the occupied timesteps directly,
+    the PMFs of init_data are compiled on the first call (routine_engine.routine_tables) """
+    import routine_engine as om_routine
+
+    # Occupancy of the day, one value per timestep from midnight
+    occupancy = occupancy_schedule['occupancy'].values.astype(bool)
+    datetimes = pd.to_datetime(occupancy_schedule['datetime'].values)
+    sampling_time = int((datetimes[1] - datetimes[0]).total_seconds()//60) if len(datetimes) > 1 else 5
+
+    # The PMFs are only needed (and compiled) if the day has enough occupied timesteps for mscs
+    label = get_season(current_datetime) + '_' + ('we' if is_weekend(current_datetime) else 'wd')
+    routine_data = {}
+    if occupancy.sum() > om_routine.MIN_OCCUPIED_TIMESTEPS:
+        routine_data[label] = om_routine.routine_tables(init_data, label)
+    return om_routine.routine_msc_frame(*om_routine.realize_routine_msc(routine_data, occupancy, current_datetime, sampling_time,
+                                                                        rng=rng, label=label),
+                                        current_datetime=current_datetime)
+
+def Markov_2nd_order_habitual_model(TM,sampling_time,current_datetime, rng=np.random):
+    """ Generates routine based habitual overrides using second order markov chain for the day based on current season and weekday/weekend
+    TM: dict of transition matrices keyed by season_daytype (e.g. 'cool_wd'), sampled with the habitual_engine.HabitualEngine
+    of TM, built on the first call (habitual_engine.compiled_engine) """
+    import habitual_engine as om_habitual
+    return list(om_habitual.compiled_engine(TM, sampling_time, order=2).sample_day(current_datetime, rng=rng))
+
+def decide_heat_cool_stp(DOMSC_cool, DOMSC_heat, T_stp_heat, T_stp_cool,current_datetime,tstat_db,temp_units,
+                         instrumentation=om_instrumentation.DISABLED):
     """ Decide the change in setpoint based on indoor temperature difference from comfort temperature """
-    print('Occupant decides to override the thermostat setpoint')
+    instrumentation.event(om_instrumentation.DEBUG, 'setpoint_change', datetime=current_datetime,
+                          DOMSC_cool=DOMSC_cool, DOMSC_heat=DOMSC_heat)
     T_stp_cool = T_stp_cool + DOMSC_cool
     T_stp_heat = T_stp_heat + DOMSC_heat 
 
-    T_stp_cool, T_stp_heat = check_setpoints(T_stp_cool, T_stp_heat,current_datetime, tstat_db, temp_units)
+    T_stp_cool, T_stp_heat = check_setpoints(T_stp_cool, T_stp_heat,current_datetime, tstat_db, temp_units, instrumentation)
     
     return T_stp_cool, T_stp_heat
 
 def update_simulation_timestep(model):
-    if model.timestep_day == 1440/model.sampling_frequency:
-        model.timestep_day = 0
-    else:
-        model.timestep_day += 1
+    """ Advance the simulation clock by a timestep (the timestep of the day wraps around to 0 at midnight) """
+    model.clock.advance()
+
+def convert_env_to_F(ip_data_env, units):
+    """ Copy of the environment inputs with the temperatures (keys containing 'T_') converted to degree F
+    Values can be scalars or arrays (e.g. whole time series)
+    """
+    ip_data_env = dict(ip_data_env)
+    if units == 'C':
+        for var in [key for key in ip_data_env.keys() if 'T_' in key]:
+            if np.ndim(ip_data_env[var]):
+                ip_data_env[var] = np.round((np.asarray(ip_data_env[var]) * 9/5) + 32)
+            else:
+                ip_data_env[var] = C_to_F(ip_data_env[var])
+    return ip_data_env
 
 def C_to_F(T):
     # Convert temperature from Celsius to Fahrenheit
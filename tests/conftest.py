@@ -0,0 +1,32 @@
+""" Shared fixtures: synthetic init_data tables and environment time series (the DyD derived tables are not shipped) """
+
+# Import packages
+import pathlib
+import sys
+import pytest
+
+# The modules of src import each other as top-level modules
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / 'src'))
+from synthetic import START, make_init_data, make_env
+
+@pytest.fixture(scope='session')
+def init_data():
+    return make_init_data()
+
+@pytest.fixture(scope='session')
+def env():
+    return make_env()
+
+@pytest.fixture
+def make_model(init_data):
+    """ Factory of OccupantModels on the synthetic init_data, keyword arguments override the defaults """
+    import model as om_model
+
+    def make(**kwargs):
+        parameters = dict(units='F', N_homes=2, N_occupants_in_home=2, sampling_frequency=5,
+                          models={'model_classification':None, 'model_regressor':None}, init_data=init_data,
+                          comfort_temperature=68, discomfort_theory_name='tft', threshold={'UL':3, 'LL':-3},
+                          TFT_alpha=1, TFT_beta=1, start_datetime=START, tstat_db=1)
+        parameters.update(kwargs)
+        return om_model.OccupantModel(**parameters)
+    return make
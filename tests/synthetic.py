@@ -0,0 +1,82 @@
+""" synthetic.py -> Synthetic init_data tables and environment time series with the layout of the DyD derived inputs
+(the init_data csv tables are not shipped), used by the tests and the benchmarks """
+
+# Import packages
+import datetime
+import numpy as np
+import pandas as pd
+
+START = datetime.datetime(2019, 1, 1) # Tuesday
+TODS = [f"{minute//60:02d}:{minute%60:02d}:00" for minute in range(0, 1440, 5)]
+TYPES = ['inc', 'dec']
+DOO_INT = [str(value) for value in range(-4, 5)]
+DOO_FLOAT = [f"{value}.0" for value in range(-3, 4)]
+
+def _pmf(rng, n, zero_fraction=0.0):
+    """ Random PMF of n values rounded to 3 decimals like the csv tables, with a fraction of zero probabilities """
+    p = rng.random(n)
+    p[rng.random(n) < zero_fraction] = 0
+    if p.sum() == 0:
+        p[-1] = 1
+    p = np.round(p/p.sum(), 3)
+    p[np.argmax(p)] += 1 - p.sum()
+    return p
+
+def make_init_data(seed=0):
+    """ Synthetic init_data with the layout of the csv tables: occupancy TMs and routine msc PMFs of the 4 labels
+
+    Some time of day rows of the DOO1 and 2mscpd_tod2_tod1 tables have no probability mass, like in the DyD tables.
+    """
+    rng = np.random.default_rng(seed)
+    init_data = {}
+    for daytype in ['wd', 'we']:
+        rows = []
+        for period in range(1, 145):
+            for state in [False, True]:
+                occupied = np.round(rng.uniform(0.05, 0.95), 3)
+                rows.append([period, state, round(1 - occupied, 3), occupied])
+        init_data[f'occ_tm_{daytype}'] = pd.DataFrame(rows, columns=['Ten minute period number', 'Current state',
+                                                                     'Unoccup_prob', 'Occupied_prob'])
+    for season in ['cool', 'heat']:
+        for daytype in ['wd', 'we']:
+            label = f'{season}_{daytype}'
+            init_data[f'{label}_Nmscpd'] = pd.DataFrame({'N':[0, 1, 2, 3], 'prob':_pmf(rng, 4)})
+            init_data[f'{label}_2mscpd_tod1'] = pd.DataFrame({'tod':TODS, 'prob':_pmf(rng, 288, 0.5)})
+            init_data[f'{label}_1mscpd_tod'] = pd.DataFrame({'tod':TODS, 'prob':_pmf(rng, 288, 0.5)})
+            init_data[f'{label}_2mscpd_type1'] = pd.DataFrame({'types':TYPES, 'prob':_pmf(rng, 2)})
+            init_data[f'{label}_1mscpd_type'] = pd.DataFrame({'types':TYPES, 'prob':_pmf(rng, 2)})
+            for type1 in TYPES:
+                init_data[f'{label}_2mscpd_type2_type1_{type1}'] = pd.DataFrame({'types':TYPES, 'prob':_pmf(rng, 2)})
+                doo1 = pd.DataFrame([_pmf(rng, len(DOO_INT)) if rng.random() > 0.2 else np.zeros(len(DOO_INT)) for _ in TODS],
+                                    columns=DOO_INT)
+                doo1.insert(0, 'tod', TODS)
+                init_data[f'{label}_2mscpd_{season}_DOO1_{type1}_type'] = doo1
+                doo = pd.DataFrame([_pmf(rng, len(DOO_FLOAT)) for _ in TODS], columns=DOO_FLOAT)
+                doo.insert(0, 'tod', TODS)
+                init_data[f'{label}_1mscpd_{season}_DOO_{type1}_type'] = doo
+                for type2 in TYPES:
+                    doo2 = pd.DataFrame([_pmf(rng, len(DOO_INT)) for _ in DOO_INT], columns=DOO_INT)
+                    doo2.insert(0, 'doo', [int(value) for value in DOO_INT])
+                    init_data[f'{label}_2mscpd_row{season}_col{season}_DOO2_{type1}_type1_{type2}_type2'] = doo2
+            # The second msc follows the first one, rows without a later time of day have no mass
+            tod2_tod1 = np.zeros((288, 288))
+            for i in range(287):
+                if rng.random() > 0.1:
+                    tod2_tod1[i, i+1:] = _pmf(rng, 288 - i - 1, 0.3)
+            tod2_tod1 = pd.DataFrame(tod2_tod1, columns=TODS)
+            tod2_tod1.insert(0, 'tod', TODS)
+            init_data[f'{label}_2mscpd_tod2_tod1'] = tod2_tod1
+    return init_data
+
+def make_env(days=2, seed=0):
+    """ Synthetic environment inputs (degree F) of the model, one row per 5-minute timestep """
+    rng = np.random.default_rng(seed)
+    periods = 288*days
+    hour = np.arange(periods)*5/60
+    return pd.DataFrame({'T_ctrl':np.round(70 + 4*np.sin(2*np.pi*hour/24) + rng.normal(0, 1, periods), 1),
+                         'T_stp_cool':np.where(hour % 24 < 7, 76., 74.),
+                         'T_stp_heat':np.where(hour % 24 < 7, 64., 68.),
+                         'hum':np.round(rng.uniform(30, 50, periods)),
+                         'T_out':np.round(40 + 10*np.sin(2*np.pi*hour/24), 1),
+                         'equip_run_heat':rng.random(periods) < 0.3,
+                         'equip_run_cool':np.zeros(periods, dtype=bool)})
@@ -0,0 +1,77 @@
+""" A restored checkpoint or a fork continues the simulation as the uninterrupted run """
+
+# Import packages
+import json
+import numpy as np
+import pytest
+import checkpoint as om_checkpoint
+import model as om_model
+from synthetic import make_env
+
+CUT = 400 # Timestep of the checkpoint, within the second day
+
+def assert_results_equal(results, expected):
+    for var in om_model.OUTPUT_VARIABLES:
+        np.testing.assert_array_equal(results[var], expected[var], err_msg=var)
+
+def concatenate(*results):
+    return {var: np.concatenate([result[var] for result in results]) for var in ['DateTime', *om_model.OUTPUT_VARIABLES]}
+
+@pytest.fixture(params=['generator', 'run_seed'])
+def randomness(request):
+    """ Model arguments of the random streams: a model generator, or per-occupant streams """
+    if request.param == 'generator':
+        return lambda seed: {'rng':np.random.default_rng(seed)}
+    return lambda seed: {'rng':np.random.default_rng(seed), 'run_seed':5}
+
+@pytest.mark.parametrize('backend', ['agents', 'population'])
+def test_restore_continues_run(make_model, env, tmp_path, backend, randomness):
+    expected = make_model(backend=backend, **randomness(1)).run(env)
+
+    model = make_model(backend=backend, **randomness(1))
+    first = model.run(env.iloc[:CUT])
+    om_checkpoint.save_checkpoint(model, tmp_path / 'checkpoint.npz')
+
+    # A new model with another random generator, set to the state of the checkpoint
+    restored = om_checkpoint.restore(make_model(backend=backend, **randomness(2)), om_checkpoint.load_checkpoint(tmp_path / 'checkpoint.npz'))
+    second = restored.run(env.iloc[CUT:])
+    assert_results_equal(concatenate(first, second), expected)
+    np.testing.assert_array_equal(concatenate(first, second)['DateTime'], expected['DateTime'])
+
+@pytest.mark.parametrize('backend', ['agents', 'population'])
+def test_forks_continue_run(make_model, env, backend, randomness):
+    model = make_model(backend=backend, **randomness(1))
+    model.run(env.iloc[:CUT])
+    forks = om_checkpoint.fork(model, 2)
+    results = [fork.run(env.iloc[CUT:]) for fork in forks]
+    # The forks continue the model's random stream (common random numbers) without changing the model
+    expected = model.run(env.iloc[CUT:])
+    for result in results:
+        assert_results_equal(result, expected)
+
+def test_forks_with_own_generators(make_model):
+    env = make_env(days=3)
+    model = make_model(backend='population', rng=np.random.default_rng(1))
+    model.run(env.iloc[:CUT])
+    forks = om_checkpoint.fork(model, 2, rngs=[np.random.default_rng(10), np.random.default_rng(11)])
+    results = [fork.run(env.iloc[CUT:]) for fork in forks]
+    # The forks share the day's schedules, the next days' schedules are drawn from their own generators
+    rest_of_day = 2*288 - CUT
+    for var in om_model.OUTPUT_VARIABLES:
+        np.testing.assert_array_equal(results[0][var][:rest_of_day], results[1][var][:rest_of_day], err_msg=var)
+    assert not np.array_equal(results[0]['Motion'][rest_of_day:], results[1]['Motion'][rest_of_day:])
+
+def test_restore_other_configuration(make_model, env):
+    model = make_model(backend='population')
+    model.run(env.iloc[:10])
+    with pytest.raises(ValueError, match='N_homes'):
+        om_checkpoint.restore(make_model(backend='population', N_homes=3), om_checkpoint.snapshot(model))
+
+def test_load_other_format_version(make_model, env, tmp_path):
+    model = make_model(backend='population')
+    model.run(env.iloc[:10])
+    state = om_checkpoint.snapshot(model)
+    meta = dict(state.pop('meta'), format_version=om_checkpoint.FORMAT_VERSION - 1, rng_state={})
+    np.savez(tmp_path / 'checkpoint.npz', meta=np.array(json.dumps(meta)), **state)
+    with pytest.raises(ValueError, match='format version'):
+        om_checkpoint.load_checkpoint(tmp_path / 'checkpoint.npz')
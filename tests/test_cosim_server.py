@@ -0,0 +1,68 @@
+""" Co-simulation server against the stand-in simulator client """
+
+# Import packages
+import asyncio
+import datetime
+import numpy as np
+import pytest
+import cosim_server as om_cosim
+from synthetic import START
+
+def cosim_env(env, N_homes):
+    """ Environment of the homes for the client, arrays of shape (timesteps, N_homes) """
+    columns = {'T_in':'T_ctrl'}
+    return {var: np.repeat(np.asarray(env[columns.get(var, var)], dtype=float)[:, np.newaxis], N_homes, axis=1)
+            for var in om_cosim.COSIM_INPUTS}
+
+def serve(models, session, tmp_path):
+    """ Run a client session (coroutine function of the client) against a server of the models on a unix socket """
+    async def main():
+        server = om_cosim.CosimServer(models)
+        await server.start_unix(str(tmp_path / 'cosim.sock'))
+        async with server.server:
+            client = await om_cosim.CosimClient.connect_unix(str(tmp_path / 'cosim.sock'))
+            try:
+                return await session(client)
+            finally:
+                await client.close()
+    return asyncio.run(main())
+
+@pytest.mark.parametrize('window', [1, 64])
+def test_replay_matches_run(make_model, env, tmp_path, window):
+    env = env.iloc[:400]
+    seeds = {0:11, 3:12}
+    models = {scenario: make_model(backend='population', run_seed=seed) for scenario, seed in seeds.items()}
+    datetimes = [START + datetime.timedelta(minutes=5*timestep) for timestep in range(len(env))]
+    envs = {scenario: cosim_env(env, model.N_homes) for scenario, model in models.items()}
+    results = serve(models, lambda client: client.replay(envs, datetimes, window=window), tmp_path)
+
+    for scenario, seed in seeds.items():
+        expected = make_model(backend='population', run_seed=seed).run(env)
+        for var in ['T_stp_cool', 'T_stp_heat', *om_cosim.FLAGS]:
+            np.testing.assert_array_equal(results[scenario][var], expected[var], err_msg=f"{var} of scenario {scenario}")
+        assert expected['Habitual override'].any() and expected['Discomfort override'].any()
+
+def test_errors(make_model, env, tmp_path):
+    model = make_model(backend='population', run_seed=1)
+    step = {var: values[0] for var, values in cosim_env(env, model.N_homes).items()}
+
+    async def session(client):
+        errors = []
+        for scenario, values in [(0, {var: value[:1] for var, value in step.items()}), (5, step)]:
+            client.send_step(scenario, 0, START, values)
+            with pytest.raises(RuntimeError) as error:
+                await client.receive()
+            errors.append(str(error.value))
+        # The session goes on after errors
+        client.send_step(0, 1, START, step)
+        return errors, await client.receive()
+
+    errors, (scenario, seq, output) = serve({0:model}, session, tmp_path)
+    assert 'has 2 homes, got 1' in errors[0]
+    assert 'Invalid frame for scenario 5' in errors[1]
+    assert (scenario, seq) == (0, 1)
+    assert output['T_stp_cool'].shape == (model.N_homes*model.N_occupants_in_home,)
+
+def test_requires_population(make_model):
+    with pytest.raises(ValueError, match='population'):
+        om_cosim.CosimServer({0:make_model(backend='agents')})
@@ -0,0 +1,67 @@
+""" Discomfort trackers and offline evaluation of the CZT and TFT theories """
+
+# Import packages
+import numpy as np
+import pytest
+import discomfort as om_discomfort
+import tools as om_tools
+
+@pytest.mark.parametrize('N_homes, N_occupants_in_home', [(2, 2), (5, 4)])
+def test_frustration_matches_model(make_model, env, N_homes, N_occupants_in_home):
+    # 4 occupants are evaluated one by one, 20 occupants together (SCALAR_TFT_OCCUPANTS)
+    results = make_model(backend='population', N_homes=N_homes, N_occupants_in_home=N_occupants_in_home, run_seed=6).run(env)
+    overrides, frustration = om_discomfort.evaluate_discomfort(results['Comfort Delta'], results['Motion'], 'tft',
+                                                               threshold={'UL':3, 'LL':-3}, TFT_alpha=1, TFT_beta=1)
+    np.testing.assert_array_equal(frustration, results['Thermal Frustration'])
+    # The model's discomfort overrides are the triggers left after the habitual overrides and the lockout
+    assert not (results['Discomfort override'] & ~overrides).any()
+    assert results['Discomfort override'].any()
+
+def test_scalar_and_vectorized_tft_paths():
+    rng = np.random.default_rng(0)
+    del_tin_tct = rng.normal(0, 2, (500, 40))
+    occupied = rng.random((500, 40)) < 0.8
+    parameters = dict(discomfort_theory_name=np.where(np.arange(40) % 3 == 0, 'czt', 'tft'), threshold={'UL':rng.uniform(2, 6, 40), 'LL':-4},
+                      TFT_alpha=rng.uniform(0.5, 1, 40), TFT_beta=1, thermal_frustration=rng.normal(0, 1, 40))
+    overrides, frustration = om_discomfort.evaluate_discomfort(del_tin_tct, occupied, **parameters)
+    assert om_discomfort.SCALAR_TFT_OCCUPANTS <= 40
+    for occupant in range(0, 40, 5):
+        one = {name: value[occupant] if np.ndim(value) else value for name, value in parameters.items() if name != 'threshold'}
+        one['threshold'] = {'UL':parameters['threshold']['UL'][occupant], 'LL':-4}
+        expected_overrides, expected_frustration = om_discomfort.evaluate_discomfort(del_tin_tct[:, occupant], occupied[:, occupant], **one)
+        np.testing.assert_array_equal(overrides[:, occupant], expected_overrides[:, 0])
+        np.testing.assert_array_equal(frustration[:, occupant], expected_frustration[:, 0])
+    # CZT occupants have no frustration
+    assert not frustration[:, ::3].any()
+    np.testing.assert_array_equal(overrides[:, 0], occupied[:, 0] & ((del_tin_tct[:, 0] > parameters['threshold']['UL'][0]) |
+                                                                     (del_tin_tct[:, 0] < -4)))
+
+def test_tracker_matches_frustration_theory():
+    deltas = np.random.default_rng(1).normal(0.5, 1.5, 200)
+    threshold = {'UL':4, 'LL':-4}
+    tracker = om_discomfort.FrustrationTracker(0.9, 1.1, threshold, record_history=True)
+    thermal_frustration = [0]
+    for delta in deltas:
+        expected = om_tools.frustration_theory(delta, 0.9, 1.1, thermal_frustration=thermal_frustration, tf_threshold=threshold)
+        assert tracker.step(delta) == expected
+        assert tracker.value == (0 if expected else thermal_frustration[-1])
+    assert tracker.history == thermal_frustration
+
+def test_tracker_history():
+    assert om_discomfort.FrustrationTracker().history is None
+    tracker = om_discomfort.FrustrationTracker(threshold={'UL':4, 'LL':-4}, record_history=True)
+    tracker.step(1.5)
+    tracker.reset() # The occupant leaves
+    tracker.reset()
+    tracker.step(-5) # Override
+    assert tracker.history == [0, 1.5, 0, -5, 0]
+    assert tracker.value == 0
+
+def test_model_records_frustration_history(make_model, env):
+    model = make_model(backend='agents', record_frustration=True, run_seed=6)
+    results = model.run(env)
+    for column, agent in enumerate(model.schedule.agents):
+        history = np.array(agent.frustration.history)
+        # The outputs are the values of the history after each timestep, the history holds the values before the resets
+        assert set(results['Thermal Frustration'][:, column]) <= set(history)
+        assert len(history) > 1
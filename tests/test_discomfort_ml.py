@@ -0,0 +1,64 @@
+""" ML discomfort theory: override classifier and time to override regressor """
+
+# Import packages
+import numpy as np
+import pytest
+import discomfort_ml as om_discomfort_ml
+
+class Classifier:
+    """ Discomfort when the indoor temperature is above 72 degree F """
+    n_features_in_ = len(om_discomfort_ml.ML_FEATURES)
+
+    def predict(self, X):
+        return X[:, 0] > 72
+
+class Regressor:
+    """ Time to override (timesteps) decreasing with the indoor temperature """
+    n_features_in_ = len(om_discomfort_ml.ML_FEATURES)
+
+    def predict(self, X):
+        return np.maximum(80 - X[:, 0], 0)/2
+
+def env(T_in):
+    return {'T_in':T_in, 'T_stp_cool':74, 'T_stp_heat':68, 'hum':40, 'T_out':50, 'equip_run_heat':False, 'equip_run_cool':False}
+
+def test_time_to_override_in_timesteps():
+    ml = om_discomfort_ml.MLDiscomfort(Classifier(), Regressor())
+    X = om_discomfort_ml.feature_matrix(env(np.array([73, 75, 81])), np.ones(3, dtype=bool))
+    # The regressor estimates timesteps, the predictions are rounded (and negative ones clipped)
+    np.testing.assert_array_equal(ml.time_to_override(X), [4, 2, 0])
+
+def test_override_after_time_to_override():
+    ml = om_discomfort_ml.MLDiscomfort(Classifier(), Regressor(), N=2)
+    overrides = [ml.step(env(np.array([75, 70])), occupied=[True, True]) for _ in range(5)]
+    # Discomfort at the first timestep, override 2 timesteps later (TTO = round(5/2))
+    np.testing.assert_array_equal(overrides, [[False, False], [False, False], [True, False], [False, False], [False, False]])
+
+def test_day_matches_step():
+    rng = np.random.default_rng(0)
+    T_in = np.round(rng.uniform(68, 80, (288, 3)))
+    occupancy = rng.random((288, 3)) < 0.8
+    stepped = om_discomfort_ml.MLDiscomfort(Classifier(), Regressor(), N=3)
+    expected = [stepped.step(env(T_in[timestep]), occupancy[timestep]) for timestep in range(288)]
+    day = om_discomfort_ml.MLDiscomfort(Classifier(), Regressor(), N=3).day(env(T_in), occupancy)
+    np.testing.assert_array_equal(day, expected)
+    assert day.any()
+
+@pytest.mark.parametrize('model', ['classifier', 'regressor'])
+def test_feature_count_checked(model):
+    other = type('Model', (), {'n_features_in_':len(om_discomfort_ml.ML_FEATURES) - 1, 'predict':Regressor.predict})()
+    models = {'classifier':Classifier(), 'regressor':Regressor(), model:other}
+    with pytest.raises(ValueError, match=f"{model} was fitted on 7 features"):
+        om_discomfort_ml.MLDiscomfort(models['classifier'], models['regressor'])
+
+def test_models_required():
+    with pytest.raises(ValueError, match='model_regressor'):
+        om_discomfort_ml.MLDiscomfort(Classifier(), None)
+
+def test_population_matches_agents(make_model, env):
+    models = {'model_classification':Classifier(), 'model_regressor':Regressor()}
+    agents = make_model(backend='agents', discomfort_theory_name='ml', models=models, run_seed=5).run(env)
+    population = make_model(backend='population', discomfort_theory_name='ml', models=models, run_seed=5).run(env)
+    for var in ['Motion', 'T_stp_cool', 'T_stp_heat', 'Habitual override', 'Discomfort override']:
+        np.testing.assert_array_equal(population[var], agents[var], err_msg=var)
+    assert agents['Discomfort override'].any()
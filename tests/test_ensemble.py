@@ -0,0 +1,35 @@
+""" Monte Carlo ensembles are reproducible and independent of the number of workers """
+
+# Import packages
+import numpy as np
+import pytest
+import ensemble as om_ensemble
+import model as om_model
+from synthetic import START
+
+@pytest.fixture
+def model_config(init_data):
+    return dict(units='F', N_homes=2, N_occupants_in_home=2, sampling_frequency=5,
+                models={'model_classification':None, 'model_regressor':None}, init_data=init_data, comfort_temperature=68,
+                discomfort_theory_name='tft', threshold={'UL':3, 'LL':-3}, TFT_alpha=1, TFT_beta=1, start_datetime=START, tstat_db=1)
+
+@pytest.mark.parametrize('backend', ['agents', 'population'])
+def test_results_independent_of_workers(model_config, env, backend):
+    scenario = om_ensemble.Scenario(dict(model_config, backend=backend), env)
+    serial = om_ensemble.run_ensemble(scenario, 3, seed=11, workers=1)
+    parallel = om_ensemble.run_ensemble(scenario, 3, seed=11, workers=2)
+    assert serial['seed'] == parallel['seed'] == 11
+    np.testing.assert_array_equal(parallel['DateTime'], serial['DateTime'])
+    for var in om_model.OUTPUT_VARIABLES:
+        assert serial[var].shape == (3, len(env), 4)
+        np.testing.assert_array_equal(parallel[var], serial[var], err_msg=var)
+    # The replications draw different schedules
+    assert not np.array_equal(serial['Motion'][0], serial['Motion'][1])
+
+def test_replication_matches_model_run(model_config, env):
+    ensemble = om_ensemble.run_ensemble(om_ensemble.Scenario(dict(model_config, backend='population'), env), 2, seed=4, workers=1)
+    children = np.random.SeedSequence(4).spawn(2)
+    for replication, child in enumerate(children):
+        expected = om_model.OccupantModel(**model_config, backend='population', rng=np.random.default_rng(child)).run(env)
+        for var in om_model.OUTPUT_VARIABLES:
+            np.testing.assert_array_equal(ensemble[var][replication], expected[var], err_msg=var)
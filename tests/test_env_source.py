@@ -0,0 +1,85 @@
+""" Streaming the environment inputs from a DyD HDF5 file in prefetched chunks """
+
+# Import packages
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+import checkpoint as om_checkpoint
+import env_source as om_env_source
+import model as om_model
+from synthetic import START
+
+pytest.importorskip('tables')
+
+@pytest.fixture
+def dyd_env(env):
+    return env.assign(DateTime=pd.date_range(START, periods=len(env), freq='5min'))[om_env_source.DYD_COLUMNS]
+
+@pytest.fixture
+def path(dyd_env, tmp_path):
+    path = tmp_path / 'dyd.h5'
+    for home in ['home_a', 'home_b']:
+        dyd_env.to_hdf(path, key=home, format='table')
+    dyd_env.iloc[::-1].to_hdf(path, key='unsorted', format='table')
+    return path
+
+def concatenate(results):
+    return {var: np.concatenate([result[var] for result in results]) for var in results[0]}
+
+def test_keys(path):
+    source = om_env_source.HDFEnvironmentSource(path)
+    assert sorted(source.keys) == ['/home_a', '/home_b', '/unsorted']
+    assert source.nrows['/home_a'] == 576
+    assert om_env_source.HDFEnvironmentSource(path, keys=['home_b']).keys == ['home_b']
+
+@pytest.mark.parametrize('start, stop', [(0, None), (50, 333), (100, 1000)])
+def test_chunk_boundaries(path, dyd_env, start, stop):
+    source = om_env_source.HDFEnvironmentSource(path, chunksize=100, prefetch=1)
+    chunks = list(source.chunks('/home_a', start=start, stop=stop))
+    expected = dyd_env.iloc[start:stop].reset_index(drop=True)
+    assert [len(chunk) for chunk in chunks] == [min(100, len(expected) - first) for first in range(0, len(expected), 100)]
+    assert all(chunk.index[0] == 0 for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+
+def test_unsorted_rows(path):
+    source = om_env_source.HDFEnvironmentSource(path, chunksize=100)
+    with pytest.raises(ValueError, match='not sorted by DateTime'):
+        list(source.chunks('/unsorted'))
+
+def test_stop_iterating_early(path):
+    threads = set(threading.enumerate())
+    source = om_env_source.HDFEnvironmentSource(path, chunksize=50, prefetch=1)
+    chunks = source.chunks('/home_a')
+    next(chunks)
+    # The reader is blocked on the full buffer, closing the iterator stops it
+    assert len(set(threading.enumerate()) - threads) == 1
+    chunks.close()
+    assert set(threading.enumerate()) == threads
+
+@pytest.mark.parametrize('backend', ['agents', 'population'])
+def test_simulate_matches_run(make_model, path, dyd_env, backend):
+    expected = make_model(backend=backend, run_seed=2).run(dyd_env)
+    source = om_env_source.HDFEnvironmentSource(path, chunksize=100)
+    results = concatenate(list(om_env_source.simulate(make_model(backend=backend, run_seed=2), source.chunks('/home_a'), start=START)))
+    for var in om_model.OUTPUT_VARIABLES:
+        np.testing.assert_array_equal(results[var], expected[var], err_msg=var)
+
+def test_resume_from_checkpoint(make_model, path, dyd_env, tmp_path):
+    expected = make_model(backend='population', rng=np.random.default_rng(4)).run(dyd_env)
+    source = om_env_source.HDFEnvironmentSource(path, chunksize=150)
+
+    # The run fails after the first 2 chunks
+    model = make_model(backend='population', rng=np.random.default_rng(4))
+    first = []
+    for results in om_env_source.simulate(model, source.chunks('/home_a'), start=START, checkpoint_path=tmp_path / 'checkpoint.npz'):
+        first.append(results)
+        if len(first) == 2:
+            break
+
+    model = om_checkpoint.restore(make_model(backend='population'), om_checkpoint.load_checkpoint(tmp_path / 'checkpoint.npz'))
+    assert model.schedule.steps == 300
+    rest = list(om_env_source.simulate(model, source.chunks('/home_a', start=model.schedule.steps)))
+    results = concatenate(first + rest)
+    for var in ['DateTime', *om_model.OUTPUT_VARIABLES]:
+        np.testing.assert_array_equal(results[var], expected[var], err_msg=var)
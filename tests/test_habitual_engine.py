@@ -0,0 +1,93 @@
+""" Compiled habitual override models """
+
+# Import packages
+import datetime
+import pathlib
+import numpy as np
+import pandas as pd
+import pytest
+import habitual_engine as om_habitual
+import tools as om_tools
+
+DAY = datetime.datetime(2019, 1, 1)
+
+@pytest.fixture(scope='module')
+def TM():
+    return pd.read_csv(pathlib.Path(__file__).resolve().parents[1] / 'input_data' / 'TM_habitual.csv')
+
+@pytest.fixture(scope='module')
+def TM_2nd_order(TM):
+    """ 2nd order transition matrices of every label, with label specific probabilities """
+    rng = np.random.default_rng(0)
+    TMs = {}
+    for label in om_habitual.LABELS:
+        rows = []
+        for prev_state in [0, 1]:
+            tm = TM.rename(columns={'time':'timestep'}).assign(prev_state=prev_state)
+            p = np.round(np.clip(tm['p_2_1'].values + rng.uniform(-0.2, 0.2, len(tm)), 0, 1), 3)
+            rows.append(tm.assign(p_2_0=np.round(1 - p, 3), p_2_1=p))
+        TMs[label] = pd.concat(rows, ignore_index=True)[['timestep', 'prev_state', 'cur_state', 'p_2_0', 'p_2_1']]
+    return TMs
+
+def markov_reference(TM, uniforms, order):
+    """ Markov models of tools (row lookup per timestep) realized from the engine's uniforms """
+    states = [bool(u >= 0.5) for u in uniforms[:order]]
+    schedule = []
+    for timestep in range(om_habitual.N_TIMESTEPS):
+        rows = TM['timestep' if order == 2 else 'time'] == timestep + 1
+        rows &= TM['cur_state'] == states[-1]
+        if order == 2:
+            rows &= TM['prev_state'] == states[-2]
+        probs = TM.loc[rows, 'p_2_0':'p_2_1'].values[0]
+        if probs[0] + probs[1] != 1:
+            probs[0] = probs[0] + abs(1 - probs[0] - probs[1])
+        next_state = bool(uniforms[order + timestep] >= probs[0]/(probs[0] + probs[1]))
+        schedule.append(next_state)
+        states = states[1:] + [next_state]
+    return np.array(schedule)
+
+def test_first_order_matches_markov_model(TM):
+    engine = om_habitual.HabitualEngine(TM, sampling_time=5, order=1)
+    uniforms = engine.draw_uniforms(3, rng=np.random.default_rng(0))
+    schedules = engine.sample(0, uniforms)
+    for day_uniforms, schedule in zip(uniforms, schedules):
+        np.testing.assert_array_equal(schedule, markov_reference(TM, day_uniforms, order=1))
+
+def test_second_order_matches_markov_model(TM_2nd_order):
+    engine = om_habitual.HabitualEngine(TM_2nd_order, sampling_time=5, order=2)
+    uniforms = engine.draw_uniforms(2, rng=np.random.default_rng(1))
+    for label in ['cool_wd', 'heat_we']:
+        schedules = engine.sample(engine.labels.index(label), uniforms)
+        for day_uniforms, schedule in zip(uniforms, schedules):
+            np.testing.assert_array_equal(schedule, markov_reference(TM_2nd_order[label], day_uniforms, order=2))
+
+def test_sample_days(TM_2nd_order):
+    engine = om_habitual.HabitualEngine(TM_2nd_order, sampling_time=1, order=2)
+    days = [DAY + datetime.timedelta(days=day) for day in range(7)]
+    schedules = engine.sample_days(days, n_agents=3, rng=np.random.default_rng(0))
+    assert schedules.shape == (3, 7, 1440)
+    # Each transition timestep is repeated over the 5 one-minute timesteps it covers
+    np.testing.assert_array_equal(schedules[..., ::5].repeat(5, axis=-1), schedules)
+
+def test_tools_adapters_use_compiled_engine(TM, TM_2nd_order):
+    engine = om_habitual.compiled_engine(TM, 5)
+    assert om_habitual.compiled_engine(TM, 5) is engine
+    assert om_habitual.compiled_engine(TM.copy(), 5) is not engine
+    assert om_habitual.compiled_engine(TM_2nd_order, 5, order=2) is not engine
+
+    schedule = om_tools.Markov_habitual_model(TM, 5, rng=np.random.default_rng(2))
+    np.testing.assert_array_equal(schedule, engine.sample_day(rng=np.random.default_rng(2)))
+    schedule = om_tools.Markov_2nd_order_habitual_model(TM_2nd_order, 5, DAY, rng=np.random.default_rng(3))
+    np.testing.assert_array_equal(schedule, om_habitual.compiled_engine(TM_2nd_order, 5, order=2).sample_day(DAY, rng=np.random.default_rng(3)))
+
+def test_compiled_engines_are_bounded(TM):
+    engine = om_habitual.compiled_engine(TM, 5)
+    copies = [TM.copy() for _ in range(om_habitual.CACHE_SIZE)]
+    for copy in copies:
+        om_habitual.compiled_engine(copy, 5)
+    # The least recently used TM is released
+    assert len(om_habitual._engines) == om_habitual.CACHE_SIZE
+    assert all(entry[0] is not TM for entry in om_habitual._engines.values())
+    assert om_habitual.compiled_engine(TM, 5) is not engine
+    # Using an engine keeps it
+    assert om_habitual.compiled_engine(TM, 5) is om_habitual.compiled_engine(TM, 5)
@@ -0,0 +1,80 @@
+""" init_data bundles: roundtrip of the tables, memory mapped loading and schema checks """
+
+# Import packages
+import io
+import json
+import zipfile
+import numpy as np
+import pandas as pd
+import pytest
+import init_data_store as om_init_data_store
+import model as om_model
+
+@pytest.fixture
+def bundle(init_data, tmp_path):
+    return om_init_data_store.save_init_data(init_data, tmp_path / 'init_data')
+
+@pytest.mark.parametrize('mmap_mode', ['r', None])
+def test_roundtrip(init_data, bundle, mmap_mode):
+    assert bundle.suffix == '.npz'
+    loaded = om_init_data_store.load_init_data(bundle, mmap_mode=mmap_mode)
+    assert sorted(loaded) == sorted(init_data)
+    for name, table in init_data.items():
+        assert loaded[name].equals(table), name
+    # Loaded once per process
+    assert om_init_data_store.load_init_data(bundle, mmap_mode=mmap_mode) is loaded
+
+def test_numeric_columns_are_memory_mapped(init_data, bundle):
+    loaded = om_init_data_store.load_init_data(bundle)
+    # Read-only views of the file instead of arrays read into memory
+    values = loaded['occ_tm_wd']['Occupied_prob'].values
+    assert not values.flags.writeable and not values.flags.owndata
+    np.testing.assert_array_equal(values, init_data['occ_tm_wd']['Occupied_prob'].values)
+    assert om_init_data_store.load_init_data(bundle, mmap_mode=None)['occ_tm_wd']['Occupied_prob'].values.flags.writeable
+
+@pytest.mark.parametrize('version', [(1, 0), (2, 0)])
+def test_member_offset(tmp_path, version):
+    values = np.arange(12, dtype=float).reshape(3, 4, order='F')
+    path = tmp_path / 'members.zip'
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name in ['first.npy', 'second.npy']:
+            member = io.BytesIO()
+            np.lib.format.write_array(member, values if name == 'second.npy' else values[:1], version=version)
+            archive.writestr(zipfile.ZipInfo(name), member.getvalue())
+    with zipfile.ZipFile(path) as archive:
+        buffer = path.read_bytes()
+        offset = om_init_data_store._member_offset(buffer, archive.getinfo('second.npy'))
+    np.testing.assert_array_equal(np.frombuffer(buffer, dtype=float, count=12, offset=offset).reshape(3, 4, order='F'), values)
+
+def test_schema_errors(init_data, tmp_path):
+    tables = dict(init_data, occ_tm_wd=init_data['occ_tm_wd'].drop(columns='Occupied_prob'))
+    with pytest.raises(ValueError, match=r"occ_tm_wd has no column \['Occupied_prob'\]"):
+        om_init_data_store.save_init_data(tables, tmp_path / 'missing.npz')
+    tables = dict(init_data, cool_wd_Nmscpd=init_data['cool_wd_Nmscpd'].assign(N=['0', 1, 2, 3]))
+    with pytest.raises(ValueError, match='cool_wd_Nmscpd: Column N mixes strings'):
+        om_init_data_store.save_init_data(tables, tmp_path / 'mixed.npz')
+
+def test_other_format_version(init_data, bundle, tmp_path):
+    with np.load(bundle) as data:
+        arrays = {key: data[key] for key in data.files}
+    meta = json.loads(arrays.pop('meta').item())
+    meta['format_version'] = om_init_data_store.FORMAT_VERSION + 1
+    np.savez(tmp_path / 'other.npz', meta=np.array(json.dumps(meta)), **arrays)
+    with pytest.raises(ValueError, match='format version'):
+        om_init_data_store.load_init_data(tmp_path / 'other.npz')
+
+def test_convert_csv_dir(init_data, tmp_path):
+    for name in ['occ_tm_wd', 'cool_wd_Nmscpd', 'cool_wd_1mscpd_tod']:
+        init_data[name].to_csv(tmp_path / f'{name}.csv', index=False)
+    loaded = om_init_data_store.load_init_data(om_init_data_store.convert_csv_dir(tmp_path, tmp_path / 'bundle.npz'))
+    assert sorted(loaded) == ['cool_wd_1mscpd_tod', 'cool_wd_Nmscpd', 'occ_tm_wd']
+    pd.testing.assert_frame_equal(loaded['cool_wd_1mscpd_tod'], pd.read_csv(tmp_path / 'cool_wd_1mscpd_tod.csv'))
+    with pytest.raises(FileNotFoundError):
+        om_init_data_store.convert_csv_dir(tmp_path / 'empty', tmp_path / 'empty.npz')
+
+@pytest.mark.parametrize('backend', ['agents', 'population'])
+def test_model_on_bundle_matches_dict(make_model, env, bundle, backend):
+    expected = make_model(backend=backend, run_seed=3).run(env)
+    results = make_model(backend=backend, run_seed=3, init_data=str(bundle)).run(env)
+    for var in om_model.OUTPUT_VARIABLES:
+        np.testing.assert_array_equal(results[var], expected[var], err_msg=var)
@@ -0,0 +1,54 @@
+""" OccupantModel.run reproduces the step by step simulation """
+
+# Import packages
+import datetime
+import numpy as np
+import pytest
+import model as om_model
+from synthetic import START
+
+@pytest.mark.parametrize('backend', ['agents', 'population'])
+def test_run_matches_step(make_model, env, backend):
+    results = make_model(backend=backend, run_seed=1).run(env)
+
+    stepped = make_model(backend=backend, run_seed=1)
+    for timestep, row in env.iterrows():
+        stepped.step({'DateTime':START + datetime.timedelta(minutes=5*timestep), 'T_in':row['T_ctrl'],
+                      'T_stp_cool':row['T_stp_cool'], 'T_stp_heat':row['T_stp_heat'], 'hum':row['hum'], 'T_out':row['T_out'],
+                      'mo':None, 'equip_run_heat':row['equip_run_heat'], 'equip_run_cool':row['equip_run_cool']})
+        output = stepped.current_output()
+        for var in om_model.OUTPUT_VARIABLES:
+            np.testing.assert_array_equal(results[var][timestep], output[var], err_msg=f"{var} at timestep {timestep}")
+
+def test_run_continues_from_last_timestep(make_model, env):
+    results = make_model(run_seed=2).run(env)
+    model = make_model(run_seed=2)
+    first = model.run(env, periods=300)
+    second = model.run(env.iloc[300:])
+    assert second['DateTime'][0] == np.datetime64(START + datetime.timedelta(minutes=5*300))
+    for var in om_model.OUTPUT_VARIABLES:
+        np.testing.assert_array_equal(np.concatenate([first[var], second[var]]), results[var], err_msg=var)
+
+def test_run_periods_longer_than_environment(make_model, env):
+    model = make_model()
+    with pytest.raises(ValueError, match=f"{len(env) + 1} timesteps.*{len(env)} rows"):
+        model.run(env, periods=len(env) + 1)
+    assert model.schedule.steps == 0
+
+def test_run_missing_input(make_model, env):
+    with pytest.raises(KeyError, match='T_stp_heat'):
+        make_model().run(env.drop(columns='T_stp_heat'))
+
+@pytest.mark.parametrize('drop, periods, error', [('T_stp_heat', None, KeyError), (None, 1000, ValueError)])
+def test_failed_run_leaves_clock(make_model, env, drop, periods, error):
+    results = make_model(run_seed=2).run(env)
+    model = make_model(run_seed=2)
+    first = model.run(env, periods=300)
+    tick, current_datetime = model.clock.tick, model.clock.datetime
+    with pytest.raises(error):
+        model.run(env.iloc[300:].drop(columns=[drop] if drop else []), start=START + datetime.timedelta(days=5), periods=periods)
+    assert (model.clock.tick, model.clock.datetime) == (tick, current_datetime)
+    # The run continues from the last simulated timestep
+    second = model.run(env.iloc[300:])
+    for var in om_model.OUTPUT_VARIABLES:
+        np.testing.assert_array_equal(np.concatenate([first[var], second[var]]), results[var], err_msg=var)
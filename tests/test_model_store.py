@@ -0,0 +1,64 @@
+""" Model store of the discomfort ML models and lazy imports of the plotting packages """
+
+# Import packages
+import pathlib
+import pickle
+import subprocess
+import sys
+import numpy as np
+import pytest
+import discomfort_ml as om_discomfort_ml
+import model as om_model
+import model_store as om_model_store
+
+joblib = pytest.importorskip('joblib')
+ensemble = pytest.importorskip('sklearn.ensemble')
+
+SRC = pathlib.Path(__file__).resolve().parents[1] / 'src'
+
+@pytest.fixture(scope='module')
+def models():
+    """ Small random forests fitted on the ML features: discomfort above 72 degree F and a time to override """
+    rng = np.random.default_rng(0)
+    X = rng.uniform(60, 85, (400, len(om_discomfort_ml.ML_FEATURES)))
+    classifier = ensemble.RandomForestClassifier(n_estimators=5, max_depth=4, random_state=0).fit(X, X[:, 0] > 72)
+    regressor = ensemble.RandomForestRegressor(n_estimators=5, max_depth=4, random_state=0).fit(X, np.maximum(80 - X[:, 0], 0))
+    return {'model_classification':classifier, 'model_regressor':regressor}
+
+def test_save_load(models, tmp_path):
+    store = om_model_store.save_models(dict(models, weights=np.arange(1000.0)), tmp_path / 'store')
+    assert sorted(path.name for path in store.iterdir()) == ['model_classification.joblib', 'model_regressor.joblib', 'weights.joblib']
+    loaded = om_model_store.load_models(str(store))
+    assert sorted(loaded) == ['model_classification', 'model_regressor', 'weights']
+    X = np.random.default_rng(1).uniform(60, 85, (50, len(om_discomfort_ml.ML_FEATURES)))
+    for name in ['model_classification', 'model_regressor']:
+        np.testing.assert_array_equal(loaded[name].predict(X), models[name].predict(X))
+    # Arrays are memory mapped read-only, the store is loaded once per process
+    assert isinstance(loaded['weights'], np.memmap) and not loaded['weights'].flags.writeable
+    assert om_model_store.load_models(store) is loaded
+
+def test_convert_pickles(models, tmp_path):
+    (tmp_path / 'pickles').mkdir()
+    for name, model in models.items():
+        with open(tmp_path / 'pickles' / f'{name}.pkl', 'wb') as file:
+            pickle.dump(model, file)
+    store = om_model_store.convert_pickles(tmp_path / 'pickles', tmp_path / 'store')
+    assert sorted(om_model_store.load_models(store)) == sorted(models)
+
+def test_empty_store(tmp_path):
+    with pytest.raises(FileNotFoundError, match='No models'):
+        om_model_store.load_models(tmp_path)
+
+def test_model_on_store_matches_dict(make_model, env, models, tmp_path):
+    store = om_model_store.save_models(models, tmp_path / 'store')
+    expected = make_model(backend='population', discomfort_theory_name='ml', models=models, run_seed=1).run(env)
+    results = make_model(backend='population', discomfort_theory_name='ml', models=str(store), run_seed=1).run(env)
+    for var in om_model.OUTPUT_VARIABLES:
+        np.testing.assert_array_equal(results[var], expected[var], err_msg=var)
+    assert expected['Discomfort override'].any()
+
+def test_plotting_packages_imported_lazily():
+    code = ("import sys; sys.path.insert(0, sys.argv[1]); import model, tools; "
+            "assert 'matplotlib' not in sys.modules and 'seaborn' not in sys.modules; "
+            "tools.plt; assert 'matplotlib.pyplot' in sys.modules and 'seaborn' not in sys.modules")
+    subprocess.run([sys.executable, '-c', code, str(SRC)], check=True)
@@ -0,0 +1,32 @@
+""" The compiled occupancy model reproduces tools.Markov_occupancy_model for the same random stream """
+
+# Import packages
+import datetime
+import numpy as np
+import pytest
+import tools as om_tools
+import occupancy_engine as om_occupancy
+
+@pytest.mark.parametrize('sampling_time', [5, 10])
+@pytest.mark.parametrize('day', [datetime.datetime(2019, 1, 1), datetime.datetime(2019, 1, 5)]) # Weekday, weekend
+def test_sample_day_matches_markov_occupancy_model(init_data, sampling_time, day):
+    engine = om_occupancy.OccupancyEngine(init_data=init_data, sampling_time=sampling_time)
+    for seed in range(5):
+        legacy = om_tools.Markov_occupancy_model(init_data, sampling_time, day, rng=np.random.RandomState(seed))
+        occupancy = engine.sample_day(day, rng=np.random.RandomState(seed))
+        assert occupancy.shape == (1440//sampling_time,)
+        np.testing.assert_array_equal(occupancy, legacy['occupancy'].values.astype(bool))
+
+def test_occupancy_frame_matches_markov_occupancy_model(init_data):
+    day = datetime.datetime(2019, 1, 1)
+    engine = om_occupancy.OccupancyEngine(init_data=init_data, sampling_time=5)
+    legacy = om_tools.Markov_occupancy_model(init_data, 5, day, rng=np.random.RandomState(1))
+    frame = om_occupancy.occupancy_frame(engine.sample_day(day, rng=np.random.RandomState(1)), day, 5)
+    assert list(frame['datetime']) == list(legacy['datetime'])
+    assert (frame['occupancy'].values == legacy['occupancy'].values).all()
+
+def test_sample_days_shape(init_data):
+    engine = om_occupancy.OccupancyEngine(init_data=init_data, sampling_time=5)
+    occupancy = engine.sample_days([False, True, False], n_agents=4, rng=np.random.default_rng(0))
+    assert occupancy.shape == (4, 3, 288)
+    assert occupancy.dtype == bool
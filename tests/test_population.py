@@ -0,0 +1,48 @@
+""" The population backend reproduces the outputs of the mesa agents """
+
+# Import packages
+import numpy as np
+import pytest
+import model as om_model
+
+def assert_results_equal(results, expected):
+    np.testing.assert_array_equal(results['DateTime'], expected['DateTime'])
+    for var in om_model.OUTPUT_VARIABLES:
+        np.testing.assert_array_equal(results[var], expected[var], err_msg=var)
+
+@pytest.mark.parametrize('theory', ['tft', 'czt'])
+@pytest.mark.parametrize('units', ['F', 'C'])
+def test_population_matches_agents(make_model, env, theory, units):
+    parameters = dict(discomfort_theory_name=theory, units=units, run_seed=7,
+                      comfort_temperature=20 if units == 'C' else 68)
+    if units == 'C':
+        env = env.copy()
+        for column in ['T_ctrl', 'T_stp_cool', 'T_stp_heat', 'T_out']:
+            env[column] = np.round((env[column] - 32)*5/9, 1)
+    agents = make_model(backend='agents', **parameters).run(env)
+    population = make_model(backend='population', **parameters).run(env)
+    assert_results_equal(population, agents)
+    # The horizon exercises both kinds of overrides
+    assert agents['Habitual override'].any()
+    assert agents['Discomfort override'].any()
+
+def test_population_matches_agents_within_day(make_model, env):
+    # The schedules are generated at the first step when the simulation starts within a day
+    start = om_model.datetime.datetime(2019, 1, 1, 13, 35)
+    agents = make_model(backend='agents', run_seed=3, start_datetime=start).run(env)
+    population = make_model(backend='population', run_seed=3, start_datetime=start).run(env)
+    assert_results_equal(population, agents)
+
+def test_check_setpoints_matches_tools(monkeypatch):
+    import population as om_population
+    import tools as om_tools
+    rng = np.random.default_rng(0)
+    T_stp_cool, T_stp_heat = rng.integers(-5, 30, 50).astype(float), rng.integers(-5, 30, 50).astype(float)
+    units_C = rng.random(50) < 0.5
+    day = om_model.datetime.datetime(2019, 1, 1)
+    for season in ['heat', 'cool']:
+        monkeypatch.setattr(om_tools, 'get_season', lambda current_datetime: season)
+        cool, heat = om_population.check_setpoints(T_stp_cool, T_stp_heat, season, 1.0, units_C)
+        expected = [om_tools.check_setpoints(c, h, day, 1.0, 'C' if C else 'F') for c, h, C in zip(T_stp_cool, T_stp_heat, units_C)]
+        np.testing.assert_array_equal(cool, [c for c, _ in expected])
+        np.testing.assert_array_equal(heat, [h for _, h in expected])
@@ -0,0 +1,38 @@
+""" The recorded outputs match the outputs of OccupantModel.run """
+
+# Import packages
+import importlib.util
+import numpy as np
+import pytest
+import model as om_model
+import recorder as om_recorder
+
+def record(model, env, path, **kwargs):
+    with om_recorder.OutputRecorder.for_model(model, path, chunksize=100, **kwargs) as recorder:
+        model.run(env, recorder=recorder)
+
+@pytest.mark.parametrize('backend, n_variants', [('agents', 1), ('population', 1), ('population', 2)])
+def test_recorded_outputs_match_run(make_model, env, tmp_path, backend, n_variants):
+    parameters = dict(backend=backend, run_seed=4, n_variants=n_variants)
+    if n_variants > 1:
+        parameters['threshold'] = {'UL':np.repeat([3, 5], 4), 'LL':-3}
+    results = make_model(**parameters).run(env)
+    model = make_model(**parameters)
+    record(model, env, tmp_path / 'outputs.h5')
+
+    for home_ID in range(model.N_homes):
+        frame = om_recorder.read_home(tmp_path / 'outputs.h5', home_ID)
+        assert len(frame) == len(env)*model.N_occupants_in_home*n_variants
+        assert ('variant' in frame) == (n_variants > 1)
+        for variant in range(n_variants):
+            for occupant_ID in range(model.N_occupants_in_home):
+                rows = frame[(frame['occupant_ID'] == occupant_ID) & (frame['variant'] == variant if n_variants > 1 else True)]
+                column = (variant*model.N_homes + home_ID)*model.N_occupants_in_home + occupant_ID
+                np.testing.assert_array_equal(rows['DateTime'].values, results['DateTime'])
+                for var in om_model.OUTPUT_VARIABLES:
+                    np.testing.assert_array_equal(rows[var].values, results[var][:, column], err_msg=var)
+
+@pytest.mark.skipif(importlib.util.find_spec('pyarrow') is not None, reason='pyarrow is installed')
+def test_parquet_requires_pyarrow(make_model, tmp_path):
+    with pytest.raises(ImportError, match='pyarrow'):
+        om_recorder.OutputRecorder.for_model(make_model(), tmp_path / 'outputs', format='parquet')
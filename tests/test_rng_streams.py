@@ -0,0 +1,45 @@
+""" Per-occupant random streams: any day of an occupant is regenerated without simulating the previous days """
+
+# Import packages
+import datetime
+import numpy as np
+import pytest
+import rng_streams as om_rng_streams
+import schedule_bank as om_schedule_bank
+from synthetic import START, make_env
+
+@pytest.mark.parametrize('bank', [False, True])
+@pytest.mark.parametrize('backend', ['agents', 'population'])
+def test_regenerate_day_matches_run(make_model, backend, bank):
+    schedule_bank = None
+    if bank:
+        model = make_model(backend='population')
+        schedule_bank = om_schedule_bank.ScheduleBank.generate(model.occupancy_engine, model.routine_data, size=16, seed=0)
+    model = make_model(backend=backend, run_seed=8, record_schedules=True, schedule_bank=schedule_bank)
+    model.run(make_env(days=3))
+    store = model.schedule_store
+
+    regenerated = make_model(backend=backend, run_seed=8, schedule_bank=schedule_bank)
+    for day in [2, 0]:
+        routine = store.routine_arrays(day)
+        for agent in range(model.N_homes*model.N_occupants_in_home):
+            home_ID, occupant_ID = divmod(agent, model.N_occupants_in_home)
+            occupancy, routine_msc, delT_cool, delT_heat = om_rng_streams.regenerate_day(regenerated, home_ID, occupant_ID,
+                                                                                         START + datetime.timedelta(days=day, hours=5))
+            np.testing.assert_array_equal(occupancy, store.schedule('occupancy', day, agents=agent))
+            for values, expected in zip([routine_msc, delT_cool, delT_heat], routine):
+                np.testing.assert_array_equal(values, expected[agent])
+
+def test_streams_are_independent():
+    streams = om_rng_streams.OccupantStreams(1)
+    day = datetime.datetime(2019, 1, 1)
+    draws = {(home_ID, occupant_ID, days): streams.day(home_ID, occupant_ID, day + datetime.timedelta(days=days)).random()
+             for home_ID in range(3) for occupant_ID in range(2) for days in range(3)}
+    assert len(set(draws.values())) == len(draws)
+    # A stream only depends on the run seed, the occupant and the day
+    assert om_rng_streams.OccupantStreams(1).day(2, 1, day + datetime.timedelta(days=2)).random() == draws[(2, 1, 2)]
+    assert om_rng_streams.OccupantStreams(2).day(2, 1, day + datetime.timedelta(days=2)).random() != draws[(2, 1, 2)]
+
+def test_regenerate_day_requires_run_seed(make_model):
+    with pytest.raises(ValueError, match='run_seed'):
+        om_rng_streams.regenerate_day(make_model(), 0, 0, START)
@@ -0,0 +1,151 @@
+""" Routine msc model: compiled PMFs and realized mscs """
+
+# Import packages
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+import occupancy_engine as om_occupancy
+import routine_engine as om_routine
+import tools as om_tools
+from synthetic import TODS
+
+DAY = datetime.datetime(2019, 1, 1) # 'cool_wd'
+
+def two_msc_tables(init_data, tod_1):
+    """ RoutineTables of 'cool_wd' that always realize two mscs, the first one at the time of day tod_1 (minutes) """
+    init_data = dict(init_data)
+    init_data['cool_wd_Nmscpd'] = pd.DataFrame({'N':[0, 1, 2, 3], 'prob':[0, 0, 1, 0]})
+    init_data['cool_wd_2mscpd_tod1'] = pd.DataFrame({'tod':TODS, 'prob':np.arange(288) == tod_1//5})
+    return om_routine.RoutineTables(init_data, 'cool_wd')
+
+def test_cumulative_probability_matches_choice():
+    prob = np.array([0.2, 0.301, 0.5]) # Rounded PMF, patched at fix_index
+    values = np.arange(3)
+    for fix_index in [0, -1]:
+        pmf = om_routine.DiscretePMF(values, prob, fix_index)
+        patched = prob.copy()
+        patched[fix_index] += abs(1 - prob.sum())
+        for seed in range(20):
+            expected = np.random.RandomState(seed).choice(values, p=patched/patched.sum())
+            assert pmf.sample(np.random.RandomState(seed).random()) == expected
+
+def test_masked_sample_is_conditioned_on_mask():
+    pmf = om_routine.DiscretePMF(np.arange(4), [0.1, 0.2, 0.3, 0.4])
+    mask = np.array([False, True, False, True])
+    draws = [pmf.sample_masked(mask, u) for u in np.linspace(0, 1, 60, endpoint=False)]
+    assert set(draws) == {1, 3}
+    assert draws.count(1) == pytest.approx(60*0.2/0.6, abs=1)
+    assert pmf.sample_masked(np.zeros(4, dtype=bool), 0.5) is None
+
+def test_second_msc_without_pmf(init_data):
+    tod2_tod1 = om_routine.RoutineTables(init_data, 'cool_wd').tod2_tod1
+    tod_1 = next(tod for tod in tod2_tod1.keys[:-12] if not tod2_tod1.has_mass(tod))
+    tables = two_msc_tables(init_data, tod_1)
+    occupancy = np.random.default_rng(0).random(288) < 0.7
+    occupancy[tod_1//5] = True
+    occupied_after = set(np.flatnonzero(occupancy)[np.flatnonzero(occupancy)*5 > tod_1]*5)
+
+    second = []
+    for seed in range(200):
+        minutes, delT_cool, delT_heat = om_routine.realize_tables_msc(tables, occupancy, 5, rng=np.random.default_rng(seed))
+        assert minutes.size == 2 and minutes[0] == tod_1
+        second.append(minutes[1])
+    # Uniform among the occupied times after the first msc, not a point mass at the last time of day
+    assert set(second) <= occupied_after
+    assert len(set(second)) > len(occupied_after)//2
+
+def test_random_stream(init_data):
+    # Two mscs, the first one without DOO1 mass (uniform degree) and the second one without a time PMF (uniform time)
+    tod2_tod1 = om_routine.RoutineTables(init_data, 'cool_wd').tod2_tod1
+    tod_1 = next(tod for tod in tod2_tod1.keys[:-12] if not tod2_tod1.has_mass(tod))
+    tables = two_msc_tables(init_data, tod_1)
+    for DOO1 in tables.DOO1.values():
+        DOO1.mass[:] = False # No mass at any time
+    occupancy = np.random.default_rng(0).random(288) < 0.7
+    occupancy[tod_1//5] = True
+    tod_2 = np.flatnonzero(occupancy)*5
+    tod_2 = tod_2[tod_2 > tod_1]
+    for seed in range(20):
+        minutes, delT_cool, delT_heat = om_routine.realize_tables_msc(tables, occupancy, 5, rng=np.random.RandomState(seed))
+        # One uniform per realized quantity: N_mscpd, tod_1, type_1, domsc_1, tod_2, type_2, domsc_2
+        u = np.random.RandomState(seed).random(7)
+        type_1 = tables.type1.sample(u[2])
+        domscs_1 = tables.DOO1[type_1].values
+        assert delT_cool[0] == domscs_1[int(u[3]*len(domscs_1))]
+        assert minutes[1] == tod_2[int(u[4]*len(tod_2))]
+        assert delT_cool[1] == tables.DOO2_DOO1[(type_1, tables.type2_type1[type_1].sample(u[5]))].sample(delT_cool[0], u[6])
+
+def test_second_msc_without_pmf_nor_occupied_time_after_first(init_data):
+    tod2_tod1 = om_routine.RoutineTables(init_data, 'cool_wd').tod2_tod1
+    tod_1 = next(tod for tod in tod2_tod1.keys[:-12] if not tod2_tod1.has_mass(tod))
+    tables = two_msc_tables(init_data, tod_1)
+    occupancy = np.arange(288) <= tod_1//5 # Leaves after the first msc
+    for seed in range(20):
+        minutes, delT_cool, delT_heat = om_routine.realize_tables_msc(tables, occupancy, 5, rng=np.random.default_rng(seed))
+        np.testing.assert_array_equal(minutes, [tod_1])
+        assert delT_cool.size == delT_heat.size == 1
+
+@pytest.mark.parametrize('sampling_time', [5, 10])
+def test_mscs_at_occupied_timesteps(init_data, sampling_time):
+    routine_data = om_routine.compile_routine_data(init_data)
+    engine = om_occupancy.OccupancyEngine(init_data=init_data, sampling_time=sampling_time)
+    rng = np.random.default_rng(0)
+    realized = 0
+    for day in [DAY, DAY + datetime.timedelta(days=4)]:
+        for _ in range(100):
+            occupancy = engine.sample_day(day, rng=rng)
+            minutes, delT_cool, delT_heat = om_routine.realize_routine_msc(routine_data, occupancy, day, sampling_time, rng=rng)
+            assert occupancy[minutes//sampling_time].all()
+            assert (minutes % sampling_time == 0).all()
+            if minutes.size == 2:
+                assert minutes[1] > minutes[0]
+            np.testing.assert_array_equal(delT_heat, 0) # 'cool' season
+            realized += minutes.size
+    assert realized > 0
+
+def test_routine_tables_compiled_once(init_data):
+    tables = om_routine.routine_tables(init_data, 'cool_wd')
+    assert om_routine.routine_tables(init_data, 'cool_wd') is tables
+    assert om_routine.routine_tables(dict(init_data), 'cool_wd') is not tables
+    assert om_routine.routine_tables(init_data, 'cool_we') is not tables
+
+def test_routine_tables_are_bounded(init_data):
+    tables = om_routine.routine_tables(init_data, 'cool_wd')
+    copies = [dict(init_data) for _ in range(om_routine.CACHE_SIZE)]
+    for copy in copies:
+        om_routine.routine_tables(copy, 'cool_wd')
+    # The least recently used init_data is released
+    assert len(om_routine._compiled) == om_routine.CACHE_SIZE
+    assert all(entry[0] is not init_data for entry in om_routine._compiled.values())
+    assert om_routine.routine_tables(init_data, 'cool_wd') is not tables
+
+def test_tools_realize_routine_msc(init_data):
+    engine = om_occupancy.OccupancyEngine(init_data=init_data, sampling_time=5)
+    occupancy = om_occupancy.occupancy_frame(engine.sample_day(DAY, rng=np.random.default_rng(1)), DAY, 5)
+    frame = om_tools.realize_routine_msc(init_data, occupancy, DAY, rng=np.random.default_rng(2))
+    minutes, delT_cool, delT_heat = om_routine.realize_tables_msc(om_routine.RoutineTables(init_data, 'cool_wd'),
+                                                                  occupancy['occupancy'].values, 5, rng=np.random.default_rng(2))
+    expected = om_routine.routine_msc_frame(minutes, delT_cool, delT_heat, DAY)
+    pd.testing.assert_frame_equal(frame, expected)
+    assert set(frame['datetime']) <= set(occupancy.loc[occupancy['occupancy'], 'datetime'])
+
+def test_low_occupancy_day(init_data):
+    occupancy = np.zeros(288, dtype=bool)
+    occupancy[100:100 + om_routine.MIN_OCCUPIED_TIMESTEPS] = True
+    # No mscs, the PMFs of the day are not needed
+    for minutes in om_routine.realize_routine_msc({}, occupancy, DAY, 5, rng=np.random.default_rng(0)):
+        assert minutes.size == 0
+    frame = om_tools.realize_routine_msc(init_data, om_occupancy.occupancy_frame(occupancy, DAY, 5), DAY, rng=np.random.default_rng(0))
+    assert frame.empty
+    assert list(frame.columns) == ['datetime', 'delT_cool', 'delT_heat']
+
+@pytest.mark.parametrize('backend', ['agents', 'population'])
+def test_model_without_occupants_at_home(make_model, init_data, env, backend):
+    # Occupants leave at the first period and never come back, the routine PMFs of the days are not needed
+    init_data = {name: table for name, table in init_data.items() if not name.startswith('cool_')}
+    for daytype in ['wd', 'we']:
+        init_data[f'occ_tm_{daytype}'] = init_data[f'occ_tm_{daytype}'].assign(Unoccup_prob=1.0, Occupied_prob=0.0)
+    results = make_model(backend=backend, init_data=init_data).run(env)
+    assert not results['Motion'].any()
+    assert not (results['Habitual override'] | results['Discomfort override']).any()
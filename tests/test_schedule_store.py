@@ -0,0 +1,117 @@
+""" Bit-packed schedule store and pre-sampled schedule bank """
+
+# Import packages
+import datetime
+import numpy as np
+import pytest
+import schedule_bank as om_schedule_bank
+import schedule_store as om_schedule_store
+
+START = datetime.date(2019, 1, 1)
+
+def random_days(rng, N_agents, days, steps_per_day=288):
+    """ Occupancy and routine arrays of shape (days, N_agents, steps_per_day) with a few mscs per day """
+    occupancy = rng.random((days, N_agents, steps_per_day)) < 0.6
+    routine_msc = rng.random((days, N_agents, steps_per_day)) < 0.01
+    delT_cool = np.where(routine_msc, rng.integers(-4, 5, routine_msc.shape), 0).astype(float)
+    delT_heat = np.where(routine_msc, rng.integers(-4, 5, routine_msc.shape), 0).astype(float)
+    return occupancy, routine_msc, delT_cool, delT_heat
+
+@pytest.fixture
+def recorded():
+    """ Store of 5 agents over 9 days, recorded day by day in random agent order, with the recorded arrays """
+    rng = np.random.default_rng(0)
+    arrays = random_days(rng, 5, 9)
+    store = om_schedule_store.ScheduleStore(5, datetime.datetime(2019, 1, 1, 13, 0))
+    for day in range(9):
+        for agents in np.array_split(rng.permutation(5), 2):
+            store.record_day(START + datetime.timedelta(days=day), *(values[day, agents] for values in arrays), agents=agents)
+    return store, arrays
+
+def test_record_grows_planes(recorded):
+    store, (occupancy, routine_msc, delT_cool, delT_heat) = recorded
+    assert store.start_date == START
+    assert store.days == 9 and store.capacity >= 9
+    assert store.planes['occupancy'].shape[1:] == (store.capacity, 36)
+    for day in range(9):
+        np.testing.assert_array_equal(store.schedule('occupancy', day), occupancy[day])
+    assert store.nbytes == 5*9*36 + store.event_records.nbytes
+
+    # A later day leaves the days in between empty, a horizon of days is recorded at once
+    store.record('occupancy', 12, occupancy[0])
+    assert store.days == 13
+    np.testing.assert_array_equal(store.schedule('occupancy', 8), occupancy[8])
+    assert not store.schedule('occupancy', 10).any()
+    store.record('habitual', 0, occupancy.transpose(1, 0, 2)[1:3], agents=[1, 2])
+    np.testing.assert_array_equal(store.schedule('habitual', 4, agents=[1, 2]), occupancy[4, 1:3])
+    assert not store.schedule('habitual', 4, agents=0).any()
+
+def test_at_and_occupied(recorded):
+    store, (occupancy, *_) = recorded
+    for slot in [0, 7, 8, 100, 287]:
+        np.testing.assert_array_equal(store.occupied(slot), occupancy[:, :, slot].T)
+        np.testing.assert_array_equal(store.at('occupancy', slot, day=3), occupancy[3, :, slot])
+        np.testing.assert_array_equal(store.occupied(slot, day=[2, 5], agents=1), occupancy[[2, 5], 1, slot])
+
+def test_events_and_routine_arrays(recorded):
+    store, (occupancy, routine_msc, delT_cool, delT_heat) = recorded
+    events = store.event_records
+    assert len(events) == routine_msc.sum()
+    assert (np.diff(events['day'].astype(np.int64)*5*288 + events['agent']*288 + events['slot']) > 0).all()
+    for day in range(9):
+        day_events = store.events(day)
+        assert (day_events['day'] == day).all() and len(day_events) == routine_msc[day].sum()
+        for agent in range(5):
+            agent_events = store.events(day, agent)
+            np.testing.assert_array_equal(agent_events['slot'], np.flatnonzero(routine_msc[day, agent]))
+            np.testing.assert_array_equal(agent_events['delT_cool'], delT_cool[day, agent, routine_msc[day, agent]])
+        for expected, values in zip([routine_msc[day], delT_cool[day], delT_heat[day]], store.routine_arrays(day)):
+            np.testing.assert_array_equal(values, expected)
+        for expected, values in zip([routine_msc[day, 3], delT_cool[day, 3], delT_heat[day, 3]], store.routine_arrays(day, 3)):
+            np.testing.assert_array_equal(values, expected)
+    # Events recorded after a query are merged into the index
+    store.record_routine(9, routine_msc[0], delT_cool[0], delT_heat[0])
+    assert len(store.events(9)) == routine_msc[0].sum()
+    assert len(store.events(8)) == routine_msc[8].sum()
+
+def test_save_load(recorded, tmp_path):
+    store, _ = recorded
+    store.save(tmp_path / 'store.npz')
+    loaded = om_schedule_store.ScheduleStore.load(tmp_path / 'store.npz')
+    assert (loaded.N_agents, loaded.start_date, loaded.sampling_time, loaded.days) == (5, START, 5, 9)
+    np.testing.assert_array_equal(loaded.planes['occupancy'], store.planes['occupancy'][:, :9])
+    np.testing.assert_array_equal(loaded.event_records, store.event_records)
+    for day in range(9):
+        np.testing.assert_array_equal(loaded.occupied(100, day), store.occupied(100, day))
+        for loaded_values, values in zip(loaded.routine_arrays(day), store.routine_arrays(day)):
+            np.testing.assert_array_equal(loaded_values, values)
+    # The loaded store keeps recording
+    loaded.record('occupancy', 9, np.ones((5, 288), dtype=bool))
+    assert loaded.occupied(0, 9).all()
+
+@pytest.mark.parametrize('bank', [False, True])
+def test_backends_record_identical_stores(make_model, env, bank):
+    schedule_bank = None
+    if bank:
+        model = make_model(backend='population')
+        schedule_bank = om_schedule_bank.ScheduleBank.generate(model.occupancy_engine, model.routine_data, size=16, seed=0)
+    stores = []
+    for backend in ['agents', 'population']:
+        model = make_model(backend=backend, run_seed=2, record_schedules=True, schedule_bank=schedule_bank)
+        model.run(env)
+        stores.append(model.schedule_store)
+    agents, population = stores
+    assert agents.days == population.days == 2
+    np.testing.assert_array_equal(agents.planes['occupancy'][:, :2], population.planes['occupancy'][:, :2])
+    np.testing.assert_array_equal(agents.event_records, population.event_records)
+    assert len(agents.event_records) > 0
+
+def test_bank_save_load(make_model, tmp_path):
+    model = make_model(backend='population')
+    bank = om_schedule_bank.ScheduleBank.generate(model.occupancy_engine, model.routine_data, size=16, seed=0)
+    bank.save(tmp_path / 'bank.npz')
+    loaded = om_schedule_bank.ScheduleBank.load(tmp_path / 'bank.npz', refresh_days=2)
+    assert (loaded.labels, loaded.size, loaded.seed, loaded.refresh_days) == (bank.labels, 16, bank.seed, 2)
+    for label in bank.labels:
+        for name, values in bank.schedules[label].items():
+            np.testing.assert_array_equal(loaded.schedules[label][name], values, err_msg=f"{label} {name}")
@@ -0,0 +1,70 @@
+""" Integer simulation clock and calendar of the simulated days """
+
+# Import packages
+import datetime
+import pytest
+import sim_clock as om_sim_clock
+import tools as om_tools
+
+@pytest.fixture
+def seasons(monkeypatch):
+    """ Seasons by month (tools.get_season is 'cool' all year), with the calls of get_season """
+    calls = []
+    def get_season(current_datetime):
+        calls.append(current_datetime)
+        return 'heat' if current_datetime.month in [1, 2, 12] else 'cool'
+    monkeypatch.setattr(om_tools, 'get_season', get_season)
+    return calls
+
+def test_start_within_day():
+    clock = om_sim_clock.SimClock(datetime.datetime(2019, 1, 1, 13, 37), 5)
+    assert clock.steps_per_day == 288 and clock.step_seconds == 300
+    assert (clock.tick, clock.day, clock.timestep_day) == (163, 0, 163)
+    assert clock.datetime == datetime.datetime(2019, 1, 1, 13, 35)
+    assert clock.index(datetime.datetime(2019, 1, 2, 0, 10)) == 288 + 2
+
+def test_advance_matches_set(seasons):
+    start = datetime.datetime(2019, 2, 28, 23, 0) # Thursday, the horizon crosses March 1st and the weekend
+    clock = om_sim_clock.SimClock(start, 10)
+    for step in range(3*144):
+        current_datetime = start + datetime.timedelta(minutes=10*step)
+        expected = om_sim_clock.SimClock(start, 10)
+        expected.set(current_datetime)
+        assert clock.datetime == current_datetime
+        assert (clock.tick, clock.day, clock.timestep_day) == (expected.tick, expected.day, expected.timestep_day)
+        assert clock.timestep_day == (current_datetime.hour*60 + current_datetime.minute)//10
+        label = om_tools.get_season(current_datetime) + ('_we' if om_tools.is_weekend(current_datetime) else '_wd')
+        assert (clock.season, clock.weekend, clock.label) == (label[:4], label.endswith('_we'), label)
+        clock.advance()
+
+def test_move_back_and_forth(seasons):
+    clock = om_sim_clock.SimClock(datetime.datetime(2019, 2, 28), 5)
+    clock.move(288 + 5) # Friday March 1st
+    assert (clock.day, clock.timestep_day, clock.label) == (1, 5, 'cool_wd')
+    clock.move(2*288) # Saturday
+    assert clock.label == 'cool_we'
+    clock.move(-1) # Last timestep of Wednesday February 27th
+    assert (clock.day, clock.timestep_day, clock.label) == (-1, 287, 'heat_wd')
+    assert clock.datetime == datetime.datetime(2019, 2, 27, 23, 55)
+
+def test_extend_computes_horizon_once(seasons):
+    clock = om_sim_clock.SimClock(datetime.datetime(2019, 2, 27, 12, 0), 5)
+    seasons.clear()
+    # From noon of day 0, 3 days of timesteps end within day 3
+    clock.extend(3*288)
+    assert sorted(clock.calendar.days) == [0, 1, 2, 3]
+    assert [current_datetime.date() for current_datetime in seasons] == [datetime.date(2019, 2, 28), datetime.date(2019, 3, 1),
+                                                                        datetime.date(2019, 3, 2)]
+    assert all(current_datetime.time() == datetime.time() for current_datetime in seasons)
+    assert [clock.calendar[day][2] for day in range(4)] == ['heat_wd', 'heat_wd', 'cool_wd', 'cool_we']
+    # Stepping through the horizon only looks the days up
+    seasons.clear()
+    for _ in range(3*288):
+        clock.advance()
+    assert seasons == []
+    assert clock.day == 3
+
+def test_calendar_date():
+    calendar = om_sim_clock.Calendar(datetime.date(2019, 12, 31))
+    assert calendar.date(1) == datetime.date(2020, 1, 1)
+    assert calendar[1] == (om_tools.get_season(datetime.datetime(2020, 1, 1)), False, 'cool_wd')
@@ -0,0 +1,42 @@
+""" A grid point of a parameter sweep reproduces the separate simulation of its parameters """
+
+# Import packages
+import numpy as np
+import pytest
+import ensemble as om_ensemble
+import model as om_model
+import sweep as om_sweep
+from synthetic import START
+
+@pytest.fixture
+def model_config(init_data):
+    return dict(units='F', N_homes=2, N_occupants_in_home=2, sampling_frequency=5,
+                models={'model_classification':None, 'model_regressor':None}, init_data=init_data, comfort_temperature=70,
+                discomfort_theory_name='tft', threshold={'UL':3, 'LL':-3}, TFT_alpha=1, TFT_beta=1, start_datetime=START, tstat_db=0)
+
+def test_grid_points_match_separate_runs(model_config, env):
+    grid = om_sweep.parameter_grid(comfort_temperature=[66, 72], threshold=[{'UL':2, 'LL':-2}, {'UL':4, 'LL':-4}],
+                                   discomfort_theory_name=['czt', 'tft'])
+    results = om_sweep.run_sweep(model_config, grid, env, replications=2, seed=7)
+    assert results['Motion'].shape == (2, len(env), len(grid), 4)
+    for point, parameters in enumerate(grid):
+        expected = om_ensemble.run_ensemble(om_ensemble.Scenario(dict(model_config, backend='population', **parameters), env), 2, seed=7)
+        for var in om_model.OUTPUT_VARIABLES:
+            np.testing.assert_array_equal(results[var][:, :, point], expected[var], err_msg=f"{var} of {parameters}")
+    # The grid points share the schedules and differ in their discomfort overrides
+    assert (results['Motion'] == results['Motion'][:, :, :1]).all()
+    assert len({int(overrides) for overrides in results['Discomfort override'].sum(axis=(0, 1, 3))}) > 1
+
+def test_grid_point_matches_agents(model_config, env):
+    # With per-occupant streams, a grid point also matches the agents backend
+    grid = om_sweep.parameter_grid(TFT_alpha=[1, 0.5], tstat_db=[0, 1])
+    model_config = dict(model_config, run_seed=3)
+    results = om_sweep.run_sweep(model_config, grid, env, replications=1, seed=1, workers=2)
+    for point, parameters in enumerate(grid):
+        expected = om_model.OccupantModel(**dict(model_config, backend='agents', **parameters)).run(env)
+        for var in om_model.OUTPUT_VARIABLES:
+            np.testing.assert_array_equal(results[var][0, :, point], expected[var], err_msg=f"{var} of {parameters}")
+
+def test_unknown_parameter():
+    with pytest.raises(ValueError, match='N_homes'):
+        om_sweep.parameter_grid(N_homes=[1, 2])
@@ -0,0 +1,48 @@
+""" Thermal plant and closed loop simulation of the occupants with their homes """
+
+# Import packages
+import numpy as np
+import pandas as pd
+import pytest
+import thermal_plant as om_thermal_plant
+
+def test_plant_without_equipment_decays_to_outdoor_temperature():
+    plant = om_thermal_plant.RCPlant(2, R=2.0, C=1.0, T_in=[60, 80])
+    plant.thermostat.step = lambda T_in, T_stp_cool, T_stp_heat: (np.zeros(2, dtype=bool), np.zeros(2, dtype=bool))
+    for _ in range(12):
+        T_in, heat_on, cool_on = plant.step(70, 100, 0)
+    # Exact solution of the 1R1C model after one hour
+    np.testing.assert_allclose(T_in, 70 + (np.array([60, 80]) - 70)*np.exp(-1/(2.0*1.0)))
+
+def test_thermostat_deadband():
+    thermostat = om_thermal_plant.Thermostat(1, tstat_db=1)
+    # Cooling turns on above T_stp_cool + tstat_db and stays on until T_in reaches T_stp_cool
+    states = [thermostat.step(np.array([T_in]), 74, 68) for T_in in [74.5, 75.5, 74.5, 74.0, 74.5]]
+    assert [bool(cool_on[0]) for heat_on, cool_on in states] == [False, True, True, False, False]
+    assert not any(heat_on[0] for heat_on, cool_on in states)
+    # Heating turns on below T_stp_heat - tstat_db and stays on until T_in reaches T_stp_heat
+    states = [thermostat.step(np.array([T_in]), 74, 68) for T_in in [67.5, 66.5, 67.5, 68.0]]
+    assert [bool(heat_on[0]) for heat_on, cool_on in states] == [False, True, True, False]
+
+@pytest.mark.parametrize('units, comfort_temperature, T_out, T_stp_cool, T_stp_heat',
+                         [('F', 72, 90, 76, 68), ('C', 22, 32, 24, 20)])
+def test_hot_weather_closed_loop(make_model, init_data, units, comfort_temperature, T_out, T_stp_cool, T_stp_heat):
+    # Discomfort overrides only: the occupants feel hot and lower the setpoints, the homes are cooled
+    init_data = dict(init_data)
+    for label in ['cool_wd', 'cool_we', 'heat_wd', 'heat_we']:
+        init_data[f'{label}_Nmscpd'] = pd.DataFrame({'N':[0, 1, 2, 3], 'prob':[1, 0, 0, 0]})
+    model = make_model(backend='population', units=units, init_data=init_data, comfort_temperature=comfort_temperature,
+                       run_seed=1)
+    periods = 3*288
+    weather = {'T_out':np.full(periods, T_out, dtype=float), 'T_stp_cool':np.full(periods, T_stp_cool, dtype=float),
+               'T_stp_heat':np.full(periods, T_stp_heat, dtype=float)}
+    results = model.run_closed_loop(weather, om_thermal_plant.RCPlant(2, C=1.0, T_in=80, tstat_db=1))
+
+    assert results['Discomfort override'].any()
+    assert not results['equip_run_heat'].any()
+    assert results['equip_run_cool'].any()
+    # After the pull down from 80 degree F, the overrides hold the homes below the scheduled cooling setpoint,
+    # around the comfort temperature of the occupants
+    T_in = results['T_in'][36:]
+    assert T_in.max() <= T_stp_cool
+    assert abs(T_in.mean() - comfort_temperature) < 2
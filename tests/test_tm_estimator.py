@@ -0,0 +1,89 @@
+""" Habitual transition matrix estimation: counts match the baseline loop, counters are parallel and incremental """
+
+# Import packages
+import pathlib
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+import tm_estimator as om_tm_estimator
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1] / 'data_analysis'))
+import tools_ipynb
+
+def reference_extract_TM_DyD(TM, weekday_df, df_read):
+    """ Baseline data_analysis/tools_ipynb.extract_TM_DyD (a row lookup per timestep and transition), without its prints """
+    hours_list = list(range(0,24))*12
+    hours_list.sort()
+    minutes_list = list(range(0,56,5))*24
+    for timestep in range(1,289):
+        if timestep == 1:
+            cur_min, cur_hour, next_min, next_hour = minutes_list[-1], hours_list[-1], minutes_list[0], hours_list[0]
+        else:
+            cur_min, cur_hour = next_min, next_hour
+            next_min, next_hour = minutes_list[timestep-1], hours_list[timestep-1]
+        rows = weekday_df.loc[(weekday_df.DateTime.dt.minute == cur_min) & (weekday_df.DateTime.dt.hour==cur_hour),'mdsp']
+        for state in [0, 1]:
+            for idx in [index for index, value in rows.items() if value == bool(state)]:
+                column = 'p_2_1' if df_read.loc[idx+1].mdsp == True else 'p_2_0'
+                TM.loc[(TM['time']== timestep) & (TM['cur_state'] == state), column] += 1
+        for state in [0, 1]:
+            cell = (TM['time']== timestep) & (TM['cur_state'] == state)
+            total = TM.loc[cell,'p_2_1'].values + TM.loc[cell,'p_2_0'].values
+            if total == 0:
+                TM.loc[cell,'p_2_0'] = 1
+            else:
+                TM.loc[cell,'p_2_1'] = TM.loc[cell,'p_2_1'].values/total
+                TM.loc[cell,'p_2_0'] = TM.loc[cell,'p_2_0'].values/total
+    return TM
+
+def empty_TM():
+    return pd.DataFrame({'time':np.repeat(np.arange(1, 289), 2), 'cur_state':np.tile([0, 1], 288), 'p_2_0':0.0, 'p_2_1':0.0})
+
+def home_data(seed, days=10):
+    """ 5-minute data of a home with manual setpoint changes (mdsp), starting on a Monday """
+    rng = np.random.default_rng(seed)
+    datetimes = pd.date_range('2019-01-07', periods=days*288, freq='5min')
+    return pd.DataFrame({'DateTime':datetimes, 'mdsp':rng.random(datetimes.size) < 0.2})
+
+def test_extract_TM_DyD_matches_baseline():
+    df_read = home_data(0)
+    weekday_df = df_read[df_read['DateTime'].dt.weekday < 5].iloc[:-1] # The last row has no following row
+    expected = reference_extract_TM_DyD(empty_TM(), weekday_df, df_read)
+    TM = tools_ipynb.extract_TM_DyD(empty_TM(), weekday_df, df_read)
+    np.testing.assert_allclose(TM[['p_2_0', 'p_2_1']].values, expected[['p_2_0', 'p_2_1']].values, rtol=1e-12)
+
+def test_to_frame_matches_transition_counts():
+    df = home_data(1)
+    counter = om_tm_estimator.TransitionCounter().update([df], daytype='wd')
+    TM = counter.to_frame()
+    assert list(TM.columns) == ['time', 'cur_state', 'p_2_0', 'p_2_1']
+    np.testing.assert_allclose(TM['p_2_0'] + TM['p_2_1'], 1)
+    # Counted transitions, each from a weekday row to the following row
+    assert counter.counts.sum() == (df['DateTime'].dt.weekday < 5).iloc[:-1].sum()
+
+@pytest.mark.parametrize('order', [1, 2])
+def test_parallel_and_incremental_counts(tmp_path, order):
+    homes = [home_data(seed, days=3) for seed in range(4)]
+    serial = om_tm_estimator.TransitionCounter(order=order).update(homes)
+    parallel = om_tm_estimator.TransitionCounter(order=order).update(homes, workers=2)
+    np.testing.assert_array_equal(parallel.counts, serial.counts)
+
+    # Counts of the first homes saved, loaded and merged with the counts of the others
+    first = om_tm_estimator.TransitionCounter(order=order).update(homes[:2])
+    first.save(tmp_path / 'counts.npz')
+    loaded = om_tm_estimator.TransitionCounter.load(tmp_path / 'counts.npz')
+    assert loaded.order == order
+    loaded.merge(om_tm_estimator.TransitionCounter(order=order).update(homes[2:]))
+    np.testing.assert_array_equal(loaded.counts, serial.counts)
+    pd.testing.assert_frame_equal(loaded.to_frame(), om_tm_estimator.estimate_TM(homes, order=order, workers=1))
+
+def test_gaps_are_skipped():
+    df = home_data(2, days=1).drop(index=100)
+    counts = om_tm_estimator.home_counts(df)
+    assert counts.sum() == len(df) - 2
+    assert counts.sum() == om_tm_estimator.home_counts(df, check_gaps=False).sum() - 1
+
+def test_merge_other_order():
+    with pytest.raises(ValueError, match='orders'):
+        om_tm_estimator.TransitionCounter(order=1).merge(om_tm_estimator.TransitionCounter(order=2))